@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+from django.core.exceptions import PermissionDenied
 from django.urls import path, reverse  # ← Agregar reverse
 from django.http import JsonResponse, HttpResponse, HttpResponseRedirect  # ← Agregar HttpResponseRedirect
 from django.db import models
@@ -7,6 +8,7 @@ from django.utils.html import format_html
 from django.db.models import Sum
 from .models import Almacen, MovimientoAlmacen, DetalleMovimientoAlmacen
 from productos.models import Producto
+from productos.widgets import BuscadorProductoSelect
 from .utils import generar_reporte_movimiento_pdf
 
 
@@ -27,12 +29,20 @@ class AlmacenAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsultas Exists (sin consultas por fila)
+        return super().get_queryset(request).annotate(
+            en_uso=models.ExpressionWrapper(
+                models.Q(models.Exists(MovimientoAlmacen.objects.filter(almacen_origen=models.OuterRef('pk')))) |
+                models.Q(models.Exists(MovimientoAlmacen.objects.filter(almacen_destino=models.OuterRef('pk')))),
+                output_field=models.BooleanField()
+            )
+        )
+
     def get_uso_estado(self, obj):
         """Muestra si el almacén está siendo usado en movimientos"""
         if obj.pk:
-            en_uso = MovimientoAlmacen.objects.filter(
-                models.Q(almacen_origen=obj) | models.Q(almacen_destino=obj)
-            ).exists()
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -44,6 +54,7 @@ class AlmacenAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = _('Estado')
+    get_uso_estado.admin_order_field = 'en_uso'
     
     def get_readonly_fields(self, request, obj=None):
         """Bloquea campos si el almacén está siendo usado en movimientos"""
@@ -183,6 +194,16 @@ class DetalleMovimientoInline(admin.TabularInline):
     verbose_name = _("Producto")
     verbose_name_plural = _("Productos del movimiento")
     
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: la columna Unidad usa producto.unidad_medida
+        return super().get_queryset(request).select_related('producto__unidad_medida')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'producto':
+            # 🚀 OPTIMIZACIÓN: autocompletado servido por el índice de productos en memoria
+            kwargs['widget'] = BuscadorProductoSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
         if db_field.name == 'observaciones_producto':
@@ -318,6 +339,7 @@ class MovimientoAlmacenAdmin(admin.ModelAdmin):
         'get_total_cantidad_danada',
         'ver_reporte_link'
     )
+    actions = ['imprimir_pdfs_seleccionados']
     list_filter = (
         'tipo',
         'fecha',
@@ -438,19 +460,29 @@ class MovimientoAlmacenAdmin(admin.ModelAdmin):
                  self.admin_site.admin_view(self.get_stock_view),
                  name='almacenes_get_stock'),
             path('<int:movimiento_id>/reporte-pdf/',
-                 self.admin_site.admin_view(self.reporte_pdf_view),
+                 self.admin_site.admin_view(self.reporte_pdf_view, cacheable=True),
                  name='almacenes_movimiento_reporte_pdf'),
+            path('imprimir-lote/',
+                 self.admin_site.admin_view(self.imprimir_lote_view),
+                 name='almacenes_movimiento_imprimir_lote'),
+            path('importar-excel/',
+                 self.admin_site.admin_view(self.importar_excel_view),
+                 name='almacenes_movimiento_importar_excel'),
         ]
         return custom_urls + urls
     
     def reporte_pdf_view(self, request, movimiento_id):
-        """Vista para generar el reporte PDF del movimiento"""
+        """
+        Vista para generar el reporte PDF del movimiento.
+        🚀 OPTIMIZACIÓN: El PDF se guarda en la cache en disco con clave por versión
+        del movimiento y se sirve con ETag; solo se regenera tras una edición.
+        """
+        from django.db.models import prefetch_related_objects
         from django.shortcuts import get_object_or_404
+        from reportes.cache_exportaciones import clave_pdf_movimiento, respuesta_cacheada
         
         movimiento = get_object_or_404(
-            MovimientoAlmacen.objects.prefetch_related(
-                'detalles__producto__unidad_medida'
-            ).select_related(
+            MovimientoAlmacen.objects.select_related(
                 'almacen_origen',
                 'almacen_destino',
                 'proveedor',
@@ -459,16 +491,42 @@ class MovimientoAlmacenAdmin(admin.ModelAdmin):
             pk=movimiento_id
         )
         
-        # Generar el PDF
-        pdf_buffer = generar_reporte_movimiento_pdf(movimiento)
+        def generar():
+            prefetch_related_objects([movimiento], 'detalles__producto__unidad_medida')
+            pdf_buffer = generar_reporte_movimiento_pdf(movimiento)
+            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
+            filename = f'movimiento_{movimiento.numero_movimiento}.pdf'
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+            return response
         
-        # Preparar la respuesta HTTP
-        response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-        filename = f'movimiento_{movimiento.numero_movimiento}.pdf'
-        response['Content-Disposition'] = f'inline; filename="{filename}"'
+        return respuesta_cacheada(request, clave_pdf_movimiento(movimiento), generar)
+    
+    @admin.action(description=_("Imprimir PDFs seleccionados (ZIP)"))
+    def imprimir_pdfs_seleccionados(self, request, queryset):
+        """Un ZIP con el PDF de cada movimiento seleccionado; los lotes grandes se encolan"""
+        from django.contrib import messages
+        from reportes.pdf_lote import respuesta_accion
         
-        return response
+        try:
+            return respuesta_accion(request, 'almacen', queryset)
+        except ValueError as e:
+            messages.error(request, f"❌ {e}")
     
+    def imprimir_lote_view(self, request):
+        """PDFs por lote según filtros GET (fecha_inicio, fecha_fin, almacen, cliente, tipo, formato)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        from reportes.views import imprimir_movimientos_lote
+        return imprimir_movimientos_lote(request, 'almacen')
+
+    def importar_excel_view(self, request):
+        """Lista de entrega en Excel: un movimiento con todas sus líneas de detalle"""
+        # Crea movimientos que cambian el stock: mismo permiso que el formulario de alta
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        from reportes.views import importar_movimientos_excel
+        return importar_movimientos_excel(request, 'almacen')
+
     def get_next_number_view(self, request):
         tipo = request.GET.get('tipo', '')
         almacen_id = request.GET.get('almacen_id', '')
@@ -520,6 +578,13 @@ class MovimientoAlmacenAdmin(admin.ModelAdmin):
         return JsonResponse({'numero_movimiento': numero_movimiento})
     
     def get_producto_info_view(self, request, producto_id):
+        # 🚀 OPTIMIZACIÓN: los productos activos se leen del mapa en memoria (sin consulta)
+        from productos.indices import mapa_codigos
+        
+        producto = mapa_codigos().por_id.get(producto_id)
+        if producto:
+            return JsonResponse({'unidad': producto['unidad'], 'nombre': producto['nombre']})
+        
         try:
             producto = Producto.objects.select_related('unidad_medida').get(id=producto_id)
             return JsonResponse({
@@ -657,29 +722,27 @@ class MovimientoAlmacenAdmin(admin.ModelAdmin):
                 'traceback': traceback.format_exc()
             }, status=500)
     
+    # 🚀 OPTIMIZACIÓN: Totales guardados en la cabecera, sin consultas por fila
     def get_total_productos(self, obj):
-        return obj.get_total_productos()
+        return obj.total_productos
     get_total_productos.short_description = _('Total Productos')
+    get_total_productos.admin_order_field = 'total_productos'
     
     def get_total_cantidad_buena(self, obj):
-        total = obj.get_total_cantidad_buena()
-        return f"{total:,.2f}"
+        return f"{obj.total_cantidad_buena:,.2f}"
     get_total_cantidad_buena.short_description = _('Cant. Buena')
+    get_total_cantidad_buena.admin_order_field = 'total_cantidad_buena'
     
     def get_total_cantidad_danada(self, obj):
-        total = obj.get_total_cantidad_danada()
-        if total > 0:
-            return f"{total:,.2f}"
+        if obj.total_cantidad_danada > 0:
+            return f"{obj.total_cantidad_danada:,.2f}"
         return "-"
     get_total_cantidad_danada.short_description = _('Cant. Dañada')
+    get_total_cantidad_danada.admin_order_field = 'total_cantidad_danada'
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related(
-            'detalles',
-            'detalles__producto',
-            'detalles__producto__unidad_medida'
-        ).select_related(
+        return qs.select_related(
             'almacen_origen',
             'almacen_destino',
             'proveedor',
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('almacenes', '0009_movimientoalmacen_mov_alm_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientoalmacen',
+            index=models.Index(fields=['numero_movimiento'], name='mov_alm_num_prefijo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('almacenes', '0010_movimientoalmacen_mov_alm_num_prefijo_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoalmacen',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización'),
+        ),
+    ]
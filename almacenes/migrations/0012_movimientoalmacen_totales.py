@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_totales(apps, schema_editor):
+    """Llena los totales de las cabeceras existentes con un solo UPDATE"""
+    Movimiento = apps.get_model('almacenes', 'MovimientoAlmacen')
+    Detalle = apps.get_model('almacenes', 'DetalleMovimientoAlmacen')
+
+    por_movimiento = Detalle.objects.filter(movimiento=OuterRef('pk')).order_by().values('movimiento')
+
+    def subconsulta(agregado, output_field):
+        return Coalesce(
+            Subquery(por_movimiento.annotate(valor=agregado).values('valor')[:1], output_field=output_field),
+            Value(Decimal('0') if isinstance(output_field, DecimalField) else 0),
+            output_field=output_field
+        )
+
+    decimal = DecimalField(max_digits=14, decimal_places=2)
+    Movimiento.objects.update(
+        total_productos=subconsulta(Count('id'), models.PositiveIntegerField()),
+        total_cantidad_buena=subconsulta(Sum('cantidad'), decimal),
+        total_cantidad_danada=subconsulta(Sum('cantidad_danada'), decimal),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('almacenes', '0011_movimientoalmacen_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoalmacen',
+            name='total_productos',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total Productos'),
+        ),
+        migrations.AddField(
+            model_name='movimientoalmacen',
+            name='total_cantidad_buena',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Total Cantidad Buena'),
+        ),
+        migrations.AddField(
+            model_name='movimientoalmacen',
+            name='total_cantidad_danada',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14, verbose_name='Total Cantidad Dañada'),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
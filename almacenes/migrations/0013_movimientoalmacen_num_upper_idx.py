@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('almacenes', '0012_movimientoalmacen_totales'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='movimientoalmacen',
+            name='mov_alm_num_prefijo_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movimientoalmacen',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('numero_movimiento'), name='text_pattern_ops'), name='mov_alm_num_upper_idx'),
+        ),
+    ]
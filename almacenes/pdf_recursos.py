@@ -0,0 +1,343 @@
+"""
+Recursos compartidos de los reportes PDF de movimientos (almacén y cliente).
+
+Se preparan una sola vez por proceso y se reutilizan en cada documento:
+- Ruta del logo y su ImageReader (el PNG se decodifica una vez).
+- Hojas de estilo (ParagraphStyle) de los reportes.
+- NumberedCanvas: el logo se registra una vez por documento como form XObject
+  y cada página (encabezado y marca de agua) lo dibuja por referencia. El
+  total de páginas ("de N") también es un form XObject que se define al
+  guardar, así cada página se cierra al terminarla y la memoria no crece con
+  el número de páginas.
+- tablas_productos: la tabla de detalle en bloques de filas, para que el
+  armado de ReportLab no sea cuadrático en la cantidad de filas.
+"""
+import functools
+import os
+
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+NOMBRE_LOGO = 'logo_casoval.png'
+
+FORMA_LOGO_ENCABEZADO = 'LogoEncabezado'
+FORMA_LOGO_MARCA_AGUA = 'LogoMarcaAgua'
+FORMA_TOTAL_PAGINAS = 'TotalPaginas'
+
+# Filas por Table en la tabla de detalle (ver tablas_productos)
+FILAS_POR_TABLA = 50
+
+COLUMNAS_PRODUCTOS = [0.3*inch, 0.8*inch, 1.9*inch, 0.7*inch, 0.9*inch, 0.9*inch, 0.8*inch, 0.7*inch]
+
+
+@functools.lru_cache(maxsize=None)
+def get_logo_path():
+    """
+    Ruta del logo, resuelta una sola vez por proceso
+    """
+    candidatos = []
+
+    # Opción 1: Usar STATIC_ROOT (para producción con collectstatic)
+    if getattr(settings, 'STATIC_ROOT', None):
+        candidatos.append(os.path.join(settings.STATIC_ROOT, NOMBRE_LOGO))
+
+    # Opción 2: Usar STATICFILES_DIRS (para desarrollo)
+    for static_dir in getattr(settings, 'STATICFILES_DIRS', ()):
+        candidatos.append(os.path.join(static_dir, NOMBRE_LOGO))
+
+    # Opción 3: Usar BASE_DIR (ruta relativa al proyecto)
+    if hasattr(settings, 'BASE_DIR'):
+        candidatos.append(os.path.join(settings.BASE_DIR, 'static', NOMBRE_LOGO))
+
+    # Opción 4 y 5: Carpeta static de la app o un nivel arriba
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    candidatos.append(os.path.join(current_dir, 'static', NOMBRE_LOGO))
+    candidatos.append(os.path.join(os.path.dirname(current_dir), 'static', NOMBRE_LOGO))
+
+    for logo_path in candidatos:
+        if os.path.exists(logo_path):
+            return logo_path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_logo():
+    """ImageReader del logo (decodificado una sola vez por proceso) o None"""
+    logo_path = get_logo_path()
+    if not logo_path:
+        return None
+    try:
+        logo = ImageReader(logo_path)
+        # Fuerza la decodificación ahora: los documentos siguientes usan los datos en memoria
+        logo.getRGBData()
+        return logo
+    except Exception as e:
+        print(f"Error al cargar el logo: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_estilos(color_titulo='#1a365d'):
+    """
+    Estilos de párrafo de los reportes, construidos una sola vez por proceso
+    y color de título. Los flowables solo leen el estilo, así que se comparten.
+    """
+    estilos = getSampleStyleSheet()
+
+    return {
+        # Estilo personalizado para el título principal
+        'titulo': ParagraphStyle(
+            'CustomTitle',
+            parent=estilos['Heading1'],
+            fontSize=14,
+            textColor=colors.HexColor(color_titulo),
+            spaceAfter=6,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        ),
+        # Estilo para información destacada (almacén, número, fecha)
+        'destacado': ParagraphStyle(
+            'Destacado',
+            parent=estilos['Heading1'],
+            fontSize=11,
+            textColor=colors.HexColor('#c53030'),
+            spaceAfter=1,
+            spaceBefore=0,
+            leading=16,
+            alignment=TA_LEFT,
+            fontName='Helvetica-Bold'
+        ),
+        # Estilo para subtítulos
+        'subtitulo': ParagraphStyle(
+            'CustomSubtitle',
+            parent=estilos['Heading2'],
+            fontSize=11,
+            textColor=colors.HexColor('#2d3748'),
+            spaceAfter=8,
+            spaceBefore=12,
+            fontName='Helvetica-Bold'
+        ),
+        # Estilo para texto normal
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=estilos['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#2d3748'),
+            alignment=TA_LEFT
+        ),
+    }
+
+
+class NumberedCanvas(canvas.Canvas):
+    """
+    Canvas personalizado para agregar número de página, encabezado y marca de agua.
+    🚀 OPTIMIZACIÓN: Cada página se completa y se cierra en showPage (no se guarda
+    una copia del estado por página). "de N" se dibuja como referencia a un form
+    XObject que recién se define en save(), cuando se conoce el total.
+    """
+    def __init__(self, *args, pie=None, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self._tiene_logo = get_logo() is not None
+        if pie is None:
+            pie = f"Reporte generado el {timezone.now().strftime('%d/%m/%Y %H:%M:%S')}"
+        self.pie = pie
+
+    def showPage(self):
+        self.draw_watermark()
+        self.draw_header()
+        self.draw_page_number()
+        canvas.Canvas.showPage(self)
+
+    def save(self):
+        # Página actual vacía (después del último showPage): se usa para definir las formas
+        self.definir_formas_logo()
+        self.definir_forma_total(self._pageNumber - 1)
+        canvas.Canvas.save(self)
+
+    def definir_formas_logo(self):
+        """Registra el logo (encabezado y marca de agua) como form XObjects del documento"""
+        if not self._tiene_logo:
+            return
+
+        logo = get_logo()
+
+        # Marca de agua centrada en la página
+        watermark_size = 4 * inch
+        self.beginForm(FORMA_LOGO_MARCA_AGUA)
+        self.drawImage(
+            logo,
+            (letter[0] - watermark_size) / 2,
+            (letter[1] - watermark_size) / 2,
+            width=watermark_size, height=watermark_size,
+            mask='auto', preserveAspectRatio=True
+        )
+        self.endForm()
+
+        # Logo del encabezado (esquina superior derecha)
+        self.beginForm(FORMA_LOGO_ENCABEZADO)
+        self.drawImage(
+            logo,
+            letter[0] - 2.2 * inch,
+            letter[1] - 1.45 * inch,
+            width=1.5 * inch, height=1.5 * inch,
+            mask='auto', preserveAspectRatio=True
+        )
+        self.endForm()
+
+    def definir_forma_total(self, page_count):
+        """Form XObject con el total de páginas, alineado a la derecha del pie"""
+        self.beginForm(FORMA_TOTAL_PAGINAS)
+        self.setFont("Helvetica", 8)
+        self.setFillColor(colors.HexColor('#718096'))
+        self.drawRightString(letter[0] - 0.75 * inch, 0.5 * inch, str(page_count))
+        self.endForm()
+
+    def draw_watermark(self):
+        """Dibuja la marca de agua en el centro de la página"""
+        if not self._tiene_logo:
+            return
+
+        self.saveState()
+        self.setFillAlpha(0.1)
+        self.doForm(FORMA_LOGO_MARCA_AGUA)
+        self.restoreState()
+
+    def draw_header(self):
+        """Dibuja el encabezado en cada página"""
+        self.saveState()
+
+        if self._tiene_logo:
+            self.doForm(FORMA_LOGO_ENCABEZADO)
+
+        # Texto del encabezado
+        self.setFont("Helvetica-Bold", 8)
+        self.setFillColor(colors.HexColor('#718096'))
+        self.drawString(1.7 * inch, letter[1] - 0.60 * inch,
+                        "INGENIERÍA & CONSTRUCCIÓN CASOVAL S.R.L.")
+
+        # Línea separadora
+        self.setStrokeColor(colors.HexColor('#718096'))
+        self.setLineWidth(1.0)
+        self.line(0.75 * inch, letter[1] - 0.70 * inch,
+                  letter[0] - 2.2 * inch, letter[1] - 0.70 * inch)
+
+        self.restoreState()
+
+    def draw_page_number(self):
+        """Dibuja el número de página; el total llega por la forma FORMA_TOTAL_PAGINAS"""
+        self.saveState()
+        self.setFont("Helvetica", 8)
+        self.setFillColor(colors.HexColor('#718096'))
+        # Espacio reservado para el total (hasta 4 dígitos), que la forma alinea a la derecha
+        reservado = stringWidth('0000', "Helvetica", 8)
+        self.drawRightString(
+            letter[0] - 0.75 * inch - reservado,
+            0.5 * inch,
+            f"Página {self._pageNumber} de "
+        )
+        self.doForm(FORMA_TOTAL_PAGINAS)
+
+        # Pie (izquierda, más abajo)
+        if self.pie:
+            self.setFont("Helvetica-Oblique", 7)
+            self.drawString(0.75 * inch, 0.35 * inch, self.pie)
+        self.restoreState()
+
+
+def canvas_movimiento(movimiento):
+    """
+    canvasmaker de la guía de un movimiento. El pie muestra la última
+    modificación del movimiento y no la hora de generación: el PDF se sirve
+    desde la cache en disco mientras el movimiento no cambie.
+    """
+    pie = ''
+    if movimiento.fecha_actualizacion:
+        fecha = timezone.localtime(movimiento.fecha_actualizacion).strftime('%d/%m/%Y %H:%M:%S')
+        pie = f"Movimiento actualizado el {fecha}"
+    return functools.partial(NumberedCanvas, pie=pie)
+
+
+def tablas_productos(datos_productos, color_principal, filas_por_tabla=FILAS_POR_TABLA):
+    """
+    Tabla de detalle de productos como varias Table contiguas de `filas_por_tabla`
+    filas. datos_productos = [encabezado, *filas, totales]. El encabezado va en la
+    primera Table y la fila de totales en la última; el resultado se ve igual que
+    una sola tabla, pero ReportLab parte bloques chicos en lugar de toda la tabla
+    en cada salto de página.
+    """
+    encabezado, filas, totales = datos_productos[0], datos_productos[1:-1], datos_productos[-1]
+    inicios = range(0, len(filas), filas_por_tabla) or [0]
+    tablas = []
+
+    for numero_bloque, inicio in enumerate(inicios):
+        primera = numero_bloque == 0
+        ultima = numero_bloque == len(inicios) - 1
+        datos = ([encabezado] if primera else []) + filas[inicio:inicio + filas_por_tabla] + ([totales] if ultima else [])
+        desplazamiento = 1 if primera else 0  # índice de la primera fila de datos en esta Table
+
+        estilos_tabla = [
+            # Contenido
+            ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2d3748')),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (2, -1), 'LEFT'),
+            ('ALIGN', (3, 0), (3, -1), 'CENTER'),
+            ('ALIGN', (4, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+            # Bordes
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e0')),
+            ('LINEBEFORE', (0, 0), (0, -1), 1.5, colors.HexColor(color_principal)),
+            ('LINEAFTER', (-1, 0), (-1, -1), 1.5, colors.HexColor(color_principal)),
+
+            # Padding
+            ('TOPPADDING', (0, 0), (-1, -1), 5),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ]
+
+        if primera:
+            estilos_tabla += [
+                # Encabezado
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(color_principal)),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+                ('TOPPADDING', (0, 0), (-1, 0), 8),
+                ('LINEABOVE', (0, 0), (-1, 0), 1.5, colors.HexColor(color_principal)),
+            ]
+
+        if ultima:
+            estilos_tabla += [
+                # Fila de totales
+                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e2e8f0')),
+                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+                ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor(color_principal)),
+                ('LINEBELOW', (0, -1), (-1, -1), 1.5, colors.HexColor(color_principal)),
+            ]
+
+        # Alternar colores de filas (según la posición en la tabla completa)
+        for i in range(len(filas[inicio:inicio + filas_por_tabla])):
+            if (inicio + i + 1) % 2 == 0:
+                fila = desplazamiento + i
+                estilos_tabla.append(('BACKGROUND', (0, fila), (-1, fila), colors.HexColor('#f7fafc')))
+
+        tabla = Table(datos, colWidths=COLUMNAS_PRODUCTOS)
+        tabla.setStyle(TableStyle(estilos_tabla))
+        tablas.append(tabla)
+
+    return tablas
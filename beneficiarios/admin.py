@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+from django.core.exceptions import PermissionDenied
 from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
 from django.urls import path, reverse
 from django.db import models
@@ -9,6 +10,7 @@ from django import forms
 from decimal import Decimal
 from .models import Cliente, MovimientoCliente, DetalleMovimientoCliente
 from .utils_cliente import generar_reporte_cliente_pdf
+from productos.widgets import BuscadorProductoSelect
 
 class DetalleMovimientoClienteForm(forms.ModelForm):
     """Form personalizado para forzar cantidades enteras"""
@@ -62,14 +64,21 @@ class ClienteAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsultas Exists (sin consultas por fila)
+        return super().get_queryset(request).annotate(
+            en_uso=models.ExpressionWrapper(
+                models.Q(models.Exists(MovimientoCliente.objects.filter(cliente=models.OuterRef('pk')))) |
+                models.Q(models.Exists(MovimientoCliente.objects.filter(cliente_origen=models.OuterRef('pk')))) |
+                models.Q(models.Exists(MovimientoCliente.objects.filter(cliente_destino=models.OuterRef('pk')))),
+                output_field=models.BooleanField()
+            )
+        )
+
     def get_uso_estado(self, obj):
         """Muestra si el cliente está siendo usado en movimientos"""
         if obj.pk:
-            en_uso = MovimientoCliente.objects.filter(
-                models.Q(cliente=obj) | 
-                models.Q(cliente_origen=obj) | 
-                models.Q(cliente_destino=obj)
-            ).exists()
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -81,6 +90,7 @@ class ClienteAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = _('Estado')
+    get_uso_estado.admin_order_field = 'en_uso'
     
     def get_readonly_fields(self, request, obj=None):
         """Bloquea campos si el cliente está siendo usado en movimientos"""
@@ -189,6 +199,16 @@ class DetalleMovimientoInline(admin.TabularInline):
     verbose_name = _("Producto")
     verbose_name_plural = _("Productos del movimiento")
     
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: la columna Unidad usa producto.unidad_medida
+        return super().get_queryset(request).select_related('producto__unidad_medida')
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'producto':
+            # 🚀 OPTIMIZACIÓN: autocompletado servido por el índice de productos en memoria
+            kwargs['widget'] = BuscadorProductoSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
         if db_field.name == 'observaciones_producto':
@@ -332,6 +352,7 @@ class MovimientoClienteAdmin(admin.ModelAdmin):
         'get_total_cantidad_danada',
         'boton_descargar_pdf',
     )
+    actions = ['imprimir_pdfs_seleccionados']
     list_filter = (
         'tipo',
         'fecha',
@@ -504,19 +525,25 @@ class MovimientoClienteAdmin(admin.ModelAdmin):
     def preview_numero_movimiento(self, obj): return obj.numero_movimiento if obj and obj.numero_movimiento else '-'
     preview_numero_movimiento.short_description = _('N° de movimiento')
     
-    def get_total_productos(self, obj): return obj.get_total_productos()
+    # 🚀 OPTIMIZACIÓN: Totales guardados en la cabecera, sin consultas por fila
+    def get_total_productos(self, obj): return obj.total_productos
     get_total_productos.short_description = _('Total Productos')
+    get_total_productos.admin_order_field = 'total_productos'
     
-    def get_total_cantidad_buena(self, obj): return f"{obj.get_total_cantidad_buena():,.2f}"
+    def get_total_cantidad_buena(self, obj): return f"{obj.total_cantidad_buena:,.2f}"
     get_total_cantidad_buena.short_description = _('Cant. Buena')
+    get_total_cantidad_buena.admin_order_field = 'total_cantidad_buena'
     
-    def get_total_cantidad_danada(self, obj): return f"{obj.get_total_cantidad_danada():,.2f}" if obj.get_total_cantidad_danada() > 0 else "-"
+    def get_total_cantidad_danada(self, obj): return f"{obj.total_cantidad_danada:,.2f}" if obj.total_cantidad_danada > 0 else "-"
     get_total_cantidad_danada.short_description = _('Cant. Dañada')
+    get_total_cantidad_danada.admin_order_field = 'total_cantidad_danada'
 
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('<int:movimiento_id>/descargar-pdf/', self.admin_site.admin_view(self.descargar_pdf_view), name='beneficiarios_movimientocliente_descargar_pdf'),
+            path('<int:movimiento_id>/descargar-pdf/', self.admin_site.admin_view(self.descargar_pdf_view, cacheable=True), name='beneficiarios_movimientocliente_descargar_pdf'),
+            path('imprimir-lote/', self.admin_site.admin_view(self.imprimir_lote_view), name='beneficiarios_movimientocliente_imprimir_lote'),
+            path('importar-excel/', self.admin_site.admin_view(self.importar_excel_view), name='beneficiarios_movimientocliente_importar_excel'),
             path('ajax/get-next-number/', self.admin_site.admin_view(self.get_next_number_view), name='beneficiarios_movimientocliente_next_number'),
             path('ajax/get-producto-unidad/<int:producto_id>/', self.admin_site.admin_view(self.get_producto_unidad_view), name='beneficiarios_producto_unidad'),
             path('ajax/get-cliente-info/<int:cliente_id>/', self.admin_site.admin_view(self.get_cliente_info_view), name='beneficiarios_cliente_info'),
@@ -525,15 +552,47 @@ class MovimientoClienteAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def descargar_pdf_view(self, request, movimiento_id):
+        # 🚀 OPTIMIZACIÓN: PDF cacheado en disco por versión del movimiento, servido con ETag
+        from reportes.cache_exportaciones import clave_pdf_movimiento, respuesta_cacheada
         try:
             movimiento = MovimientoCliente.objects.get(pk=movimiento_id)
-            buffer = generar_reporte_cliente_pdf(movimiento)
-            response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-            filename = f'movimiento_{movimiento.numero_movimiento}.pdf'
-            response['Content-Disposition'] = f'inline; filename="{filename}"'
-            return response
+
+            def generar():
+                buffer = generar_reporte_cliente_pdf(movimiento)
+                response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+                filename = f'movimiento_{movimiento.numero_movimiento}.pdf'
+                response['Content-Disposition'] = f'inline; filename="{filename}"'
+                return response
+
+            return respuesta_cacheada(request, clave_pdf_movimiento(movimiento), generar)
         except Exception: return HttpResponse("Error", status=500)
 
+    @admin.action(description=_("Imprimir PDFs seleccionados (ZIP)"))
+    def imprimir_pdfs_seleccionados(self, request, queryset):
+        """Un ZIP con el PDF de cada movimiento seleccionado; los lotes grandes se encolan"""
+        from django.contrib import messages
+        from reportes.pdf_lote import respuesta_accion
+        
+        try:
+            return respuesta_accion(request, 'cliente', queryset)
+        except ValueError as e:
+            messages.error(request, f"❌ {e}")
+    
+    def imprimir_lote_view(self, request):
+        """PDFs por lote según filtros GET (fecha_inicio, fecha_fin, almacen, cliente, tipo, formato)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        from reportes.views import imprimir_movimientos_lote
+        return imprimir_movimientos_lote(request, 'cliente')
+
+    def importar_excel_view(self, request):
+        """Lista de distribución en Excel: un movimiento por cliente con sus detalles"""
+        # Crea movimientos que cambian el stock: mismo permiso que el formulario de alta
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        from reportes.views import importar_movimientos_excel
+        return importar_movimientos_excel(request, 'cliente')
+
     def get_next_number_view(self, request):
         tipo = request.GET.get('tipo', '')
         cliente_id = request.GET.get('cliente_id', '')
@@ -560,11 +619,17 @@ class MovimientoClienteAdmin(admin.ModelAdmin):
         return JsonResponse({'numero_movimiento': f"{cliente.codigo}/{pref}-{nuevo_num:04d}"})
 
     def get_producto_unidad_view(self, request, producto_id):
+        # 🚀 OPTIMIZACIÓN: los productos activos se leen del mapa en memoria (sin consulta)
+        from productos.indices import mapa_codigos
         from productos.models import Producto
+
+        producto = mapa_codigos().por_id.get(producto_id)
+        if producto:
+            return JsonResponse({'unidad': producto['unidad']})
         try:
-            prod = Producto.objects.get(id=producto_id)
+            prod = Producto.objects.select_related('unidad_medida').get(id=producto_id)
             return JsonResponse({'unidad': str(prod.unidad_medida)})
-        except: return JsonResponse({}, status=404)
+        except Producto.DoesNotExist: return JsonResponse({}, status=404)
 
     def get_cliente_info_view(self, request, cliente_id):
         try:
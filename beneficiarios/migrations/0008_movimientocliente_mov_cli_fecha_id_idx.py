@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beneficiarios', '0007_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientocliente',
+            index=models.Index(fields=['fecha', 'id'], name='mov_cli_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beneficiarios', '0008_movimientocliente_mov_cli_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientocliente',
+            index=models.Index(fields=['numero_movimiento'], name='mov_cli_num_prefijo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
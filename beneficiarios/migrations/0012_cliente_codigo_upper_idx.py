@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:45
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beneficiarios', '0011_movimientocliente_totales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('codigo'), name='text_pattern_ops'), name='cliente_codigo_upper_idx'),
+        ),
+    ]
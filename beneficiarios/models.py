@@ -1,4 +1,6 @@
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from productos.models import Producto
@@ -23,6 +25,9 @@ class Cliente(models.Model):
         indexes = [
             models.Index(fields=['nombre']),
             models.Index(fields=['activo']),
+            # 🚀 OPTIMIZACIÓN: búsqueda por prefijo de código sin distinguir mayúsculas
+            # (codigo__istartswith → UPPER(codigo) LIKE 'X%')
+            models.Index(OpClass(Upper('codigo'), name='text_pattern_ops'), name='cliente_codigo_upper_idx'),
         ]
 
     def __str__(self):
@@ -130,6 +135,32 @@ class MovimientoCliente(models.Model):
         verbose_name=_("Comentario general")
     )
 
+    fecha_actualizacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Fecha de Actualización")
+    )
+
+    # Totales de los detalles, mantenidos al guardar/eliminar cada detalle
+    total_productos = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("Total Productos")
+    )
+    total_cantidad_buena = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name=_("Total Cantidad Buena")
+    )
+    total_cantidad_danada = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name=_("Total Cantidad Dañada")
+    )
+
     class Meta:
         verbose_name = _("Movimiento de Cliente")
         verbose_name_plural = _("2.2 Movimientos de Cliente / Beneficiario")
@@ -153,6 +184,11 @@ class MovimientoCliente(models.Model):
             models.Index(fields=['almacen_origen', 'almacen_destino'], name='mov_cli_alm_orig_dest_idx'),
             models.Index(fields=['fecha', 'almacen_origen'], name='mov_cli_fecha_alm_orig_idx'),
             models.Index(fields=['fecha', 'almacen_destino'], name='mov_cli_fecha_alm_dest_idx'),
+            # 🚀 OPTIMIZACIÓN: Paginación por cursor (keyset) en reportes
+            models.Index(fields=['fecha', 'id'], name='mov_cli_fecha_id_idx'),
+            # 🚀 OPTIMIZACIÓN: Búsqueda por prefijo sin distinguir mayúsculas del número
+            # (numero_movimiento__istartswith → UPPER(numero_movimiento) LIKE 'X%')
+            models.Index(OpClass(Upper('numero_movimiento'), name='text_pattern_ops'), name='mov_cli_num_upper_idx'),
         ]
 
     def __str__(self):
@@ -215,18 +251,16 @@ class MovimientoCliente(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 
+    # 🚀 OPTIMIZACIÓN: Totales guardados en la cabecera (ver reportes/signals.py),
+    # sin COUNT/SUM sobre los detalles por cada fila de un listado
     def get_total_productos(self):
-        return self.detalles.count()
+        return self.total_productos
 
     def get_total_cantidad_buena(self):
-        return self.detalles.aggregate(
-            total=models.Sum('cantidad')
-        )['total'] or 0
+        return self.total_cantidad_buena
 
     def get_total_cantidad_danada(self):
-        return self.detalles.aggregate(
-            total=models.Sum('cantidad_danada')
-        )['total'] or 0
+        return self.total_cantidad_danada
 
     def get_total_cantidad_general(self):
         return self.get_total_cantidad_buena() + self.get_total_cantidad_danada()
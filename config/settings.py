@@ -35,6 +35,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # OpClass en los índices por prefijo sin distinguir mayúsculas (UPPER(...) text_pattern_ops)
+    'django.contrib.postgres',
 
     # Apps externas
     'rest_framework',
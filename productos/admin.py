@@ -4,8 +4,11 @@ from django.contrib import messages
 from django.urls import reverse, path
 from django.utils.safestring import mark_safe
 from django.shortcuts import render, redirect
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import Exists, OuterRef
 from .models import Producto, Categoria, UnidadMedida
+from .indices import indice_busqueda, mapa_codigos, MAX_CODIGOS_POR_CONSULTA
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
@@ -65,9 +68,48 @@ class ProductoAdmin(admin.ModelAdmin):
         custom_urls = [
             path('importar/', self.admin_site.admin_view(self.importar_view), name='productos_producto_importar'),
             path('exportar/', self.admin_site.admin_view(self.exportar_view), name='productos_producto_exportar'),
+            path('buscar/', self.admin_site.admin_view(self.buscar_view), name='productos_producto_buscar'),
+            path('codigos/', self.admin_site.admin_view(self.codigos_view), name='productos_producto_codigos'),
         ]
         return custom_urls + urls
 
+    def buscar_view(self, request):
+        """
+        Búsqueda por código y nombre para el autocompletado de las líneas de
+        movimientos (formato select2, ver productos/widgets.py).
+        🚀 OPTIMIZACIÓN: se resuelve con el índice en memoria, sin consultar productos.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            pagina = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            pagina = 1
+        resultados, hay_mas = indice_busqueda().pagina(request.GET.get('term', ''), pagina)
+        return JsonResponse({
+            'results': [{'id': str(pk), 'text': etiqueta} for pk, etiqueta in resultados],
+            'pagination': {'more': hay_mas},
+        })
+
+    def codigos_view(self, request):
+        """
+        Productos activos por código, varios en una sola llamada (lector de códigos
+        de la recepción): ?codigo=I0042&codigo=E0007 o ?codigos=I0042,E0007.
+        🚀 OPTIMIZACIÓN: se resuelve con el mapa código → producto en memoria.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        codigos = request.GET.getlist('codigo') + [
+            codigo for valor in request.GET.getlist('codigos') for codigo in valor.split(',')
+        ]
+        codigos = list(dict.fromkeys(c.strip() for c in codigos if c.strip()))
+        if len(codigos) > MAX_CODIGOS_POR_CONSULTA:
+            return JsonResponse(
+                {'error': f'Máximo {MAX_CODIGOS_POR_CONSULTA} códigos por consulta'}, status=400
+            )
+        productos, no_encontrados = mapa_codigos().buscar_varios(codigos)
+        return JsonResponse({'productos': productos, 'no_encontrados': no_encontrados})
+
     def importar_view(self, request):
         """Vista para importar productos desde Excel"""
         from .views import importar_productos
@@ -84,16 +126,14 @@ class ProductoAdmin(admin.ModelAdmin):
         extra_context['show_import_export'] = True
         return super().changelist_view(request, extra_context=extra_context)
 
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsultas Exists (sin consultas por fila)
+        return Producto.anotar_en_uso(super().get_queryset(request))
+
     def get_uso_estado(self, obj):
         """Muestra si el producto está siendo usado en movimientos"""
         if obj.pk:
-            from almacenes.models import DetalleMovimientoAlmacen
-            from beneficiarios.models import DetalleMovimientoCliente
-            
-            en_uso = (
-                DetalleMovimientoAlmacen.objects.filter(producto=obj).exists() or
-                DetalleMovimientoCliente.objects.filter(producto=obj).exists()
-            )
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -105,6 +145,7 @@ class ProductoAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = 'Estado'
+    get_uso_estado.admin_order_field = 'en_uso'
     
     def get_readonly_fields(self, request, obj=None):
         """Hace campos de solo lectura según el contexto"""
@@ -210,6 +251,16 @@ class ProductoAdmin(admin.ModelAdmin):
 
     def delete_queryset(self, request, queryset):
         """Mensaje al eliminar múltiples productos"""
+        # Los productos usados en movimientos están protegidos (PROTECT)
+        codigos_en_uso = Producto.codigos_en_uso(queryset)
+        if codigos_en_uso:
+            messages.error(
+                request,
+                f'❌ No se eliminó ningún producto: {len(codigos_en_uso)} están en uso en movimientos '
+                f'({", ".join(codigos_en_uso[:10])}{"..." if len(codigos_en_uso) > 10 else ""}).'
+            )
+            return
+        
         count = queryset.count()
         try:
             super().delete_queryset(request, queryset)
@@ -244,12 +295,16 @@ class CategoriaAdmin(admin.ModelAdmin):
             'all': ('admin/productos_admin.css',)
         }
 
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsulta Exists (sin consultas por fila)
+        return super().get_queryset(request).annotate(
+            en_uso=Exists(Producto.objects.filter(categoria=OuterRef('pk')))
+        )
+
     def get_uso_estado(self, obj):
         """Muestra si la categoría está siendo usada en productos"""
         if obj.pk:
-            from .models import Producto
-            
-            en_uso = Producto.objects.filter(categoria=obj).exists()
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -261,6 +316,7 @@ class CategoriaAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = 'Estado'
+    get_uso_estado.admin_order_field = 'en_uso'
 
     
     def change_view(self, request, object_id, form_url='', extra_context=None):
@@ -309,12 +365,16 @@ class UnidadMedidaAdmin(admin.ModelAdmin):
             'all': ('admin/productos_admin.css',)
         }
 
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsulta Exists (sin consultas por fila)
+        return super().get_queryset(request).annotate(
+            en_uso=Exists(Producto.objects.filter(unidad_medida=OuterRef('pk')))
+        )
+
     def get_uso_estado(self, obj):
         """Muestra si la unidad de medida está siendo usada en productos"""
         if obj.pk:
-            from .models import Producto
-            
-            en_uso = Producto.objects.filter(unidad_medida=obj).exists()
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -326,6 +386,7 @@ class UnidadMedidaAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = 'Estado'
+    get_uso_estado.admin_order_field = 'en_uso'
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         extra_context = extra_context or {}
@@ -0,0 +1,244 @@
+"""
+Índices del catálogo de productos en memoria (uno por proceso/worker).
+
+Cada índice se construye una vez con una sola consulta y se reconstruye cuando
+cambia la versión de datos PRODUCTOS (VersionDatos), que se incrementa al
+guardar o eliminar productos y unidades (reportes/signals.py) y al importar
+productos desde Excel. La versión se consulta como mucho una vez cada
+INTERVALO_VERSION segundos por worker (una fila por clave única); el resto se
+resuelve en memoria. Los cambios hechos en el propio worker se ven al instante
+(invalidar()); los de otros workers, tras ese intervalo como máximo.
+
+IndiceBusqueda: autocompletado de productos por código y nombre.
+    - palabras de 3 o más caracteres: intersección de las listas de trigramas
+      y verificación de la subcadena (equivale a icontains);
+    - palabras de 1 o 2 caracteres: prefijo de alguna palabra, con bisect sobre
+      la lista ordenada de palabras.
+    Orden: código exacto, código que empieza por el término, nombre que empieza
+    por el término y luego el resto en el orden del catálogo (tipo, código).
+
+MapaCodigos: búsqueda exacta por código (lector de códigos de barras en la
+    recepción) con un diccionario código → producto activo (id, código,
+    nombre, unidad, stock mínimo).
+"""
+import bisect
+import threading
+import time
+import unicodedata
+
+RESULTADOS_POR_PAGINA = 20
+MAX_CODIGOS_POR_CONSULTA = 500
+INTERVALO_VERSION = 5
+
+_bloqueo = threading.Lock()
+_indices = {}
+# (versión, instante de la consulta según time.monotonic())
+_version_leida = (None, 0.0)
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def version_productos():
+    from reportes.models import VersionDatos
+    return VersionDatos.obtener(VersionDatos.PRODUCTOS)
+
+
+def _version_vigente():
+    """Versión PRODUCTOS; se vuelve a consultar pasado INTERVALO_VERSION"""
+    global _version_leida
+    version, instante = _version_leida
+    ahora = time.monotonic()
+    if version is None or ahora - instante >= INTERVALO_VERSION:
+        version = version_productos()
+        _version_leida = (version, ahora)
+    return version
+
+
+def invalidar():
+    """Fuerza la consulta de la versión en el próximo uso (tras un cambio en este worker)"""
+    global _version_leida
+    _version_leida = (None, 0.0)
+
+
+def _obtener(clase):
+    """
+    Índice vigente de `clase`; lo reconstruye si cambió la versión.
+    La versión se lee antes que los datos: un cambio confirmado durante la
+    construcción deja el índice con una versión vieja y se reconstruye en el
+    siguiente uso, nunca al revés.
+    """
+    version = _version_vigente()
+    indice = _indices.get(clase)
+    if indice is None or indice.version != version:
+        with _bloqueo:
+            indice = _indices.get(clase)
+            if indice is None or indice.version != version:
+                indice = clase.construir(version)
+                _indices[clase] = indice
+    return indice
+
+
+class IndiceBusqueda:
+    def __init__(self, version, productos):
+        """`productos`: iterable de (id, codigo, nombre, etiqueta) en el orden del catálogo"""
+        self.version = version
+        self.ids = []
+        self.etiquetas = []
+        self.codigos = []
+        self.nombres = []
+        self.posiciones = {}
+        self.trigramas = {}
+        palabras = []
+
+        for posicion, (pk, codigo, nombre, etiqueta) in enumerate(productos):
+            codigo, nombre = normalizar(codigo), normalizar(nombre)
+            self.ids.append(pk)
+            self.etiquetas.append(etiqueta)
+            self.codigos.append(codigo)
+            self.nombres.append(nombre)
+            self.posiciones[pk] = posicion
+            for trigrama in _trigramas(codigo) | _trigramas(nombre):
+                self.trigramas.setdefault(trigrama, []).append(posicion)
+            for palabra in set(f'{codigo} {nombre}'.split()):
+                palabras.append((palabra, posicion))
+
+        palabras.sort()
+        self.palabras = [palabra for palabra, _ in palabras]
+        self.posiciones_palabras = [posicion for _, posicion in palabras]
+
+    @classmethod
+    def construir(cls, version):
+        from .models import Producto
+
+        filas = Producto.objects.order_by('tipo', 'codigo').values_list(
+            'id', 'codigo', 'nombre', 'unidad_medida__abreviatura'
+        )
+        # Misma etiqueta que Producto.__str__
+        return cls(version, (
+            (pk, codigo, nombre, f"{codigo} - {nombre} - {unidad or 'Sin unidad'}")
+            for pk, codigo, nombre, unidad in filas.iterator()
+        ))
+
+    def etiqueta(self, pk):
+        try:
+            posicion = self.posiciones.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+        return None if posicion is None else self.etiquetas[posicion]
+
+    def _buscar_palabra(self, palabra):
+        if len(palabra) < 3:
+            inicio = bisect.bisect_left(self.palabras, palabra)
+            encontrados = set()
+            for i in range(inicio, len(self.palabras)):
+                if not self.palabras[i].startswith(palabra):
+                    break
+                encontrados.add(self.posiciones_palabras[i])
+            return encontrados
+
+        listas = [self.trigramas.get(trigrama, ()) for trigrama in _trigramas(palabra)]
+        listas.sort(key=len)
+        encontrados = set(listas[0])
+        for lista in listas[1:]:
+            if not encontrados:
+                break
+            encontrados.intersection_update(lista)
+        return {
+            posicion for posicion in encontrados
+            if palabra in self.codigos[posicion] or palabra in self.nombres[posicion]
+        }
+
+    def buscar(self, termino):
+        """Posiciones de los productos que contienen todas las palabras de `termino`, ordenadas"""
+        termino = ' '.join(normalizar(termino).split())
+        if not termino:
+            return range(len(self.ids))
+
+        encontrados = None
+        for palabra in sorted(set(termino.split()), key=len, reverse=True):
+            coincidencias = self._buscar_palabra(palabra)
+            encontrados = coincidencias if encontrados is None else encontrados & coincidencias
+            if not encontrados:
+                return []
+
+        def orden(posicion):
+            codigo = self.codigos[posicion]
+            if codigo == termino:
+                prioridad = 0
+            elif codigo.startswith(termino):
+                prioridad = 1
+            elif self.nombres[posicion].startswith(termino):
+                prioridad = 2
+            else:
+                prioridad = 3
+            return prioridad, posicion
+
+        return sorted(encontrados, key=orden)
+
+    def pagina(self, termino, numero=1, tamano=RESULTADOS_POR_PAGINA):
+        """([(id, etiqueta), ...], hay_mas) de la página `numero` (desde 1)"""
+        posiciones = self.buscar(termino)
+        inicio = (numero - 1) * tamano
+        return (
+            [(self.ids[p], self.etiquetas[p]) for p in posiciones[inicio:inicio + tamano]],
+            len(posiciones) > inicio + tamano,
+        )
+
+
+class MapaCodigos:
+    def __init__(self, version, productos):
+        """`productos`: iterable de dicts con id, codigo, nombre, unidad y stock_minimo"""
+        self.version = version
+        self.por_codigo = {}
+        self.por_id = {}
+        for producto in productos:
+            self.por_codigo[normalizar_codigo(producto['codigo'])] = producto
+            self.por_id[producto['id']] = producto
+
+    @classmethod
+    def construir(cls, version):
+        from .models import Producto
+
+        filas = Producto.objects.filter(activo=True).values_list(
+            'id', 'codigo', 'nombre', 'unidad_medida__abreviatura', 'stock_minimo'
+        )
+        return cls(version, (
+            {'id': pk, 'codigo': codigo, 'nombre': nombre, 'unidad': unidad, 'stock_minimo': stock_minimo}
+            for pk, codigo, nombre, unidad, stock_minimo in filas.iterator()
+        ))
+
+    def buscar(self, codigo):
+        return self.por_codigo.get(normalizar_codigo(codigo))
+
+    def buscar_varios(self, codigos):
+        """({código pedido: producto}, [códigos no encontrados o de productos inactivos])"""
+        encontrados = {}
+        no_encontrados = []
+        for codigo in codigos:
+            producto = self.buscar(codigo)
+            if producto is None:
+                no_encontrados.append(codigo)
+            else:
+                encontrados[codigo] = producto
+        return encontrados, no_encontrados
+
+
+def normalizar_codigo(codigo):
+    """Los lectores de códigos pueden agregar espacios o saltos de línea"""
+    return str(codigo or '').strip().upper()
+
+
+def indice_busqueda():
+    return _obtener(IndiceBusqueda)
+
+
+def mapa_codigos():
+    return _obtener(MapaCodigos)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0009_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilaImportacionProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('importacion', models.UUIDField(verbose_name='Importación')),
+                ('fila', models.PositiveIntegerField(verbose_name='Fila')),
+                ('codigo', models.CharField(blank=True, max_length=255, verbose_name='Código')),
+                ('categoria', models.CharField(max_length=255, verbose_name='Categoría')),
+                ('nombre', models.CharField(max_length=255, verbose_name='Nombre')),
+                ('unidad', models.CharField(max_length=255, verbose_name='Unidad de Medida')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+            ],
+            options={
+                'verbose_name': 'Fila de Importación',
+                'verbose_name_plural': 'Filas de Importación',
+                'ordering': ['importacion', 'fila'],
+                'indexes': [
+                    models.Index(fields=['importacion', 'fila'], name='productos_imp_fila_idx'),
+                    models.Index(fields=['fecha_creacion'], name='productos_imp_fecha_idx'),
+                ],
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q
+from django.db.models.functions import Upper
 from django.utils.html import format_html
 
 class Categoria(models.Model):
@@ -96,11 +99,44 @@ class Producto(models.Model):
             self.codigo = f"{prefijo}{num:04d}"
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def filtro_en_uso():
+        """
+        Condición "usado en algún movimiento" como subconsultas Exists.
+        🚀 OPTIMIZACIÓN: una sola consulta para cualquier cantidad de productos,
+        en lugar de dos .exists() por producto.
+        """
+        from almacenes.models import DetalleMovimientoAlmacen
+        from beneficiarios.models import DetalleMovimientoCliente
+
+        return (
+            Exists(DetalleMovimientoAlmacen.objects.filter(producto=OuterRef('pk'))) |
+            Exists(DetalleMovimientoCliente.objects.filter(producto=OuterRef('pk')))
+        )
+
+    @classmethod
+    def anotar_en_uso(cls, queryset=None):
+        """Queryset con el booleano `en_uso` anotado"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            en_uso=ExpressionWrapper(Q(cls.filtro_en_uso()), output_field=BooleanField())
+        )
+
+    @classmethod
+    def codigos_en_uso(cls, queryset=None):
+        """Códigos de los productos (de `queryset` o de todo el catálogo) usados en movimientos"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return list(
+            queryset.filter(cls.filtro_en_uso()).order_by('codigo').values_list('codigo', flat=True)
+        )
+
     class Meta:
         ordering = ['tipo','codigo']
         # 🚀 OPTIMIZACIÓN: Índices únicos para búsquedas y filtros rápidos en reportes
         indexes = [
             models.Index(fields=['codigo'], name='productos_p_codigo_idx'),
+            # Búsqueda por prefijo de código sin distinguir mayúsculas (codigo__istartswith)
+            models.Index(OpClass(Upper('codigo'), name='text_pattern_ops'), name='productos_p_codigo_upper_idx'),
             models.Index(fields=['nombre'], name='productos_p_nombre_idx'),
             models.Index(fields=['tipo'], name='productos_p_tipo_idx'),
             models.Index(fields=['categoria'], name='productos_p_categoria_idx'),
@@ -112,4 +148,30 @@ class Producto(models.Model):
             models.Index(fields=['categoria', 'activo'], name='productos_p_cat_activo_idx'),
         ]
         verbose_name = "Producto"
-        verbose_name_plural = "3.3. Productos"
\ No newline at end of file
+        verbose_name_plural = "3.3. Productos"
+
+class FilaImportacionProducto(models.Model):
+    """
+    Fila leída del Excel de importación de productos, a la espera de que el
+    asistente termine. 🚀 OPTIMIZACIÓN: los pasos del asistente consultan esta
+    tabla por `importacion` en lugar de guardar todas las filas en la sesión.
+    """
+    importacion = models.UUIDField(verbose_name="Importación")
+    fila = models.PositiveIntegerField(verbose_name="Fila")
+    codigo = models.CharField(max_length=255, blank=True, verbose_name="Código")
+    categoria = models.CharField(max_length=255, verbose_name="Categoría")
+    nombre = models.CharField(max_length=255, verbose_name="Nombre")
+    unidad = models.CharField(max_length=255, verbose_name="Unidad de Medida")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+
+    def __str__(self):
+        return f"{self.importacion} - fila {self.fila}"
+
+    class Meta:
+        ordering = ['importacion', 'fila']
+        indexes = [
+            models.Index(fields=['importacion', 'fila'], name='productos_imp_fila_idx'),
+            models.Index(fields=['fecha_creacion'], name='productos_imp_fecha_idx'),
+        ]
+        verbose_name = "Fila de Importación"
+        verbose_name_plural = "Filas de Importación"
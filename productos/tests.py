@@ -1,3 +1,74 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from productos.indices import IndiceBusqueda
+
+
+def indice(*productos):
+    """Índice con `productos` (codigo, nombre) en ese orden de catálogo e ids desde 1"""
+    return IndiceBusqueda(1, [
+        (pk, codigo, nombre, f'{codigo} - {nombre}')
+        for pk, (codigo, nombre) in enumerate(productos, start=1)
+    ])
+
+
+class IndiceBusquedaTests(SimpleTestCase):
+    def setUp(self):
+        self.indice = indice(
+            ('E0001', 'Motobomba de agua'),
+            ('I0001', 'Semilla de maíz'),
+            ('I0002', 'Maíz amarillo'),
+            ('I0010', 'Abono orgánico'),
+            ('MAI1', 'Otro'),
+        )
+
+    def ids(self, termino):
+        return [self.indice.ids[posicion] for posicion in self.indice.buscar(termino)]
+
+    def test_palabra_corta_busca_por_prefijo(self):
+        self.assertEqual(self.ids('ma'), [5, 3, 2])
+        self.assertEqual(self.ids('DE'), [1, 2])
+        # "agua" contiene "ua", pero ninguna palabra empieza por ella
+        self.assertEqual(self.ids('ua'), [])
+
+    def test_palabra_larga_busca_por_trigramas(self):
+        self.assertEqual(self.ids('aiz'), [2, 3])
+        self.assertEqual(self.ids('0001'), [1, 2])
+        self.assertEqual(self.ids('bomba'), [1])
+        self.assertEqual(self.ids('bombas'), [])
+
+    def test_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.ids('MAÍZ'), [3, 2])
+        self.assertEqual(self.ids('organico'), [4])
+
+    def test_todas_las_palabras(self):
+        self.assertEqual(self.ids('semilla ma'), [2])
+        self.assertEqual(self.ids('  maiz   de '), [2])
+        self.assertEqual(self.ids('abono zz'), [])
+
+    def test_termino_vacio(self):
+        self.assertEqual(self.ids('  '), [1, 2, 3, 4, 5])
+
+    def test_orden(self):
+        # Catálogo en orden inverso a la prioridad esperada
+        self.indice = indice(
+            ('X0001', 'Kit con repuesto i0001'),
+            ('X0002', 'I0001 repuesto'),
+            ('I00015', 'Repuesto'),
+            ('I0001', 'Original'),
+            ('X0003', 'Otro kit i0001'),
+        )
+        # Código exacto, código que empieza, nombre que empieza y el resto por catálogo
+        self.assertEqual(self.ids('i0001'), [4, 3, 2, 1, 5])
+
+    def test_pagina(self):
+        self.assertEqual(self.indice.pagina('ma', numero=1, tamano=2), (
+            [(5, 'MAI1 - Otro'), (3, 'I0002 - Maíz amarillo')], True,
+        ))
+        self.assertEqual(self.indice.pagina('ma', numero=2, tamano=2), (
+            [(2, 'I0001 - Semilla de maíz')], False,
+        ))
+
+    def test_etiqueta(self):
+        self.assertEqual(self.indice.etiqueta('4'), 'I0010 - Abono orgánico')
+        self.assertIsNone(self.indice.etiqueta(99))
+        self.assertIsNone(self.indice.etiqueta('abc'))
@@ -2,13 +2,20 @@ from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.db import transaction
-from .models import Producto, Categoria, UnidadMedida
+from django.utils import timezone
+from .models import Producto, Categoria, UnidadMedida, FilaImportacionProducto
 import openpyxl
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 import re
+import uuid
+from datetime import timedelta
 from io import BytesIO
 
+TAMANO_LOTE_IMPORTACION = 500
+HORAS_RETENCION_IMPORTACION = 24
+CAMPOS_IMPORTACION = ('fila', 'codigo', 'categoria', 'nombre', 'unidad')
+
 def next_code(request):
     tipo = request.GET.get('tipo')
     if not tipo:
@@ -103,51 +110,22 @@ def importar_productos(request):
                 return render(request, 'admin/productos/importar_paso1.html')
             
             try:
-                # Leer Excel
-                wb = openpyxl.load_workbook(archivo)
-                ws = wb.active
+                # Descartar una importación anterior sin terminar
+                limpiar_importacion(request)
                 
-                # Procesar datos (saltando fila 1 de encabezados)
-                datos_excel = []
-                filas_con_error = []
+                importacion_id, total_filas, filas_error = cargar_importacion(archivo)
                 
-                for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                    if not any(row):  # Fila completamente vacía
-                        continue
-                    
-                    codigo = str(row[0]).strip() if row[0] else ''
-                    categoria = str(row[1]).strip() if row[1] else ''
-                    nombre = str(row[2]).strip() if row[2] else ''
-                    unidad = str(row[3]).strip() if row[3] else ''
-                    
-                    # Validar campos obligatorios
-                    if not nombre or not unidad:
-                        filas_con_error.append({
-                            'fila': idx,
-                            'datos': row,
-                            'razon': 'Falta nombre o unidad de medida'
-                        })
-                        continue
-                    
-                    datos_excel.append({
-                        'fila': idx,
-                        'codigo': codigo,
-                        'categoria': categoria if categoria else 'VARIOS',
-                        'nombre': nombre,
-                        'unidad': unidad
-                    })
-                
-                if not datos_excel:
+                if not total_filas:
                     messages.error(request, '❌ No se encontraron datos válidos en el archivo')
                     return render(request, 'admin/productos/importar_paso1.html')
                 
-                # Guardar en sesión
-                request.session['datos_importacion'] = datos_excel
-                request.session['filas_error'] = filas_con_error
+                # En sesión solo queda el id; las filas están en FilaImportacionProducto
+                request.session['importacion_id'] = importacion_id
+                request.session['filas_error'] = filas_error
                 
                 return render(request, 'admin/productos/importar_paso2.html', {
-                    'total_filas': len(datos_excel),
-                    'filas_error': len(filas_con_error)
+                    'total_filas': total_filas,
+                    'filas_error': filas_error
                 })
                 
             except Exception as e:
@@ -178,9 +156,9 @@ def importar_productos(request):
             request.session['tipo_producto'] = tipo_producto
             
             # Generar vista previa
-            datos = request.session.get('datos_importacion', [])
+            filas = filas_importacion(request)
             vista_previa = generar_vista_previa(
-                datos[:20],  # Solo primeros 20
+                list(filas.values(*CAMPOS_IMPORTACION)[:20]),  # Solo primeros 20
                 metodo_codigo,
                 tipo_producto,
                 request.session.get('modo_importacion')
@@ -188,26 +166,28 @@ def importar_productos(request):
             
             return render(request, 'admin/productos/importar_paso4.html', {
                 'vista_previa': vista_previa,
-                'total_registros': len(datos)
+                'total_registros': filas.count()
             })
         
         # PASO 4: Confirmar y procesar
         elif paso == '4':
             confirmar = request.POST.get('confirmar')
             if confirmar != 'si':
+                limpiar_importacion(request)
                 messages.warning(request, '⚠️ Importación cancelada')
                 return redirect('admin:productos_producto_changelist')
             
             # Procesar importación
             resultado = procesar_importacion(
-                request.session.get('datos_importacion', []),
+                filas_importacion(request),
                 request.session.get('modo_importacion'),
                 request.session.get('metodo_codigo'),
                 request.session.get('tipo_producto', '')
             )
             
-            # Limpiar sesión
-            for key in ['datos_importacion', 'filas_error', 'modo_importacion', 'metodo_codigo', 'tipo_producto']:
+            # Limpiar sesión y filas de la importación
+            limpiar_importacion(request)
+            for key in ['filas_error', 'modo_importacion', 'metodo_codigo', 'tipo_producto']:
                 if key in request.session:
                     del request.session[key]
             
@@ -219,6 +199,83 @@ def importar_productos(request):
     return render(request, 'admin/productos/importar_paso1.html')
 
 
+def cargar_importacion(archivo):
+    """
+    Lee el Excel y guarda las filas válidas en FilaImportacionProducto.
+    🚀 OPTIMIZACIÓN: lectura en modo streaming (read_only) e inserción por lotes;
+    ni el archivo completo ni las filas pasan por memoria o por la sesión.
+    Retorna (importacion_id, filas_validas, filas_con_error).
+    """
+    importacion_id = uuid.uuid4()
+    filas_validas = 0
+    filas_con_error = 0
+    lote = []
+    
+    wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        
+        # Procesar datos (saltando fila 1 de encabezados)
+        for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            if not any(row):  # Fila completamente vacía
+                continue
+            
+            # En modo read_only las filas pueden venir más cortas que 4 columnas
+            row = tuple(row) + (None,) * (4 - len(row))
+            
+            codigo = str(row[0]).strip() if row[0] else ''
+            categoria = str(row[1]).strip() if row[1] else ''
+            nombre = str(row[2]).strip() if row[2] else ''
+            unidad = str(row[3]).strip() if row[3] else ''
+            
+            # Validar campos obligatorios
+            if not nombre or not unidad:
+                filas_con_error += 1
+                continue
+            
+            lote.append(FilaImportacionProducto(
+                importacion=importacion_id,
+                fila=idx,
+                codigo=codigo[:255],
+                categoria=(categoria if categoria else 'VARIOS')[:255],
+                nombre=nombre[:255],
+                unidad=unidad[:255]
+            ))
+            filas_validas += 1
+            
+            if len(lote) >= TAMANO_LOTE_IMPORTACION:
+                FilaImportacionProducto.objects.bulk_create(lote)
+                lote = []
+        
+        if lote:
+            FilaImportacionProducto.objects.bulk_create(lote)
+    except Exception:
+        FilaImportacionProducto.objects.filter(importacion=importacion_id).delete()
+        raise
+    finally:
+        wb.close()
+    
+    return str(importacion_id), filas_validas, filas_con_error
+
+
+def filas_importacion(request):
+    """Filas de la importación en curso de la sesión (vacío si no hay ninguna)"""
+    importacion_id = request.session.get('importacion_id')
+    if not importacion_id:
+        return FilaImportacionProducto.objects.none()
+    return FilaImportacionProducto.objects.filter(importacion=importacion_id)
+
+
+def limpiar_importacion(request):
+    """Elimina las filas de la importación en curso y las de importaciones abandonadas"""
+    importacion_id = request.session.pop('importacion_id', None)
+    if importacion_id:
+        FilaImportacionProducto.objects.filter(importacion=importacion_id).delete()
+    FilaImportacionProducto.objects.filter(
+        fecha_creacion__lt=timezone.now() - timedelta(hours=HORAS_RETENCION_IMPORTACION)
+    ).delete()
+
+
 def generar_vista_previa(datos, metodo_codigo, tipo_producto, modo):
     """Genera vista previa de cómo quedarán los productos"""
     vista_previa = []
@@ -270,7 +327,14 @@ def validar_y_ajustar_codigo(codigo):
 
 
 def procesar_importacion(datos, modo, metodo_codigo, tipo_producto):
-    """Procesa la importación de productos"""
+    """
+    Procesa la importación de productos.
+    🚀 OPTIMIZACIÓN: categorías, unidades, claves (nombre, unidad) y códigos
+    existentes se cargan una sola vez en diccionarios; las categorías y unidades
+    faltantes se crean con bulk_create, los códigos se reservan en memoria por
+    tipo y los productos se insertan por lotes, todo en una sola transacción.
+    `datos` es el queryset de FilaImportacionProducto de la importación.
+    """
     resultado = {
         'exitosos': 0,
         'saltados': 0,
@@ -282,23 +346,17 @@ def procesar_importacion(datos, modo, metodo_codigo, tipo_producto):
         'productos_protegidos': 0
     }
     
+    prefijos = {'INSUMOS':'I','EQUIPOS':'E','HERRAMIENTAS':'H','OTROS':'O'}
+    inicial_map = {'I':'INSUMOS','E':'EQUIPOS','H':'HERRAMIENTAS','O':'OTROS'}
+    max_nombre = Producto._meta.get_field('nombre').max_length
+    max_abreviatura = UnidadMedida._meta.get_field('abreviatura').max_length
+    
     try:
         with transaction.atomic():
             # Si modo es reemplazar, intentar borrar todos los productos
             if modo == 'reemplazar':
-                # Verificar si hay productos en uso
-                from almacenes.models import DetalleMovimientoAlmacen
-                from beneficiarios.models import DetalleMovimientoCliente
-                
-                productos_en_uso = []
-                
-                for producto in Producto.objects.all():
-                    en_uso = (
-                        DetalleMovimientoAlmacen.objects.filter(producto=producto).exists() or
-                        DetalleMovimientoCliente.objects.filter(producto=producto).exists()
-                    )
-                    if en_uso:
-                        productos_en_uso.append(producto.codigo)
+                # Verificar si hay productos en uso (una sola consulta con Exists)
+                productos_en_uso = Producto.codigos_en_uso()
                 
                 if productos_en_uso:
                     # NO se puede hacer reemplazo total
@@ -315,104 +373,159 @@ def procesar_importacion(datos, modo, metodo_codigo, tipo_producto):
                 # Si no hay productos en uso, proceder con eliminación
                 Producto.objects.all().delete()
             
-            for item in datos:
+            # Categorías: coincidencia exacta por nombre (como get_or_create)
+            nombres_categoria = list(datos.order_by().values_list('categoria', flat=True).distinct())
+            categorias = {
+                c.nombre: c for c in Categoria.objects.filter(nombre__in=nombres_categoria)
+            }
+            categorias_faltantes = [n for n in nombres_categoria if n not in categorias]
+            if categorias_faltantes:
+                Categoria.objects.bulk_create([
+                    Categoria(nombre=n, descripcion='Creada automáticamente durante importación')
+                    for n in categorias_faltantes
+                ], batch_size=TAMANO_LOTE_IMPORTACION)
+                categorias.update(
+                    (c.nombre, c) for c in Categoria.objects.filter(nombre__in=categorias_faltantes)
+                )
+                resultado['categorias_creadas'].extend(categorias_faltantes)
+            
+            # Unidades: por nombre O abreviatura, sin distinguir mayúsculas
+            unidades_por_nombre = {}
+            unidades_por_abreviatura = {}
+            for u in UnidadMedida.objects.all():
+                unidades_por_nombre[u.nombre.lower()] = u
+                unidades_por_abreviatura[u.abreviatura.lower()] = u
+            
+            def buscar_unidad(nombre):
+                clave = nombre.lower()
+                return unidades_por_nombre.get(clave) or unidades_por_abreviatura.get(clave)
+            
+            unidades_faltantes = {}
+            for unidad_nombre in datos.order_by().values_list('unidad', flat=True).distinct():
+                if len(unidad_nombre) <= max_abreviatura and not buscar_unidad(unidad_nombre):
+                    unidades_faltantes.setdefault(unidad_nombre.lower(), unidad_nombre)
+            if unidades_faltantes:
+                UnidadMedida.objects.bulk_create([
+                    UnidadMedida(nombre=n, abreviatura=n) for n in unidades_faltantes.values()
+                ], batch_size=TAMANO_LOTE_IMPORTACION)
+                for u in UnidadMedida.objects.filter(nombre__in=list(unidades_faltantes.values())):
+                    unidades_por_nombre[u.nombre.lower()] = u
+                    unidades_por_abreviatura[u.abreviatura.lower()] = u
+                resultado['unidades_creadas'].extend(unidades_faltantes.values())
+            
+            # Claves existentes: (nombre, unidad) para detectar duplicados y códigos usados
+            claves_existentes = set()
+            if modo == 'solo_nuevos':
+                claves_existentes = {
+                    (nombre.lower(), unidad_id)
+                    for nombre, unidad_id in Producto.objects.values_list('nombre', 'unidad_medida_id')
+                }
+            
+            codigos_existentes = set()
+            ultimo_por_tipo = {}
+            for codigo, tipo in Producto.objects.values_list('codigo', 'tipo'):
+                codigos_existentes.add(codigo)
+                if codigo and codigo > ultimo_por_tipo.get(tipo, ''):
+                    ultimo_por_tipo[tipo] = codigo
+            
+            # Siguiente número libre por tipo (misma regla que Producto.save: último + 1)
+            siguiente = {}
+            for tipo, ultimo in ultimo_por_tipo.items():
                 try:
-                    # Obtener o crear categoría
-                    categoria_nombre = item['categoria']
-                    categoria, created = Categoria.objects.get_or_create(
-                        nombre=categoria_nombre,
-                        defaults={'descripcion': 'Creada automáticamente durante importación'}
-                    )
-                    if created:
-                        resultado['categorias_creadas'].append(categoria_nombre)
-                    
-                    # CORREGIDO: Buscar unidad por nombre O abreviatura
-                    unidad_nombre = item['unidad']
-                    unidad = None
-                    
-                    # Intentar encontrar por nombre exacto
-                    try:
-                        unidad = UnidadMedida.objects.get(nombre__iexact=unidad_nombre)
-                    except UnidadMedida.DoesNotExist:
-                        # Intentar encontrar por abreviatura
-                        try:
-                            unidad = UnidadMedida.objects.get(abreviatura__iexact=unidad_nombre)
-                        except UnidadMedida.DoesNotExist:
-                            # No existe, crear nueva
-                            unidad = UnidadMedida.objects.create(
-                                nombre=unidad_nombre,
-                                abreviatura=unidad_nombre
-                            )
-                            resultado['unidades_creadas'].append(unidad_nombre)
-                    
-                    # Si modo es solo nuevos, verificar duplicados
-                    if modo == 'solo_nuevos':
-                        existe = Producto.objects.filter(
-                            nombre__iexact=item['nombre'],
-                            unidad_medida=unidad
-                        ).exists()
-                        
-                        if existe:
-                            resultado['saltados'] += 1
-                            continue
-                    
-                    # Determinar código
-                    if metodo_codigo == 'reasignar':
-                        # Generar código según tipo seleccionado
-                        prefijos = {'INSUMOS':'I','EQUIPOS':'E','HERRAMIENTAS':'H','OTROS':'O'}
-                        prefijo = prefijos.get(tipo_producto, 'P')
-                        tipo_final = tipo_producto
-                        codigo = None  # Se generará automáticamente
-                    else:
-                        # Usar código del Excel
-                        codigo_excel = item['codigo']
-                        if codigo_excel:
-                            codigo_ajustado = validar_y_ajustar_codigo(codigo_excel)
-                            if codigo_ajustado:
-                                # Verificar si existe
-                                if Producto.objects.filter(codigo=codigo_ajustado).exists():
-                                    # Re-enumerar
-                                    letra = codigo_ajustado[0]
-                                    codigo = generar_codigo_unico(letra)
-                                    resultado['codigos_ajustados'].append({
-                                        'original': codigo_excel,
-                                        'nuevo': codigo
-                                    })
-                                else:
-                                    codigo = codigo_ajustado
-                                
-                                # Determinar tipo según inicial
-                                inicial_map = {'I':'INSUMOS','E':'EQUIPOS','H':'HERRAMIENTAS','O':'OTROS'}
-                                tipo_final = inicial_map.get(codigo[0], 'OTROS')
-                            else:
-                                # Código inválido, generar automático
-                                tipo_final = 'OTROS'
-                                codigo = None
-                        else:
-                            # Sin código, generar automático
-                            tipo_final = 'OTROS'
-                            codigo = None
-                    
-                    # Crear producto
-                    producto = Producto(
-                        tipo=tipo_final,
-                        nombre=item['nombre'],
-                        categoria=categoria,
-                        unidad_medida=unidad,
-                        codigo=codigo if codigo else ''
-                    )
-                    producto.save()
-                    
-                    resultado['exitosos'] += 1
+                    siguiente[tipo] = int(ultimo[1:]) + 1
+                except ValueError:
+                    siguiente[tipo] = 1
+            
+            def reservar_codigo(tipo, prefijo):
+                num = siguiente.get(tipo, 1)
+                while f"{prefijo}{num:04d}" in codigos_existentes:
+                    num += 1
+                siguiente[tipo] = num + 1
+                codigo = f"{prefijo}{num:04d}"
+                codigos_existentes.add(codigo)
+                return codigo
+            
+            nuevos = []
+            
+            def insertar_lote():
+                Producto.objects.bulk_create(nuevos)
+                resultado['exitosos'] += len(nuevos)
+                for producto in nuevos:
                     resultado['productos_por_tipo'][producto.codigo[0]] = resultado['productos_por_tipo'].get(producto.codigo[0], 0) + 1
-                    
-                except Exception as e:
+                nuevos.clear()
+            
+            filas = datos.values(*CAMPOS_IMPORTACION).iterator(chunk_size=TAMANO_LOTE_IMPORTACION)
+            for item in filas:
+                unidad = buscar_unidad(item['unidad'])
+                if unidad is None:
                     resultado['errores'].append({
                         'fila': item['fila'],
                         'nombre': item['nombre'],
-                        'error': str(e)
+                        'error': f"La unidad '{item['unidad']}' no existe y supera los {max_abreviatura} caracteres de una abreviatura"
                     })
+                    continue
+                
+                if len(item['nombre']) > max_nombre:
+                    resultado['errores'].append({
+                        'fila': item['fila'],
+                        'nombre': item['nombre'],
+                        'error': f"El nombre supera los {max_nombre} caracteres"
+                    })
+                    continue
+                
+                # Si modo es solo nuevos, verificar duplicados (incluye los ya importados en este archivo)
+                if modo == 'solo_nuevos':
+                    clave = (item['nombre'].lower(), unidad.id)
+                    if clave in claves_existentes:
+                        resultado['saltados'] += 1
+                        continue
+                    claves_existentes.add(clave)
+                
+                # Determinar código
+                if metodo_codigo == 'reasignar':
+                    tipo_final = tipo_producto
+                    codigo = reservar_codigo(tipo_final, prefijos.get(tipo_producto, 'P'))
+                else:
+                    # Usar código del Excel
+                    codigo_excel = item['codigo']
+                    codigo_ajustado = validar_y_ajustar_codigo(codigo_excel) if codigo_excel else None
+                    if codigo_ajustado:
+                        letra = codigo_ajustado[0]
+                        tipo_final = inicial_map.get(letra, 'OTROS')
+                        if codigo_ajustado in codigos_existentes:
+                            # Re-enumerar
+                            codigo = reservar_codigo(tipo_final, letra)
+                            resultado['codigos_ajustados'].append({
+                                'original': codigo_excel,
+                                'nuevo': codigo
+                            })
+                        else:
+                            codigo = codigo_ajustado
+                            codigos_existentes.add(codigo)
+                            if letra == prefijos.get(tipo_final):
+                                siguiente[tipo_final] = max(siguiente.get(tipo_final, 1), int(codigo[1:]) + 1)
+                    else:
+                        # Sin código o código inválido, generar automático
+                        tipo_final = 'OTROS'
+                        codigo = reservar_codigo(tipo_final, prefijos[tipo_final])
+                
+                nuevos.append(Producto(
+                    tipo=tipo_final,
+                    nombre=item['nombre'],
+                    categoria=categorias[item['categoria']],
+                    unidad_medida=unidad,
+                    codigo=codigo
+                ))
+                if len(nuevos) >= TAMANO_LOTE_IMPORTACION:
+                    insertar_lote()
             
+            if nuevos:
+                insertar_lote()
+
+            # bulk_create no emite señales: invalida una sola vez los índices de productos en memoria
+            from reportes.models import VersionDatos
+            transaction.on_commit(lambda: VersionDatos.incrementar(VersionDatos.PRODUCTOS))
+
     except Exception as e:
         resultado['error_general'] = str(e)
     
@@ -0,0 +1,35 @@
+from django.contrib.admin.widgets import AutocompleteSelect
+
+from .indices import indice_busqueda
+
+
+class BuscadorProductoSelect(AutocompleteSelect):
+    """
+    Autocompletado de productos para las líneas de los movimientos.
+    🚀 OPTIMIZACIÓN: las búsquedas las responde ProductoAdmin.buscar_view con el
+    índice en memoria (productos/indices.py) y las etiquetas de los productos ya
+    elegidos salen del mismo índice, sin una consulta por línea del formset.
+    """
+    url_name = '%s:productos_producto_buscar'
+
+    def __init__(self, field, admin_site, attrs=None, choices=(), using=None):
+        super().__init__(field, admin_site, attrs=attrs, choices=choices, using=using)
+        # Los formularios del formset comparten el widget (copia superficial): una versión por request
+        self.indice = indice_busqueda()
+
+    def optgroups(self, name, value, attr=None):
+        opciones = []
+        if not self.is_required:
+            opciones.append(self.create_option(name, '', '', False, 0))
+        seleccionados = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        faltantes = [pk for pk in seleccionados if self.indice.etiqueta(pk) is None]
+        # Producto creado después de construir el índice: se consulta como lo hace Django
+        etiquetas = {
+            str(obj.pk): str(obj)
+            for obj in self.choices.queryset.using(self.db).select_related('unidad_medida').filter(pk__in=faltantes)
+        } if faltantes else {}
+        for pk in seleccionados:
+            etiqueta = self.indice.etiqueta(pk) or etiquetas.get(pk)
+            if etiqueta is not None:
+                opciones.append(self.create_option(name, pk, etiqueta, True, len(opciones)))
+        return [(None, opciones, 0)]
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib import messages
 from django.utils.safestring import mark_safe
 from django.utils.html import format_html
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q
 from .models import Proveedor
 
 @admin.register(Proveedor)
@@ -31,16 +32,23 @@ class ProveedorAdmin(admin.ModelAdmin):
             'all': ('admin/productos_admin.css',)
         }
 
+    def get_queryset(self, request):
+        # 🚀 OPTIMIZACIÓN: "en uso" como subconsultas Exists (sin consultas por fila)
+        from almacenes.models import MovimientoAlmacen
+        from beneficiarios.models import MovimientoCliente
+        
+        return super().get_queryset(request).annotate(
+            en_uso=ExpressionWrapper(
+                Q(Exists(MovimientoAlmacen.objects.filter(proveedor=OuterRef('pk')))) |
+                Q(Exists(MovimientoCliente.objects.filter(proveedor=OuterRef('pk')))),
+                output_field=BooleanField()
+            )
+        )
+
     def get_uso_estado(self, obj):
         """Muestra si el proveedor está siendo usado en movimientos"""
         if obj.pk:
-            from almacenes.models import MovimientoAlmacen
-            from beneficiarios.models import MovimientoCliente
-            
-            en_uso = (
-                MovimientoAlmacen.objects.filter(proveedor=obj).exists() or
-                MovimientoCliente.objects.filter(proveedor=obj).exists()
-            )
+            en_uso = obj.en_uso
             
             if en_uso:
                 return format_html(
@@ -52,6 +60,7 @@ class ProveedorAdmin(admin.ModelAdmin):
                 )
         return "-"
     get_uso_estado.short_description = 'Estado'
+    get_uso_estado.admin_order_field = 'en_uso'
     
     def change_view(self, request, object_id, form_url='', extra_context=None):
         extra_context = extra_context or {}
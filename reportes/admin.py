@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from django.http import HttpResponse, JsonResponse
-from django.urls import path
-from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, FileResponse, Http404
+from django.urls import path, reverse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.html import format_html
-from django.db.models import Sum, Count, Q, F
+from django.db.models import Sum, Count, F, Exists, OuterRef
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from datetime import datetime, timedelta
 import csv
@@ -14,13 +14,12 @@ from openpyxl.utils import get_column_letter
 from decimal import Decimal
 
 from .models import ReporteMovimiento, ReporteEntregas, ReporteStock
-from .models import ReporteStockReal
-from almacenes.models import MovimientoAlmacen, DetalleMovimientoAlmacen, Almacen
-from beneficiarios.models import MovimientoCliente, DetalleMovimientoCliente, Cliente
+from .models import ReporteStockReal, TrabajoExportacion
+from almacenes.models import DetalleMovimientoAlmacen, Almacen
+from beneficiarios.models import DetalleMovimientoCliente
 from productos.models import Producto, Categoria
-from proveedores.models import Proveedor
-from recepcionistas.models import Recepcionista
 from . import views
+from .utils import paginar_keyset, contar_aproximado
 
 
 # ==========================================
@@ -85,9 +84,12 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
                 recepcionista=recepcionista_id if recepcionista_id else None
             )
             if producto_id:
-                movimientos = movimientos.filter(detalles__producto_id=producto_id).distinct()
+                # Exists en lugar de JOIN + distinct(): permite paginar por índice (fecha, id)
+                movimientos = movimientos.filter(Exists(
+                    DetalleMovimientoAlmacen.objects.filter(movimiento=OuterRef('pk'), producto_id=producto_id)
+                ))
             if numero_movimiento:
-                movimientos = movimientos.filter(numero_movimiento__icontains=numero_movimiento)
+                movimientos = movimientos.filter(numero_movimiento__istartswith=numero_movimiento)
         
         else:
             movimientos = ReporteMovimiento.obtener_movimientos_cliente(
@@ -99,33 +101,12 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
                 recepcionista=recepcionista_id if recepcionista_id else None
             )
             if producto_id:
-                movimientos = movimientos.filter(detalles__producto_id=producto_id).distinct()
+                movimientos = movimientos.filter(Exists(
+                    DetalleMovimientoCliente.objects.filter(movimiento=OuterRef('pk'), producto_id=producto_id)
+                ))
             if numero_movimiento:
-                movimientos = movimientos.filter(numero_movimiento__icontains=numero_movimiento)
+                movimientos = movimientos.filter(numero_movimiento__istartswith=numero_movimiento)
 
-        # 4. Obtener listado de números de movimientos para el filtro (Dropdown)
-        # Nota: Esto se podría optimizar, pero mantenemos tu lógica original
-        if tipo_reporte == 'almacen':
-            movimientos_query = MovimientoAlmacen.objects.all()
-            # ... (Tus filtros para el dropdown) ...
-            if fecha_inicio_obj: movimientos_query = movimientos_query.filter(fecha__gte=fecha_inicio_obj)
-            if fecha_fin_obj: movimientos_query = movimientos_query.filter(fecha__lte=fecha_fin_obj)
-            if almacen_id: movimientos_query = movimientos_query.filter(Q(almacen_origen_id=almacen_id) | Q(almacen_destino_id=almacen_id))
-            if tipo_movimiento: movimientos_query = movimientos_query.filter(tipo=tipo_movimiento)
-            if proveedor_id: movimientos_query = movimientos_query.filter(proveedor_id=proveedor_id)
-            if recepcionista_id: movimientos_query = movimientos_query.filter(recepcionista_id=recepcionista_id)
-            numeros_movimientos = movimientos_query.values_list('numero_movimiento', flat=True).distinct().order_by('-numero_movimiento')
-        else:
-            movimientos_query = MovimientoCliente.objects.all()
-            # ... (Tus filtros para el dropdown) ...
-            if fecha_inicio_obj: movimientos_query = movimientos_query.filter(fecha__gte=fecha_inicio_obj)
-            if fecha_fin_obj: movimientos_query = movimientos_query.filter(fecha__lte=fecha_fin_obj)
-            if cliente_id: movimientos_query = movimientos_query.filter(cliente_id=cliente_id)
-            if tipo_movimiento: movimientos_query = movimientos_query.filter(tipo=tipo_movimiento)
-            if proveedor_id: movimientos_query = movimientos_query.filter(proveedor_id=proveedor_id)
-            if recepcionista_id: movimientos_query = movimientos_query.filter(recepcionista_id=recepcionista_id)
-            numeros_movimientos = movimientos_query.values_list('numero_movimiento', flat=True).distinct().order_by('-numero_movimiento')
-        
         # =========================================================
         # ⚠️ CORRECCIÓN IMPORTANTE: Calcular Estadísticas Faltantes
         # =========================================================
@@ -141,9 +122,9 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
         )
 
         # ==========================================
-        # ✅ PAGINACIÓN
+        # ✅ PAGINACIÓN POR CURSOR (KEYSET) SOBRE (fecha, id)
         # ==========================================
-        page = request.GET.get('page', 1)
+        # 🚀 OPTIMIZACIÓN: Sin OFFSET; la página 500 cuesta lo mismo que la 1
         items_por_pagina = request.GET.get('items_por_pagina', '100')
         
         try:
@@ -153,31 +134,60 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
         except (ValueError, TypeError):
             items_por_pagina = 100
 
-        # Calcular total ANTES de paginar
-        total_movimientos = movimientos.count()
-        
-        paginator = Paginator(movimientos, items_por_pagina)
-        
         try:
-            movimientos_paginados = paginator.page(page)
-        except PageNotAnInteger:
-            movimientos_paginados = paginator.page(1)
-        except EmptyPage:
-            movimientos_paginados = paginator.page(paginator.num_pages)       
+            numero_pagina = max(int(request.GET.get('page', 1)), 1)
+        except (ValueError, TypeError):
+            numero_pagina = 1
+
+        cursor = request.GET.get('cursor', '')
+        direccion = request.GET.get('direccion', 'next')
+
+        pagina = paginar_keyset(movimientos, cursor, direccion, items_por_pagina)
+
+        # Total: aproximado por defecto (estimación del planificador), exacto bajo demanda
+        if request.GET.get('total') == 'exacto':
+            total_movimientos, total_aproximado = movimientos.order_by().count(), False
+        else:
+            total_movimientos, total_aproximado = contar_aproximado(movimientos)
+
+        num_paginas = max(-(-total_movimientos // items_por_pagina), 1)
+        if direccion == 'ultima':
+            numero_pagina = num_paginas
+        elif not cursor or not pagina['has_previous']:
+            numero_pagina = 1
+
+        inicio_pagina = (numero_pagina - 1) * items_por_pagina + 1 if pagina['items'] else 0
+        pagina.update({
+            'numero': numero_pagina,
+            'numero_anterior': max(numero_pagina - 1, 1),
+            'numero_siguiente': numero_pagina + 1,
+            'num_paginas': num_paginas,
+            'start_index': inicio_pagina,
+            'end_index': inicio_pagina + len(pagina['items']) - 1 if pagina['items'] else 0,
+        })
+
+        # Querystring de filtros sin los parámetros de navegación
+        params_navegacion = request.GET.copy()
+        for clave in ('cursor', 'direccion', 'page'):
+            params_navegacion.pop(clave, None)
         
         context = {
             **self.admin_site.each_context(request),
             'title': _('Reportes de Movimientos: ALMACENES Y CLIENTES'),
-            'movimientos': movimientos_paginados,  # ✅ Paginado
-            'total_movimientos': total_movimientos, # ✅ Total real
+            'movimientos': pagina['items'],        # ✅ Paginado por cursor
+            'total_movimientos': total_movimientos,
+            'total_aproximado': total_aproximado,
             'estadisticas': estadisticas,          # ✅ Ahora sí existe
             'productos_top': productos_top,        # ✅ Ahora sí existe
             'almacenes': Almacen.objects.filter(activo=True),
-            'clientes': Cliente.objects.filter(activo=True),
-            'proveedores': Proveedor.objects.filter(activo=True),
-            'recepcionistas': Recepcionista.objects.filter(activo=True),
-            'productos': Producto.objects.filter(activo=True).order_by('codigo'),
-            'numeros_movimientos': list(numeros_movimientos[:200]),
+            # 🚀 OPTIMIZACIÓN: Clientes, proveedores, recepcionistas y productos se buscan por AJAX;
+            # solo se envía el texto de la opción seleccionada
+            'etiquetas_filtro': {
+                'cliente': views.etiqueta_opcion('cliente', cliente_id),
+                'proveedor': views.etiqueta_opcion('proveedor', proveedor_id),
+                'recepcionista': views.etiqueta_opcion('recepcionista', recepcionista_id),
+                'producto': views.etiqueta_opcion('producto', producto_id),
+            },
             'tipos_movimiento': [
                 ('ENTRADA', 'Entrada'),
                 ('SALIDA', 'Salida'),
@@ -196,8 +206,8 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
                 'numero_movimiento': numero_movimiento,
             },
             # ✅ VARIABLES DE PAGINACIÓN
-            'page_obj': movimientos_paginados,
-            'paginator': paginator,
+            'pagina': pagina,
+            'query_navegacion': params_navegacion.urlencode(),
             'items_por_pagina': items_por_pagina,
             'opciones_items': [50, 100, 200, 500],
             'opts': self.model._meta,
@@ -212,89 +222,29 @@ class ReporteMovimientoAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('api/numeros_movimiento/', 
-                self.admin_site.admin_view(self.obtener_numeros_movimiento_ajax),
+                self.admin_site.admin_view(views.obtener_numeros_movimiento_json),
                 name='reportes_reportemovimiento_numeros_json'),
             path('exportar-excel/', 
-                self.admin_site.admin_view(views.exportar_movimientos_excel), 
+                self.admin_site.admin_view(views.exportar_movimientos_excel, cacheable=True), 
                 name='reportes_reportemovimiento_exportar_excel'),
             path('exportar-csv/', 
-                self.admin_site.admin_view(views.exportar_movimientos_csv), 
+                self.admin_site.admin_view(views.exportar_movimientos_csv, cacheable=True), 
                 name='reportes_reportemovimiento_exportar_csv'),
             path('obtener-datos-graficos-movimientos/', # <-- ADICIÓN DE LA URL
                 self.admin_site.admin_view(views.obtener_datos_graficos_movimientos),
                 name='reportes_movimientos_datos_graficos'),
+            path('tendencia-producto/',
+                self.admin_site.admin_view(views.obtener_tendencia_producto),
+                name='reportes_movimientos_tendencia_producto'),
+            path('tendencia-proveedor/',
+                self.admin_site.admin_view(views.obtener_tendencia_proveedor),
+                name='reportes_movimientos_tendencia_proveedor'),
+            path('tendencia-recepcionista/',
+                self.admin_site.admin_view(views.obtener_tendencia_recepcionista),
+                name='reportes_movimientos_tendencia_recepcionista'),
         ]
         return custom_urls + urls
 
-    def obtener_numeros_movimiento_ajax(self, request):
-        """Endpoint AJAX para obtener números de movimiento filtrados"""
-        tipo_reporte = request.GET.get('tipo_reporte', 'almacen')
-        fecha_inicio = request.GET.get('fecha_inicio', '')
-        fecha_fin = request.GET.get('fecha_fin', '')
-        tipo_movimiento = request.GET.get('tipo_movimiento', '')
-        almacen_id = request.GET.get('almacen', '')
-        cliente_id = request.GET.get('cliente', '')
-        proveedor_id = request.GET.get('proveedor', '')
-        recepcionista_id = request.GET.get('recepcionista', '')
-        
-        # Convertir fechas
-        fecha_inicio_obj = None
-        fecha_fin_obj = None
-        
-        if fecha_inicio:
-            try:
-                fecha_inicio_obj = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        if fecha_fin:
-            try:
-                fecha_fin_obj = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        # Obtener números según tipo de reporte
-        if tipo_reporte == 'almacen':
-            movimientos_query = MovimientoAlmacen.objects.all()
-            
-            if fecha_inicio_obj:
-                movimientos_query = movimientos_query.filter(fecha__gte=fecha_inicio_obj)
-            if fecha_fin_obj:
-                movimientos_query = movimientos_query.filter(fecha__lte=fecha_fin_obj)
-            if almacen_id:
-                movimientos_query = movimientos_query.filter(
-                    Q(almacen_origen_id=almacen_id) | Q(almacen_destino_id=almacen_id)
-                )
-            if tipo_movimiento:
-                movimientos_query = movimientos_query.filter(tipo=tipo_movimiento)
-            if proveedor_id:
-                movimientos_query = movimientos_query.filter(proveedor_id=proveedor_id)
-            if recepcionista_id:
-                movimientos_query = movimientos_query.filter(recepcionista_id=recepcionista_id)
-                
-            numeros = movimientos_query.values_list('numero_movimiento', flat=True).distinct().order_by('-numero_movimiento')[:200]
-        else:
-            movimientos_query = MovimientoCliente.objects.all()
-            
-            if fecha_inicio_obj:
-                movimientos_query = movimientos_query.filter(fecha__gte=fecha_inicio_obj)
-            if fecha_fin_obj:
-                movimientos_query = movimientos_query.filter(fecha__lte=fecha_fin_obj)
-            if cliente_id:
-                movimientos_query = movimientos_query.filter(cliente_id=cliente_id)
-            if tipo_movimiento:
-                movimientos_query = movimientos_query.filter(tipo=tipo_movimiento)
-            if proveedor_id:
-                movimientos_query = movimientos_query.filter(proveedor_id=proveedor_id)
-            if recepcionista_id:
-                movimientos_query = movimientos_query.filter(recepcionista_id=recepcionista_id)
-                
-            numeros = movimientos_query.values_list('numero_movimiento', flat=True).distinct().order_by('-numero_movimiento')[:200]
-        
-        return JsonResponse({
-            'numeros': list(numeros)
-        })
-
 # ==========================================
 # REPORTE DE ENTREGAS - CORREGIDO CON TRASLADOS SEPARADOS
 # ==========================================
@@ -354,556 +304,71 @@ class ReporteEntregasAdmin(admin.ModelAdmin):
             except ValueError:
                 pass
         
-        # Query base: TODOS los movimientos de clientes
-        movimientos_qs = MovimientoCliente.objects.all()
-        
-        if fecha_inicio_obj:
-            movimientos_qs = movimientos_qs.filter(fecha__gte=fecha_inicio_obj)
-        
-        if fecha_fin_obj:
-            movimientos_qs = movimientos_qs.filter(fecha__lte=fecha_fin_obj)
-        
-        if cliente_id:
-            # ✅ CORRECCIÓN: Filtrar también por cliente_origen y cliente_destino en traslados
-            movimientos_qs = movimientos_qs.filter(
-                Q(cliente_id=cliente_id) | 
-                Q(cliente_origen_id=cliente_id) | 
-                Q(cliente_destino_id=cliente_id)
-            )
-
-        # Inicializar variables
-        entregas = []
-        productos_top = []
-        resumen_clientes = []
-        estadisticas = {}
+        # 🚀 OPTIMIZACIÓN: Agregación en SQL (consultas agrupadas por tramo) compartida
+        # con views.exportar_entregas_excel / _csv, en lugar de recorrer cada detalle en Python
+        mostrar_todos = request.GET.get('mostrar_todos', '') == '1'
+        agregado = ReporteEntregas.agregar_entregas(
+            fecha_inicio_obj, fecha_fin_obj, cliente_id, categoria_id, producto_id
+        )
+        entregas = list(ReporteEntregas.filas_vista(
+            vista, agregado, cliente_id, categoria_id, producto_id, mostrar_todos
+        ))
         
         if vista == 'detallado':
-            # Verificar si se debe mostrar todos los productos
-            mostrar_todos = request.GET.get('mostrar_todos', '') == '1'
-            entregas_dict = {}
-
-            if mostrar_todos:
-                # Pre-llenar con todos los productos/clientes activos
-                clientes_activos = Cliente.objects.filter(activo=True)
-                if cliente_id:  # ✅ YA ESTÁ CORRECTO AQUÍ
-                    clientes_activos = clientes_activos.filter(id=cliente_id)
-                                    
-                productos_activos = Producto.objects.filter(activo=True)
-                if categoria_id:
-                    productos_activos = productos_activos.filter(categoria_id=categoria_id)
-                if producto_id:
-                    productos_activos = productos_activos.filter(id=producto_id)
-                
-                for cliente in clientes_activos:
-                    for producto in productos_activos:
-                        key = f"{cliente.id}_{producto.id}"
-                        entregas_dict[key] = {
-                            'cliente_id': cliente.id,
-                            'cliente_nombre': cliente.nombre,
-                            'cliente_codigo': cliente.codigo,
-                            'cliente_direccion': cliente.direccion or '-',
-                            'producto_id': producto.id,
-                            'producto_codigo': producto.codigo,
-                            'producto_nombre': producto.nombre,
-                            'producto_categoria': producto.categoria.nombre if producto.categoria else '-',
-                            'producto_unidad': producto.unidad_medida.abreviatura if producto.unidad_medida else 'UND',
-                            'total_entregas': set(),
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),    # ✅ NUEVO
-                            'cantidad_traslado_destino': Decimal('0'),   # ✅ NUEVO
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-            
-            # Obtener los detalles
-            entregas_qs = DetalleMovimientoCliente.objects.filter(
-                movimiento__in=movimientos_qs
-            ).select_related(
-                'movimiento', 'movimiento__cliente', 'producto',
-                'producto__categoria', 'producto__unidad_medida'
-            )
-            
-            if categoria_id:
-                entregas_qs = entregas_qs.filter(producto__categoria_id=categoria_id)
-            if producto_id:
-                entregas_qs = entregas_qs.filter(producto_id=producto_id)
-            
-            # ✅ CORRECCIÓN: Procesar movimientos considerando traslados
-            for detalle in entregas_qs:
-                mov = detalle.movimiento
-                cant_b = detalle.cantidad or Decimal('0')
-                cant_d = detalle.cantidad_danada or Decimal('0')
-                cant_total = cant_b + cant_d
-                
-                # ✅ PARA TRASLADOS: Crear DOS registros (origen y destino)
-                if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                    # 1. CLIENTE ORIGEN (RESTA)
-                    key_origen = f"{mov.cliente_origen.id}_{detalle.producto.id}"
-                    
-                    if key_origen not in entregas_dict:
-                        entregas_dict[key_origen] = {
-                            'cliente_id': mov.cliente_origen.id,
-                            'cliente_nombre': mov.cliente_origen.nombre,
-                            'cliente_codigo': mov.cliente_origen.codigo,
-                            'cliente_direccion': mov.cliente_origen.direccion or '-',
-                            'producto_id': detalle.producto.id,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': set(),
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),    # ✅ NUEVO
-                            'cantidad_traslado_destino': Decimal('0'),   # ✅ NUEVO
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    entregas_dict[key_origen]['total_entregas'].add(mov.id)
-                    entregas_dict[key_origen]['cantidad_traslado_origen'] += cant_total  # ✅ NUEVO
-                    entregas_dict[key_origen]['stock_bueno'] -= cant_b  # RESTA
-                    entregas_dict[key_origen]['stock_danado'] -= cant_d  # RESTA
-                    entregas_dict[key_origen]['cantidad_buena'] += cant_b
-                    entregas_dict[key_origen]['cantidad_danada'] += cant_d
-                    
-                    # 2. CLIENTE DESTINO (SUMA)
-                    key_destino = f"{mov.cliente_destino.id}_{detalle.producto.id}"
-                    
-                    if key_destino not in entregas_dict:
-                        entregas_dict[key_destino] = {
-                            'cliente_id': mov.cliente_destino.id,
-                            'cliente_nombre': mov.cliente_destino.nombre,
-                            'cliente_codigo': mov.cliente_destino.codigo,
-                            'cliente_direccion': mov.cliente_destino.direccion or '-',
-                            'producto_id': detalle.producto.id,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': set(),
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),    # ✅ NUEVO
-                            'cantidad_traslado_destino': Decimal('0'),   # ✅ NUEVO
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    entregas_dict[key_destino]['total_entregas'].add(mov.id)
-                    entregas_dict[key_destino]['cantidad_traslado_destino'] += cant_total  # ✅ NUEVO
-                    entregas_dict[key_destino]['stock_bueno'] += cant_b  # SUMA
-                    entregas_dict[key_destino]['stock_danado'] += cant_d  # SUMA
-                    entregas_dict[key_destino]['cantidad_buena'] += cant_b
-                    entregas_dict[key_destino]['cantidad_danada'] += cant_d
-                    
-                else:
-                    # PARA ENTRADA Y SALIDA (lógica original)
-                    cli_id = mov.cliente.id
-                    key = f"{cli_id}_{detalle.producto.id}"
-                    
-                    if not mostrar_todos and key not in entregas_dict:
-                        entregas_dict[key] = {
-                            'cliente_id': cli_id,
-                            'cliente_nombre': mov.cliente.nombre,
-                            'cliente_codigo': mov.cliente.codigo,
-                            'cliente_direccion': mov.cliente.direccion or '-',
-                            'producto_id': detalle.producto.id,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': set(),
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),    # ✅ NUEVO
-                            'cantidad_traslado_destino': Decimal('0'),   # ✅ NUEVO
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    if key in entregas_dict:
-                        entregas_dict[key]['total_entregas'].add(mov.id)
-                        
-                        if mov.tipo == 'ENTRADA':
-                            entregas_dict[key]['cantidad_entrada'] += cant_total
-                            entregas_dict[key]['stock_bueno'] += cant_b
-                            entregas_dict[key]['stock_danado'] += cant_d
-                            
-                        elif mov.tipo == 'SALIDA':
-                            entregas_dict[key]['cantidad_salida'] += cant_total
-                            entregas_dict[key]['stock_bueno'] -= cant_b
-                            entregas_dict[key]['stock_danado'] -= cant_d
-
-                        entregas_dict[key]['cantidad_buena'] += cant_b
-                        entregas_dict[key]['cantidad_danada'] += cant_d
-            
-            # Convertir a lista y calcular totales
-            cantidad_total_global = Decimal('0')
-            clientes_unicos = set()
-            productos_unicos = set()
-            
-            for key, item in entregas_dict.items():
-                # ✅ CORRECCIÓN: Si hay filtro de cliente, mostrar SOLO ese cliente
-                if cliente_id and str(item['cliente_id']) != str(cliente_id):
-                    continue
-                
-                item['total_entregas'] = len(item['total_entregas'])
-                item['stock_total'] = item['stock_bueno'] + item['stock_danado']
-                cantidad_total_global += item['stock_total']
-                
-                clientes_unicos.add(item['cliente_id'])
-                productos_unicos.add(item['producto_id'])
-                entregas.append(item)
-            
-            entregas.sort(key=lambda x: (x['cliente_codigo'], x['producto_codigo']))
-
             estadisticas = {
-                'cantidad_total': cantidad_total_global,
-                'total_clientes_unicos': len(clientes_unicos),
-                'total_productos_unicos': len(productos_unicos),
+                'cantidad_total': sum((item['stock_total'] for item in entregas), Decimal('0')),
+                'total_clientes_unicos': len({item['cliente_id'] for item in entregas}),
+                'total_productos_unicos': len({item['producto_id'] for item in entregas}),
             }
-        
         elif vista == 'por_cliente':
-            entregas_qs = DetalleMovimientoCliente.objects.filter(
-                movimiento__in=movimientos_qs
-            ).select_related(
-                'movimiento', 'movimiento__cliente', 'producto'
-            )
-            
-            if categoria_id:
-                entregas_qs = entregas_qs.filter(producto__categoria_id=categoria_id)
-            if producto_id:
-                entregas_qs = entregas_qs.filter(producto_id=producto_id)
-            
-            # Agrupar por cliente
-            clientes_dict = {}
-            for detalle in entregas_qs:
-                mov = detalle.movimiento
-                cant_b = detalle.cantidad or Decimal('0')
-                cant_d = detalle.cantidad_danada or Decimal('0')
-                
-                # ✅ PARA TRASLADOS: Procesar ORIGEN Y DESTINO
-                if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                    # CLIENTE ORIGEN (RESTA)
-                    cliente_id_origen = mov.cliente_origen.id
-                    
-                    if cliente_id_origen not in clientes_dict:
-                        clientes_dict[cliente_id_origen] = {
-                            'cliente_id': cliente_id_origen,
-                            'cliente_nombre': mov.cliente_origen.nombre,
-                            'cliente_codigo': mov.cliente_origen.codigo,
-                            'cliente_direccion': mov.cliente_origen.direccion or '-',
-                            'cliente_telefono': mov.cliente_origen.telefono or '-',
-                            'movimientos': set(),
-                            'productos': set(),
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                        }
-                    
-                    clientes_dict[cliente_id_origen]['movimientos'].add(mov.id)
-                    clientes_dict[cliente_id_origen]['productos'].add(detalle.producto.id)
-                    clientes_dict[cliente_id_origen]['cantidad_buena'] -= cant_b
-                    clientes_dict[cliente_id_origen]['cantidad_danada'] -= cant_d
-                    
-                    # CLIENTE DESTINO (SUMA)
-                    cliente_id_destino = mov.cliente_destino.id
-                    
-                    if cliente_id_destino not in clientes_dict:
-                        clientes_dict[cliente_id_destino] = {
-                            'cliente_id': cliente_id_destino,
-                            'cliente_nombre': mov.cliente_destino.nombre,
-                            'cliente_codigo': mov.cliente_destino.codigo,
-                            'cliente_direccion': mov.cliente_destino.direccion or '-',
-                            'cliente_telefono': mov.cliente_destino.telefono or '-',
-                            'movimientos': set(),
-                            'productos': set(),
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                        }
-                    
-                    clientes_dict[cliente_id_destino]['movimientos'].add(mov.id)
-                    clientes_dict[cliente_id_destino]['productos'].add(detalle.producto.id)
-                    clientes_dict[cliente_id_destino]['cantidad_buena'] += cant_b
-                    clientes_dict[cliente_id_destino]['cantidad_danada'] += cant_d
-                    
-                else:
-                    # ENTRADA Y SALIDA (lógica original)
-                    cliente_id_key = mov.cliente.id
-                    
-                    if cliente_id_key not in clientes_dict:
-                        clientes_dict[cliente_id_key] = {
-                            'cliente_id': cliente_id_key,
-                            'cliente_nombre': mov.cliente.nombre,
-                            'cliente_codigo': mov.cliente.codigo,
-                            'cliente_direccion': mov.cliente.direccion or '-',
-                            'cliente_telefono': mov.cliente.telefono or '-',
-                            'movimientos': set(),
-                            'productos': set(),
-                            'cantidad_buena': Decimal('0'),
-                            'cantidad_danada': Decimal('0'),
-                        }
-                    
-                    clientes_dict[cliente_id_key]['movimientos'].add(mov.id)
-                    clientes_dict[cliente_id_key]['productos'].add(detalle.producto.id)
-                    
-                    if mov.tipo == 'ENTRADA':
-                        clientes_dict[cliente_id_key]['cantidad_buena'] += cant_b
-                        clientes_dict[cliente_id_key]['cantidad_danada'] += cant_d
-                        
-                    elif mov.tipo == 'SALIDA':
-                        clientes_dict[cliente_id_key]['cantidad_buena'] -= cant_b
-                        clientes_dict[cliente_id_key]['cantidad_danada'] -= cant_d
-
-            # Convertir a lista
-            total_movimientos = 0
-            total_general = Decimal('0')
-            total_productos_diferentes = set()
-            
-            for cliente_id_key, item in clientes_dict.items():
-                # ✅ CORRECCIÓN: Si hay filtro de cliente, mostrar SOLO ese cliente
-                if cliente_id and str(cliente_id_key) != str(cliente_id):
-                    continue
-                
-                item['total_entregas'] = len(item['movimientos'])
-                item['total_productos'] = len(item['productos'])
-                item['cantidad_total'] = item['cantidad_buena'] + item['cantidad_danada']
-                
-                total_movimientos += item['total_entregas']
-                total_general += item['cantidad_total']
-                
-                total_productos_diferentes.update(item['productos'])
-                
-                del item['movimientos']
-                del item['productos']
-                entregas.append(item)
-            
-            entregas.sort(key=lambda x: x['cliente_codigo'])
-            
             estadisticas = {
-                'total_movimientos': total_movimientos,
-                'total_productos_diferentes': len(total_productos_diferentes),
-                'cantidad_total': total_general,
+                'total_movimientos': sum(item['total_entregas'] for item in entregas),
+                'total_productos_diferentes': len({
+                    pid for cli, pid in agregado['pares']
+                    if not cliente_id or str(cli) == str(cliente_id)
+                }),
+                'cantidad_total': sum((item['cantidad_total'] for item in entregas), Decimal('0')),
             }
-
-        # ========================================
-        # CORRECCIÓN VISTA PRODUCTOS_TOP
-        # ========================================
-
         else:  # productos_top
-            entregas_qs = DetalleMovimientoCliente.objects.filter(
-                movimiento__in=movimientos_qs
-            ).select_related(
-                'movimiento', 'movimiento__cliente', 'producto',
-                'producto__categoria', 'producto__unidad_medida'
-            )
-            
-            if categoria_id:
-                entregas_qs = entregas_qs.filter(producto__categoria_id=categoria_id)
-            if producto_id:
-                entregas_qs = entregas_qs.filter(producto_id=producto_id)
-            
-            # Agrupar por producto
-            productos_dict = {}
-            clientes_unicos = set()
-            
-            for detalle in entregas_qs:
-                mov = detalle.movimiento
-                producto_id_key = detalle.producto.id
-                cant_b = detalle.cantidad or Decimal('0')
-                cant_d = detalle.cantidad_danada or Decimal('0')
-                
-                if producto_id_key not in productos_dict:
-                    productos_dict[producto_id_key] = {
-                        'producto_id': producto_id_key,
-                        'producto_codigo': detalle.producto.codigo,
-                        'producto_nombre': detalle.producto.nombre,
-                        'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                        'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                        'clientes': set(),
-                        'movimientos': set(),
-                        'cantidad_buena': Decimal('0'),
-                        'cantidad_danada': Decimal('0'),
-                    }
-                
-                productos_dict[producto_id_key]['movimientos'].add(mov.id)
-                
-                # ✅ PARA TRASLADOS: Registrar ambos clientes pero stock NEUTRO global
-                if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                    productos_dict[producto_id_key]['clientes'].add(mov.cliente_origen.id)
-                    productos_dict[producto_id_key]['clientes'].add(mov.cliente_destino.id)
-                    clientes_unicos.add(mov.cliente_origen.id)
-                    clientes_unicos.add(mov.cliente_destino.id)
-                    # Stock neto CERO (sale de uno, entra a otro)
-                    
-                else:
-                    productos_dict[producto_id_key]['clientes'].add(mov.cliente.id)
-                    clientes_unicos.add(mov.cliente.id)
-                    
-                    if mov.tipo == 'ENTRADA':
-                        productos_dict[producto_id_key]['cantidad_buena'] += cant_b
-                        productos_dict[producto_id_key]['cantidad_danada'] += cant_d
-                    elif mov.tipo == 'SALIDA':
-                        productos_dict[producto_id_key]['cantidad_buena'] -= cant_b
-                        productos_dict[producto_id_key]['cantidad_danada'] -= cant_d
-
-            # Convertir a lista
-            total_general = Decimal('0')
-            total_entregas_global = 0
-            
-            for producto_id_key, item in productos_dict.items():
-                item['total_clientes'] = len(item['clientes'])
-                item['total_entregas'] = len(item['movimientos'])
-                item['cantidad_total'] = item['cantidad_buena'] + item['cantidad_danada']
-                
-                total_general += item['cantidad_total']
-                total_entregas_global += item['total_entregas']
-                
-                del item['clientes']
-                del item['movimientos']
-                entregas.append(item)
-            
-            entregas.sort(key=lambda x: x['producto_codigo'])
-            
             estadisticas = {
-                'total_clientes': len(clientes_unicos),
-                'total_entregas': total_entregas_global,
-                'cantidad_total': total_general,
+                'total_clientes': len({cli for cli, _ in agregado['pares']}),
+                'total_entregas': sum(item['total_entregas'] for item in entregas),
+                'cantidad_total': sum((item['cantidad_total'] for item in entregas), Decimal('0')),
             }
         
         # --- SIDEBAR (Top 10 Productos y Clientes) ---
-        # Recalculamos usando la misma lógica para que coincida con la tabla principal
-        
-        # Top 10 Productos (Sidebar)
-        productos_top_qs = DetalleMovimientoCliente.objects.filter(
-            movimiento__in=movimientos_qs
-        ).select_related('producto', 'producto__unidad_medida', 'movimiento__cliente')
-
-        productos_top_dict = {}
-        for detalle in productos_top_qs:
-            mov = detalle.movimiento
-            prod_id = detalle.producto.id
-            cant_b = detalle.cantidad or Decimal('0')
-            cant_d = detalle.cantidad_danada or Decimal('0')
-            
-            if prod_id not in productos_top_dict:
-                productos_top_dict[prod_id] = {
-                    'producto__codigo': detalle.producto.codigo,
-                    'producto__nombre': detalle.producto.nombre,
-                    'producto__unidad_medida__abreviatura': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                    'clientes': set(),
-                    'cantidad_buena': Decimal('0'),
-                    'cantidad_danada': Decimal('0'),
-                }
-            
-            # ✅ PARA TRASLADOS: Registrar ambos clientes pero stock NEUTRO
-            if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                productos_top_dict[prod_id]['clientes'].add(mov.cliente_origen.id)
-                productos_top_dict[prod_id]['clientes'].add(mov.cliente_destino.id)
-                # Stock neto CERO
-            else:
-                productos_top_dict[prod_id]['clientes'].add(mov.cliente.id)
-                
-                if mov.tipo == 'ENTRADA':
-                    productos_top_dict[prod_id]['cantidad_buena'] += cant_b
-                    productos_top_dict[prod_id]['cantidad_danada'] += cant_d
-                elif mov.tipo == 'SALIDA':
-                    productos_top_dict[prod_id]['cantidad_buena'] -= cant_b
-                    productos_top_dict[prod_id]['cantidad_danada'] -= cant_d
-
-        for prod_id, item in productos_top_dict.items():
-            item['total_clientes'] = len(item['clientes'])
-            item['cantidad_total'] = item['cantidad_buena'] + item['cantidad_danada']
-            del item['clientes']
-            productos_top.append(item)
-
+        # Sin filtro de categoría/producto, igual que antes; se reutiliza la agregación si coincide
+        if categoria_id or producto_id:
+            agregado_sidebar = ReporteEntregas.agregar_entregas(fecha_inicio_obj, fecha_fin_obj, cliente_id)
+        else:
+            agregado_sidebar = agregado
+        
+        productos_top = [
+            {
+                'producto__codigo': item['producto_codigo'],
+                'producto__nombre': item['producto_nombre'],
+                'producto__unidad_medida__abreviatura': item['producto_unidad'],
+                'cantidad_buena': item['cantidad_buena'],
+                'cantidad_danada': item['cantidad_danada'],
+                'total_clientes': item['total_clientes'],
+                'cantidad_total': item['cantidad_total'],
+            }
+            for item in ReporteEntregas.entregas_por_producto(agregado_sidebar)
+        ]
         productos_top.sort(key=lambda x: x['cantidad_total'], reverse=True)
         productos_top = productos_top[:10]
-
-        # ========================================
-        # CORRECCIÓN SIDEBAR - Top 10 Clientes
-        # ========================================
-
-        clientes_top_qs = DetalleMovimientoCliente.objects.filter(
-            movimiento__in=movimientos_qs
-        ).select_related('movimiento', 'movimiento__cliente', 'producto')
-
-        clientes_top_dict = {}
-        for detalle in clientes_top_qs:
-            mov = detalle.movimiento
-            cant_b = detalle.cantidad or Decimal('0')
-            cant_d = detalle.cantidad_danada or Decimal('0')
-            
-            # ✅ PARA TRASLADOS: Procesar ORIGEN Y DESTINO
-            if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                # CLIENTE ORIGEN (RESTA)
-                cli_id_origen = mov.cliente_origen.id
-                if cli_id_origen not in clientes_top_dict:
-                    clientes_top_dict[cli_id_origen] = {
-                        'movimiento__cliente__nombre': mov.cliente_origen.nombre,
-                        'movimientos': set(),
-                        'productos': set(),
-                        'cantidad_buena': Decimal('0'),
-                        'cantidad_danada': Decimal('0'),
-                    }
-                clientes_top_dict[cli_id_origen]['movimientos'].add(mov.id)
-                clientes_top_dict[cli_id_origen]['productos'].add(detalle.producto.id)
-                clientes_top_dict[cli_id_origen]['cantidad_buena'] -= cant_b
-                clientes_top_dict[cli_id_origen]['cantidad_danada'] -= cant_d
-                
-                # CLIENTE DESTINO (SUMA)
-                cli_id_destino = mov.cliente_destino.id
-                if cli_id_destino not in clientes_top_dict:
-                    clientes_top_dict[cli_id_destino] = {
-                        'movimiento__cliente__nombre': mov.cliente_destino.nombre,
-                        'movimientos': set(),
-                        'productos': set(),
-                        'cantidad_buena': Decimal('0'),
-                        'cantidad_danada': Decimal('0'),
-                    }
-                clientes_top_dict[cli_id_destino]['movimientos'].add(mov.id)
-                clientes_top_dict[cli_id_destino]['productos'].add(detalle.producto.id)
-                clientes_top_dict[cli_id_destino]['cantidad_buena'] += cant_b
-                clientes_top_dict[cli_id_destino]['cantidad_danada'] += cant_d
-                
-            else:
-                # ENTRADA Y SALIDA
-                cli_id = mov.cliente.id
-                if cli_id not in clientes_top_dict:
-                    clientes_top_dict[cli_id] = {
-                        'movimiento__cliente__nombre': mov.cliente.nombre,
-                        'movimientos': set(),
-                        'productos': set(),
-                        'cantidad_buena': Decimal('0'),
-                        'cantidad_danada': Decimal('0'),
-                    }
-                clientes_top_dict[cli_id]['movimientos'].add(mov.id)
-                clientes_top_dict[cli_id]['productos'].add(detalle.producto.id)
-                
-                if mov.tipo == 'ENTRADA':
-                    clientes_top_dict[cli_id]['cantidad_buena'] += cant_b
-                    clientes_top_dict[cli_id]['cantidad_danada'] += cant_d
-                elif mov.tipo == 'SALIDA':
-                    clientes_top_dict[cli_id]['cantidad_buena'] -= cant_b
-                    clientes_top_dict[cli_id]['cantidad_danada'] -= cant_d
-
-        for cli_id, item in clientes_top_dict.items():
-            item['total_entregas'] = len(item['movimientos'])
-            item['total_productos'] = len(item['productos'])
-            item['cantidad_total'] = item['cantidad_buena'] + item['cantidad_danada']
-            del item['movimientos']
-            del item['productos']
-            resumen_clientes.append(item)
-
+        
+        resumen_clientes = [
+            {
+                'movimiento__cliente__nombre': item['cliente_nombre'],
+                'total_entregas': item['total_entregas'],
+                'total_productos': item['total_productos'],
+                'cantidad_buena': item['cantidad_buena'],
+                'cantidad_danada': item['cantidad_danada'],
+                'cantidad_total': item['cantidad_total'],
+            }
+            for item in ReporteEntregas.entregas_por_cliente(agregado_sidebar)
+        ]
         resumen_clientes.sort(key=lambda x: x['cantidad_total'], reverse=True)
         resumen_clientes = resumen_clientes[:10]
         
@@ -927,9 +392,11 @@ class ReporteEntregasAdmin(admin.ModelAdmin):
             'estadisticas': estadisticas,
             'productos_top': productos_top,
             'resumen_clientes': resumen_clientes,
-            'clientes': Cliente.objects.filter(activo=True).order_by('nombre'),
             'categorias': Categoria.objects.all(),
-            'productos': Producto.objects.filter(activo=True).order_by('codigo'),
+            'etiquetas_filtro': {
+                'cliente': views.etiqueta_opcion('cliente', cliente_id),
+                'producto': views.etiqueta_opcion('producto', producto_id),
+            },
             'filtros': {
                 'vista': vista,
                 'fecha_inicio': fecha_inicio,
@@ -1007,10 +474,10 @@ class ReporteEntregasAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(views.obtener_detalle_estadistica_entregas),
                 name='reportes_entregas_obtener_estadistica'),
             path('exportar-excel/', 
-                self.admin_site.admin_view(self.exportar_excel), 
+                self.admin_site.admin_view(views.exportar_entregas_excel), 
                 name='reportes_entregas_exportar_excel'),
             path('exportar-csv/', 
-                self.admin_site.admin_view(self.exportar_csv), 
+                self.admin_site.admin_view(views.exportar_entregas_csv), 
                 name='reportes_entregas_exportar_csv'),
             path('obtener-productos-cliente/',
                  self.admin_site.admin_view(views.obtener_productos_cliente),
@@ -1021,367 +488,6 @@ class ReporteEntregasAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Retorna queryset vacío"""
         return self.model.objects.none()
-    
-    def exportar_excel(self, request):
-        """Exporta las entregas a Excel"""
-        from django.http import HttpResponse
-        from datetime import datetime
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-        from decimal import Decimal
-        
-        # Obtener parámetros de filtro
-        vista = request.GET.get('vista', 'detallado')
-        fecha_inicio = request.GET.get('fecha_inicio', '')
-        fecha_fin = request.GET.get('fecha_fin', '')
-        cliente_id = request.GET.get('cliente', '')
-        categoria_id = request.GET.get('categoria', '')
-        producto_id = request.GET.get('producto', '')
-        mostrar_todos = request.GET.get('mostrar_todos', '') == '1'
-        
-        # Convertir fechas
-        fecha_inicio_obj = None
-        fecha_fin_obj = None
-        
-        if fecha_inicio:
-            try:
-                fecha_inicio_obj = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        if fecha_fin:
-            try:
-                fecha_fin_obj = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        # Query base
-        movimientos_qs = MovimientoCliente.objects.all()
-        
-        if fecha_inicio_obj:
-            movimientos_qs = movimientos_qs.filter(fecha__gte=fecha_inicio_obj)
-        
-        if fecha_fin_obj:
-            movimientos_qs = movimientos_qs.filter(fecha__lte=fecha_fin_obj)
-        
-        if cliente_id:
-            movimientos_qs = movimientos_qs.filter(
-                Q(cliente_id=cliente_id) | 
-                Q(cliente_origen_id=cliente_id) | 
-                Q(cliente_destino_id=cliente_id)
-            )
-        
-        # Obtener entregas según vista
-        entregas = []
-        
-        if vista == 'detallado':
-            entregas_dict = {}
-            
-            if mostrar_todos:
-                clientes_activos = Cliente.objects.filter(activo=True)
-                if cliente_id:
-                    clientes_activos = clientes_activos.filter(id=cliente_id)
-                
-                productos_activos = Producto.objects.filter(activo=True)
-                if categoria_id:
-                    productos_activos = productos_activos.filter(categoria_id=categoria_id)
-                if producto_id:
-                    productos_activos = productos_activos.filter(id=producto_id)
-                
-                for cliente in clientes_activos:
-                    for producto in productos_activos:
-                        key = f"{cliente.id}_{producto.id}"
-                        entregas_dict[key] = {
-                            'cliente_nombre': cliente.nombre,
-                            'cliente_codigo': cliente.codigo,
-                            'producto_codigo': producto.codigo,
-                            'producto_nombre': producto.nombre,
-                            'producto_categoria': producto.categoria.nombre if producto.categoria else '-',
-                            'producto_unidad': producto.unidad_medida.abreviatura if producto.unidad_medida else 'UND',
-                            'total_entregas': 0,
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),
-                            'cantidad_traslado_destino': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-            
-            entregas_qs = DetalleMovimientoCliente.objects.filter(
-                movimiento__in=movimientos_qs
-            ).select_related(
-                'movimiento', 'movimiento__cliente', 'producto',
-                'producto__categoria', 'producto__unidad_medida'
-            )
-            
-            if categoria_id:
-                entregas_qs = entregas_qs.filter(producto__categoria_id=categoria_id)
-            if producto_id:
-                entregas_qs = entregas_qs.filter(producto_id=producto_id)
-            
-            movimientos_procesados = {}
-            
-            for detalle in entregas_qs:
-                mov = detalle.movimiento
-                cant_b = detalle.cantidad or Decimal('0')
-                cant_d = detalle.cantidad_danada or Decimal('0')
-                cant_total = cant_b + cant_d
-                
-                if mov.tipo == 'TRASLADO' and mov.cliente_origen and mov.cliente_destino:
-                    # Cliente origen
-                    key_origen = f"{mov.cliente_origen.id}_{detalle.producto.id}"
-                    
-                    if key_origen not in entregas_dict:
-                        entregas_dict[key_origen] = {
-                            'cliente_nombre': mov.cliente_origen.nombre,
-                            'cliente_codigo': mov.cliente_origen.codigo,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': 0,
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),
-                            'cantidad_traslado_destino': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    mov_key_origen = f"{key_origen}_{mov.id}"
-                    if mov_key_origen not in movimientos_procesados:
-                        entregas_dict[key_origen]['total_entregas'] += 1
-                        movimientos_procesados[mov_key_origen] = True
-                    
-                    entregas_dict[key_origen]['cantidad_traslado_origen'] += cant_total
-                    entregas_dict[key_origen]['stock_bueno'] -= cant_b
-                    entregas_dict[key_origen]['stock_danado'] -= cant_d
-                    
-                    # Cliente destino
-                    key_destino = f"{mov.cliente_destino.id}_{detalle.producto.id}"
-                    
-                    if key_destino not in entregas_dict:
-                        entregas_dict[key_destino] = {
-                            'cliente_nombre': mov.cliente_destino.nombre,
-                            'cliente_codigo': mov.cliente_destino.codigo,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': 0,
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),
-                            'cantidad_traslado_destino': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    mov_key_destino = f"{key_destino}_{mov.id}"
-                    if mov_key_destino not in movimientos_procesados:
-                        entregas_dict[key_destino]['total_entregas'] += 1
-                        movimientos_procesados[mov_key_destino] = True
-                    
-                    entregas_dict[key_destino]['cantidad_traslado_destino'] += cant_total
-                    entregas_dict[key_destino]['stock_bueno'] += cant_b
-                    entregas_dict[key_destino]['stock_danado'] += cant_d
-                    
-                else:
-                    cli_id = mov.cliente.id
-                    key = f"{cli_id}_{detalle.producto.id}"
-                    
-                    if not mostrar_todos and key not in entregas_dict:
-                        entregas_dict[key] = {
-                            'cliente_nombre': mov.cliente.nombre,
-                            'cliente_codigo': mov.cliente.codigo,
-                            'producto_codigo': detalle.producto.codigo,
-                            'producto_nombre': detalle.producto.nombre,
-                            'producto_categoria': detalle.producto.categoria.nombre if detalle.producto.categoria else '-',
-                            'producto_unidad': detalle.producto.unidad_medida.abreviatura if detalle.producto.unidad_medida else 'UND',
-                            'total_entregas': 0,
-                            'cantidad_entrada': Decimal('0'),
-                            'cantidad_salida': Decimal('0'),
-                            'cantidad_traslado_origen': Decimal('0'),
-                            'cantidad_traslado_destino': Decimal('0'),
-                            'stock_bueno': Decimal('0'),
-                            'stock_danado': Decimal('0'),
-                        }
-                    
-                    if key in entregas_dict:
-                        mov_key = f"{key}_{mov.id}"
-                        if mov_key not in movimientos_procesados:
-                            entregas_dict[key]['total_entregas'] += 1
-                            movimientos_procesados[mov_key] = True
-                        
-                        if mov.tipo == 'ENTRADA':
-                            entregas_dict[key]['cantidad_entrada'] += cant_total
-                            entregas_dict[key]['stock_bueno'] += cant_b
-                            entregas_dict[key]['stock_danado'] += cant_d
-                        elif mov.tipo == 'SALIDA':
-                            entregas_dict[key]['cantidad_salida'] += cant_total
-                            entregas_dict[key]['stock_bueno'] -= cant_b
-                            entregas_dict[key]['stock_danado'] -= cant_d
-            
-            for key, item in entregas_dict.items():
-                if cliente_id and str(item.get('cliente_id', '')) != str(cliente_id):
-                    continue
-                item['stock_total'] = item['stock_bueno'] + item['stock_danado']
-                entregas.append(item)
-        
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Entregas"
-        
-        # Estilos
-        header_fill = PatternFill(start_color="2C3E50", end_color="2C3E50", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=11)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Encabezados
-        if vista == 'detallado':
-            headers = ['Cliente', 'Cód. Cliente', 'Cód. Producto', 'Producto', 'Categoría', 
-                    'Unidad', 'Entregas', 'Entrada', 'Salida', 'Trasl. Origen', 
-                    'Trasl. Destino', 'Stock Bueno', 'Stock Dañado', 'Stock Total']
-        elif vista == 'por_cliente':
-            headers = ['Cliente', 'Código', 'Dirección', 'Teléfono', 'Entregas', 
-                    'Productos', 'Cantidad Total']
-        else:
-            headers = ['#', 'Código', 'Producto', 'Categoría', 'Unidad', 'Clientes', 
-                    'Entregas', 'Cantidad Total']
-        
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Datos
-        for row_idx, item in enumerate(entregas, start=2):
-            if vista == 'detallado':
-                row_data = [
-                    item.get('cliente_nombre', ''),
-                    item.get('cliente_codigo', ''),
-                    item.get('producto_codigo', ''),
-                    item.get('producto_nombre', ''),
-                    item.get('producto_categoria', '-'),
-                    item.get('producto_unidad', 'UND'),
-                    item.get('total_entregas', 0),
-                    float(item.get('cantidad_entrada', 0)),
-                    float(item.get('cantidad_salida', 0)),
-                    float(item.get('cantidad_traslado_origen', 0)),
-                    float(item.get('cantidad_traslado_destino', 0)),
-                    float(item.get('stock_bueno', 0)),
-                    float(item.get('stock_danado', 0)),
-                    float(item.get('stock_total', 0)),
-                ]
-            else:
-                row_data = list(item.values())
-            
-            for col, value in enumerate(row_data, start=1):
-                cell = ws.cell(row=row_idx, column=col, value=value)
-                cell.border = border
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Ajustar columnas
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column].width = adjusted_width
-        
-        # Respuesta HTTP
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'entregas_{vista}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        wb.save(response)
-        return response
-
-
-    def exportar_csv(self, request):
-        """Exporta las entregas a CSV"""
-        from django.http import HttpResponse
-        from datetime import datetime
-        import csv
-        from decimal import Decimal
-        
-        # Obtener parámetros de filtro (mismo código que exportar_excel)
-        vista = request.GET.get('vista', 'detallado')
-        fecha_inicio = request.GET.get('fecha_inicio', '')
-        fecha_fin = request.GET.get('fecha_fin', '')
-        cliente_id = request.GET.get('cliente', '')
-        categoria_id = request.GET.get('categoria', '')
-        producto_id = request.GET.get('producto', '')
-        mostrar_todos = request.GET.get('mostrar_todos', '') == '1'
-        
-        # [Aquí va el mismo código de procesamiento que en exportar_excel]
-        # ... (copiar todo el código de procesamiento)
-        
-        # Respuesta HTTP
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        filename = f'entregas_{vista}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        # BOM para Excel
-        response.write('\ufeff')
-        
-        writer = csv.writer(response, delimiter=';')
-        
-        # Encabezados (mismos que en Excel)
-        if vista == 'detallado':
-            headers = ['Cliente', 'Cód. Cliente', 'Cód. Producto', 'Producto', 'Categoría', 
-                    'Unidad', 'Entregas', 'Entrada', 'Salida', 'Trasl. Origen', 
-                    'Trasl. Destino', 'Stock Bueno', 'Stock Dañado', 'Stock Total']
-        elif vista == 'por_cliente':
-            headers = ['Cliente', 'Código', 'Dirección', 'Teléfono', 'Entregas', 
-                    'Productos', 'Cantidad Total']
-        else:
-            headers = ['#', 'Código', 'Producto', 'Categoría', 'Unidad', 'Clientes', 
-                    'Entregas', 'Cantidad Total']
-        
-        writer.writerow(headers)
-        
-        # Datos (mismo formato que Excel)
-        for item in entregas:
-            if vista == 'detallado':
-                row_data = [
-                    item.get('cliente_nombre', ''),
-                    item.get('cliente_codigo', ''),
-                    item.get('producto_codigo', ''),
-                    item.get('producto_nombre', ''),
-                    item.get('producto_categoria', '-'),
-                    item.get('producto_unidad', 'UND'),
-                    item.get('total_entregas', 0),
-                    float(item.get('cantidad_entrada', 0)),
-                    float(item.get('cantidad_salida', 0)),
-                    float(item.get('cantidad_traslado_origen', 0)),
-                    float(item.get('cantidad_traslado_destino', 0)),
-                    float(item.get('stock_bueno', 0)),
-                    float(item.get('stock_danado', 0)),
-                    float(item.get('stock_total', 0)),
-                ]
-            else:
-                row_data = list(item.values())
-            
-            writer.writerow(row_data)
-        
-        return response
 
 
 # ==========================================
@@ -1599,7 +705,9 @@ class ReporteStockAdmin(admin.ModelAdmin):
             'valoracion': valoracion,
             'almacenes': Almacen.objects.filter(activo=True),
             'categorias': Categoria.objects.all(),
-            'productos': Producto.objects.filter(activo=True).order_by('codigo'),
+            'etiquetas_filtro': {
+                'producto': views.etiqueta_opcion('producto', producto_id),
+            },
             'filtros': {
                 'vista': vista,
                 'almacen': almacen_id,
@@ -1624,12 +732,16 @@ class ReporteStockAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             # Exportación
+            # 🚀 OPTIMIZACIÓN: exportaciones sobre StockCache (get_stock_bulk), cacheadas en disco
             path('exportar-excel/',
-                self.admin_site.admin_view(self.exportar_excel),
+                self.admin_site.admin_view(views.exportar_stock_excel, cacheable=True),
                 name='reportes_stock_exportar_excel'),
             path('exportar-csv/',
-                self.admin_site.admin_view(self.exportar_csv),
+                self.admin_site.admin_view(views.exportar_stock_csv, cacheable=True),
                 name='reportes_stock_exportar_csv'),
+            path('exportar-paquete/',
+                self.admin_site.admin_view(views.exportar_stock_paquete),
+                name='reportes_stock_exportar_paquete'),
 
             # ✅ ESTAS SON LAS URLs NECESARIAS PARA LOS MODALES
             path('obtener-detalle-estadistica/',
@@ -1650,327 +762,6 @@ class ReporteStockAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
-    
-    def exportar_excel(self, request):
-        """Exporta el reporte de stock a Excel con todos los datos visibles en la lista"""
-
-        # ==============================
-        # 1. OBTENER FILTROS
-        # ==============================
-        vista = request.GET.get('vista', 'detallado')
-        almacen_id = request.GET.get('almacen', '')
-        categoria_id = request.GET.get('categoria', '')
-        producto_id = request.GET.get('producto', '')
-        stock_minimo = request.GET.get('stock_minimo', '')
-        solo_con_stock = request.GET.get('solo_con_stock', '')
-
-        almacenes = Almacen.objects.filter(activo=True)
-        productos = Producto.objects.filter(activo=True)
-
-        # Filtros
-        if almacen_id:
-            almacenes = almacenes.filter(id=almacen_id)
-        if categoria_id:
-            productos = productos.filter(categoria_id=categoria_id)
-        if producto_id:
-            productos = productos.filter(id=producto_id)
-
-        import decimal
-        stocks = []
-
-        # ==============================
-        # 2. GENERAR DATOS SEGÚN VISTA
-        # ==============================
-
-        # ---------- VISTA DETALLADA ----------
-        if vista == "detallado":
-            for almacen in almacenes:
-                for producto in productos:
-                    stock_data = almacen.get_stock_producto(producto)
-
-                    if solo_con_stock and stock_data["stock_total"] == 0:
-                        continue
-
-                    if stock_minimo and stock_data["stock_bueno"] > producto.stock_minimo:
-                        continue
-
-                    stocks.append({
-                        "almacen": almacen.nombre,
-                        "producto_codigo": producto.codigo,
-                        "producto_nombre": producto.nombre,
-                        "categoria": producto.categoria.nombre if producto.categoria else "-",
-                        "unidad": producto.unidad_medida.abreviatura if producto.unidad_medida else "-",
-                        "entrada": stock_data['entradas_total'],
-                        "salida": stock_data['salidas_total'],
-                        "traslados": stock_data['traslados_netos_total'],
-                        "stock_bueno": stock_data['stock_bueno'],
-                        "stock_danado": stock_data['stock_danado'],
-                        "stock_total": stock_data['stock_total'],
-                    })
-
-        # ---------- VISTA POR ALMACÉN ----------
-        elif vista == "por_almacen":
-            for almacen in almacenes:
-                stock_alm = almacen.get_todos_los_stocks()
-
-                stocks.append({
-                    "almacen": almacen.nombre,
-                    "total_productos": len(stock_alm),
-                    "stock_bueno_total": sum(s['stock_bueno'] for s in stock_alm.values()),
-                    "stock_danado_total": sum(s['stock_danado'] for s in stock_alm.values()),
-                    "stock_total": sum(s['stock_total'] for s in stock_alm.values()),
-                })
-
-        # ---------- VISTA POR PRODUCTO ----------
-        else:
-            for producto in productos:
-                total_bueno = 0
-                total_danado = 0
-                total_almacenes = 0
-
-                for almacen in Almacen.objects.filter(activo=True):
-                    stock_data = almacen.get_stock_producto(producto)
-                    if stock_data['stock_total'] != 0:
-                        total_bueno += stock_data['stock_bueno']
-                        total_danado += stock_data['stock_danado']
-                        total_almacenes += 1
-
-                stocks.append({
-                    "producto_codigo": producto.codigo,
-                    "producto_nombre": producto.nombre,
-                    "categoria": producto.categoria.nombre if producto.categoria else "-",
-                    "unidad": producto.unidad_medida.abreviatura if producto.unidad_medida else "-",
-                    "total_almacenes": total_almacenes,
-                    "stock_bueno_total": total_bueno,
-                    "stock_danado_total": total_danado,
-                    "stock_total": total_bueno + total_danado,
-                })
-
-        # ==============================
-        # 3. CREAR EXCEL
-        # ==============================
-        from django.http import HttpResponse
-        from datetime import datetime
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
-
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        filename = f"reporte_stock_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Reporte Stock"
-
-        # ==============================
-        # 4. ENCABEZADOS DINÁMICOS
-        # ==============================
-
-        if vista == "detallado":
-            headers = [
-                "Almacén", "Código", "Producto", "Categoría", "Unidad",
-                "Entradas", "Salidas", "Traslados",
-                "Stock Bueno", "Stock Dañado", "Stock Total"
-            ]
-        elif vista == "por_almacen":
-            headers = [
-                "Almacén", "Total Productos", 
-                "Stock Bueno Total", "Stock Dañado Total", "Stock Total"
-            ]
-        else:
-            headers = [
-                "Código", "Producto", "Categoría", "Unidad",
-                "Almacenes con Stock", "Stock Bueno Total",
-                "Stock Dañado Total", "Stock Total"
-            ]
-
-        ws.append(headers)
-
-        # Estilo encabezados
-        header_fill = PatternFill(start_color="1E88E5", end_color="1E88E5", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        border = Border(
-            left=Side(border_style="thin", color="000000"),
-            right=Side(border_style="thin", color="000000"),
-            top=Side(border_style="thin", color="000000"),
-            bottom=Side(border_style="thin", color="000000"),
-        )
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.border = border
-            cell.alignment = Alignment(horizontal="center")
-
-        # ==============================
-        # 5. AGREGAR DATOS
-        # ==============================
-        for item in stocks:
-            ws.append(list(item.values()))
-
-        # ==============================
-        # 6. AJUSTAR ANCHO COLUMNAS
-        # ==============================
-        for col in ws.columns:
-            max_length = max(len(str(cell.value)) for cell in col)
-            ws.column_dimensions[get_column_letter(col[0].column)].width = max_length + 2
-
-        # ==============================
-        # 7. FILTRO AUTOMÁTICO
-        # ==============================
-        ws.auto_filter.ref = ws.dimensions
-
-        # ==============================
-        # 8. GUARDAR
-        # ==============================
-        wb.save(response)
-        return response
-
-    def exportar_csv(self, request):
-        """Exporta el reporte de stock a CSV con los mismos filtros que Excel."""
-
-        import csv
-        from django.http import HttpResponse
-        from datetime import datetime
-        from decimal import Decimal
-
-        # ==============================
-        # 1. OBTENER FILTROS
-        # ==============================
-        vista = request.GET.get('vista', 'detallado')
-        almacen_id = request.GET.get('almacen', '')
-        categoria_id = request.GET.get('categoria', '')
-        producto_id = request.GET.get('producto', '')
-        stock_minimo = request.GET.get('stock_minimo', '')
-        solo_con_stock = request.GET.get('solo_con_stock', '')
-
-        almacenes = Almacen.objects.filter(activo=True)
-        productos = Producto.objects.filter(activo=True)
-
-        # Filtros
-        if almacen_id:
-            almacenes = almacenes.filter(id=almacen_id)
-        if categoria_id:
-            productos = productos.filter(categoria_id=categoria_id)
-        if producto_id:
-            productos = productos.filter(id=producto_id)
-
-        stocks = []
-
-        # ==============================
-        # 2. GENERAR DATOS SEGÚN VISTA
-        # ==============================
-
-        # ---------- VISTA DETALLADA ----------
-        if vista == "detallado":
-            for almacen in almacenes:
-                for producto in productos:
-                    stock_data = almacen.get_stock_producto(producto)
-
-                    if solo_con_stock and stock_data["stock_total"] == 0:
-                        continue
-
-                    if stock_minimo and stock_data["stock_bueno"] > producto.stock_minimo:
-                        continue
-
-                    stocks.append({
-                        "almacen": almacen.nombre,
-                        "producto_codigo": producto.codigo,
-                        "producto_nombre": producto.nombre,
-                        "categoria": producto.categoria.nombre if producto.categoria else "-",
-                        "unidad": producto.unidad_medida.abreviatura if producto.unidad_medida else "-",
-                        "entrada": stock_data['entradas_total'],
-                        "salida": stock_data['salidas_total'],
-                        "traslados": stock_data['traslados_netos_total'],
-                        "stock_bueno": stock_data['stock_bueno'],
-                        "stock_danado": stock_data['stock_danado'],
-                        "stock_total": stock_data['stock_total'],
-                    })
-
-        # ---------- VISTA POR ALMACÉN ----------
-        elif vista == "por_almacen":
-            for almacen in almacenes:
-                stock_alm = almacen.get_todos_los_stocks()
-
-                stocks.append({
-                    "almacen": almacen.nombre,
-                    "total_productos": len(stock_alm),
-                    "stock_bueno_total": sum(s['stock_bueno'] for s in stock_alm.values()),
-                    "stock_danado_total": sum(s['stock_danado'] for s in stock_alm.values()),
-                    "stock_total": sum(s['stock_total'] for s in stock_alm.values()),
-                })
-
-        # ---------- VISTA POR PRODUCTO ----------
-        else:
-            for producto in productos:
-                total_bueno = 0
-                total_danado = 0
-                total_almacenes = 0
-
-                for almacen in Almacen.objects.filter(activo=True):
-                    stock_data = almacen.get_stock_producto(producto)
-                    if stock_data['stock_total'] != 0:
-                        total_bueno += stock_data['stock_bueno']
-                        total_danado += stock_data['stock_danado']
-                        total_almacenes += 1
-
-                stocks.append({
-                    "producto_codigo": producto.codigo,
-                    "producto_nombre": producto.nombre,
-                    "categoria": producto.categoria.nombre if producto.categoria else "-",
-                    "unidad": producto.unidad_medida.abreviatura if producto.unidad_medida else "-",
-                    "total_almacenes": total_almacenes,
-                    "stock_bueno_total": total_bueno,
-                    "stock_danado_total": total_danado,
-                    "stock_total": total_bueno + total_danado,
-                })
-
-        # ==============================
-        # 3. PREPARAR RESPUESTA CSV
-        # ==============================
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        filename = f"reporte_stock_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.write('\ufeff')  # BOM UTF-8
-
-        writer = csv.writer(response, delimiter=';')
-
-        # ==============================
-        # 4. ENCABEZADOS
-        # ==============================
-
-        if vista == "detallado":
-            headers = [
-                "Almacén", "Código", "Producto", "Categoría", "Unidad",
-                "Entradas", "Salidas", "Traslados",
-                "Stock Bueno", "Stock Dañado", "Stock Total"
-            ]
-        elif vista == "por_almacen":
-            headers = [
-                "Almacén", "Total Productos",
-                "Stock Bueno Total", "Stock Dañado Total", "Stock Total"
-            ]
-        else:
-            headers = [
-                "Código", "Producto", "Categoría", "Unidad",
-                "Almacenes con Stock", "Stock Bueno Total",
-                "Stock Dañado Total", "Stock Total"
-            ]
-
-        writer.writerow(headers)
-
-        # ==============================
-        # 5. ESCRIBIR FILAS
-        # ==============================
-        for item in stocks:
-            writer.writerow(list(item.values()))
-
-        return response
-
 # ==============================================================================
 # REPORTE DE STOCK REAL - ALMACENES (considera clientes)
 # ==============================================================================
@@ -2221,7 +1012,9 @@ class ReporteStockRealAdmin(admin.ModelAdmin):
             'valoracion': valoracion,
             'almacenes': Almacen.objects.filter(activo=True),
             'categorias': Categoria.objects.all(),
-            'productos': Producto.objects.filter(activo=True).order_by('codigo'),
+            'etiquetas_filtro': {
+                'producto': views.etiqueta_opcion('producto', producto_id),
+            },
             'filtros': {
                 'vista': vista,
                 'almacen': almacen_id,
@@ -2258,10 +1051,10 @@ class ReporteStockRealAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(views.obtener_detalle_estadistica_real),
                 name='reportes_stockreal_obtener_estadistica'),
             path('exportar-excel/',
-                self.admin_site.admin_view(views.exportar_stock_real_excel),
+                self.admin_site.admin_view(views.exportar_stock_real_excel, cacheable=True),
                 name='reportes_stockreal_exportar_excel'),
             path('exportar-csv/',
-                self.admin_site.admin_view(views.exportar_stock_real_csv),
+                self.admin_site.admin_view(views.exportar_stock_real_csv, cacheable=True),
                 name='reportes_stockreal_exportar_csv'),
         ]
         return custom_urls + urls
@@ -2270,4 +1063,127 @@ class ReporteStockRealAdmin(admin.ModelAdmin):
 admin.site.register(ReporteMovimiento, ReporteMovimientoAdmin)
 admin.site.register(ReporteStock, ReporteStockAdmin)
 admin.site.register(ReporteStockReal, ReporteStockRealAdmin)
-admin.site.register(ReporteEntregas, ReporteEntregasAdmin)
\ No newline at end of file
+admin.site.register(ReporteEntregas, ReporteEntregasAdmin)
+
+
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    """
+    Exportaciones en segundo plano: se encolan desde los reportes, las procesa
+    el comando procesar_exportaciones y se descargan desde aquí.
+    """
+    list_display = ('id', 'tipo', 'estado_display', 'usuario', 'fecha_creacion', 'fecha_fin', 'acciones')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('tipo', 'parametros', 'estado', 'progreso', 'archivo', 'tamano', 'error',
+                       'usuario', 'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'intentos')
+    list_select_related = ('usuario',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if not request.user.is_superuser:
+            qs = qs.filter(usuario=request.user)
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_('Estado'), ordering='estado')
+    def estado_display(self, obj):
+        # Sin porcentaje mientras procesa: el total de filas no se conoce hasta terminar
+        if obj.estado == 'PROCESANDO' and obj.intentos > 1:
+            return f"{obj.get_estado_display()} (intento {obj.intentos})"
+        return obj.get_estado_display()
+
+    @admin.display(description=_('Acciones'))
+    def acciones(self, obj):
+        if obj.estado == 'COMPLETADO' and obj.archivo:
+            return format_html(
+                '<a href="{}">⬇️ Descargar</a>',
+                reverse('admin:reportes_trabajoexportacion_descargar', args=[obj.pk])
+            )
+        return format_html(
+            '<a href="{}">Ver progreso</a>',
+            reverse('admin:reportes_trabajoexportacion_estado', args=[obj.pk])
+        )
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('encolar/',
+                self.admin_site.admin_view(self.encolar_view),
+                name='reportes_trabajoexportacion_encolar'),
+            path('<int:pk>/estado/',
+                self.admin_site.admin_view(self.estado_view),
+                name='reportes_trabajoexportacion_estado'),
+            path('<int:pk>/progreso/',
+                self.admin_site.admin_view(self.progreso_view),
+                name='reportes_trabajoexportacion_progreso'),
+            path('<int:pk>/descargar/',
+                self.admin_site.admin_view(self.descargar_view),
+                name='reportes_trabajoexportacion_descargar'),
+        ]
+        return custom_urls + urls
+
+    def _obtener_trabajo(self, request, pk):
+        return get_object_or_404(self.get_queryset(request), pk=pk)
+
+    def encolar_view(self, request):
+        """
+        Crea un trabajo con los filtros actuales del reporte (POST a ?tipo=...&filtros...).
+        Solo POST: crear el trabajo es un cambio de estado y necesita la protección CSRF.
+        """
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+
+        tipo = request.GET.get('tipo', '')
+        if tipo not in dict(TrabajoExportacion.TIPOS):
+            raise Http404(_('Tipo de exportación desconocido'))
+
+        parametros = {
+            clave: valores if len(valores) > 1 else valores[0]
+            for clave, valores in request.GET.lists()
+            if clave != 'tipo'
+        }
+        trabajo = TrabajoExportacion.objects.create(
+            tipo=tipo,
+            parametros=parametros,
+            usuario=request.user
+        )
+        return redirect('admin:reportes_trabajoexportacion_estado', pk=trabajo.pk)
+
+    def estado_view(self, request, pk):
+        trabajo = self._obtener_trabajo(request, pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': str(trabajo),
+            'opts': self.model._meta,
+            'trabajo': trabajo,
+        }
+        return render(request, 'admin/reportes/trabajo_exportacion_estado.html', context)
+
+    def progreso_view(self, request, pk):
+        """Estado en JSON para el sondeo de la página de progreso"""
+        trabajo = self._obtener_trabajo(request, pk)
+        return JsonResponse({
+            'estado': trabajo.estado,
+            'estado_display': trabajo.get_estado_display(),
+            'progreso': trabajo.progreso,
+            'terminado': trabajo.terminado,
+            'error': trabajo.error,
+            'url_descarga': (
+                reverse('admin:reportes_trabajoexportacion_descargar', args=[trabajo.pk])
+                if trabajo.estado == 'COMPLETADO' and trabajo.archivo else None
+            ),
+        })
+
+    def descargar_view(self, request, pk):
+        trabajo = self._obtener_trabajo(request, pk)
+        if trabajo.estado != 'COMPLETADO' or not trabajo.archivo:
+            raise Http404(_('La exportación todavía no está lista'))
+        nombre = trabajo.archivo.name.rsplit('/', 1)[-1]
+        return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=nombre)
+
+
+admin.site.register(TrabajoExportacion, TrabajoExportacionAdmin)
@@ -12,4 +12,5 @@ class ReportesConfig(AppConfig):
         Código que se ejecuta cuando la app está lista
         Aquí puedes importar señales u otra lógica de inicialización
         """
-        pass
\ No newline at end of file
+        # Señales que mantienen el rollup mensual de movimientos
+        import reportes.signals
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""
+Cache en disco de archivos exportados, direccionada por contenido.
+
+La clave es un hash de (exportación, parámetros GET normalizados, versión de
+los datos: movimientos, productos y catálogos). Una descarga repetida con los
+mismos filtros y sin cambios en los datos se sirve desde disco con
+ETag/Last-Modified (304 si el navegador ya la tiene). Las rutas del admin que
+la usan se registran con admin_view(..., cacheable=True): sin never_cache, que
+impediría las peticiones condicionales. Los archivos menos usados se eliminan
+al superar el tamaño máximo.
+
+En un fallo de cache las respuestas por streaming se envían al cliente a la vez
+que se copian a un temporal; la entrada se confirma solo si el stream termina.
+
+Los PDF de movimientos (guías) usan el mismo almacenamiento con una clave por
+movimiento: id + fecha_actualizacion de la cabecera (se actualiza también al
+editar sus detalles) + última modificación de sus productos + versiones de
+productos y catálogos (nombres de almacenes, cliente, proveedor, etc.). El pie
+del PDF muestra la fecha del movimiento, no la de generación.
+
+Ajustes opcionales en settings:
+    EXPORT_CACHE_DIR        (por defecto MEDIA_ROOT/cache_exportaciones)
+    EXPORT_CACHE_MAX_BYTES  (por defecto 500 MB)
+"""
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+TAMANO_MAXIMO_POR_DEFECTO = 500 * 1024 * 1024
+
+
+def _directorio():
+    directorio = getattr(settings, 'EXPORT_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'cache_exportaciones')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def version_datos(nombres=None):
+    """
+    Versiones de movimientos, productos y catálogos (almacenes, clientes,
+    proveedores, recepcionistas, categorías), o solo de `nombres`, en una sola consulta
+    """
+    from .models import VersionDatos
+
+    nombres = nombres or (VersionDatos.MOVIMIENTOS, VersionDatos.PRODUCTOS, VersionDatos.CATALOGOS)
+    versiones = dict(VersionDatos.objects.filter(nombre__in=nombres).values_list('nombre', 'version'))
+    return ':'.join(str(versiones.get(nombre, 0)) for nombre in nombres)
+
+
+def clave_exportacion(nombre, request):
+    """Hash de la exportación, sus filtros (sin vacíos ni orden) y la versión de los datos"""
+    parametros = sorted(
+        (clave, sorted(v for v in valores if v != ''))
+        for clave, valores in request.GET.lists()
+        if any(v != '' for v in valores)
+    )
+    contenido = json.dumps([nombre, parametros, version_datos()], sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def clave_pdf_movimiento(movimiento):
+    """
+    Hash del PDF de un movimiento; cambia con cualquier edición de la cabecera,
+    sus detalles o sus productos, y con los catálogos que imprime (almacenes,
+    cliente, proveedor, recepcionista y unidades), que no tienen fecha de
+    modificación propia: se usan las versiones PRODUCTOS y CATALOGOS.
+    """
+    from .models import VersionDatos
+
+    ultimo_producto = movimiento.detalles.aggregate(
+        ultimo=Max('producto__fecha_actualizacion')
+    )['ultimo']
+    versiones = version_datos((VersionDatos.PRODUCTOS, VersionDatos.CATALOGOS))
+    contenido = json.dumps(
+        ['pdf', movimiento._meta.label, movimiento.pk, movimiento.fecha_actualizacion, ultimo_producto, versiones],
+        default=str
+    )
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _rutas(clave):
+    base = os.path.join(_directorio(), clave[:2])
+    return os.path.join(base, clave), os.path.join(base, f'{clave}.json')
+
+
+def _metadatos(response):
+    return {
+        'content_type': response.get('Content-Type', 'application/octet-stream'),
+        'content_disposition': response.get('Content-Disposition', ''),
+        'creado': time.time(),
+    }
+
+
+def _escribir_meta(ruta_meta, meta):
+    with open(ruta_meta, 'w') as f:
+        json.dump(meta, f)
+
+
+def _guardar(clave, response):
+    """Escribe una respuesta no streaming en la cache (escritura atómica); retorna los metadatos"""
+    ruta, ruta_meta = _rutas(clave)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta))
+    try:
+        with os.fdopen(fd, 'wb') as salida:
+            salida.write(response.content)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    finally:
+        response.close()
+
+    meta = _metadatos(response)
+    _escribir_meta(ruta_meta, meta)
+    return meta
+
+
+def _respuesta_con_copia(clave, response):
+    """
+    Respuesta por streaming que se envía al cliente mientras se copia a un
+    temporal: el primer byte sale sin esperar al archivo completo. La entrada
+    de cache se confirma al terminar el stream; si se corta, se descarta.
+    """
+    ruta, ruta_meta = _rutas(clave)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    meta = _metadatos(response)
+    contenido = response.streaming_content
+
+    def copiar():
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        completo = False
+        try:
+            with os.fdopen(fd, 'wb') as salida:
+                for bloque in contenido:
+                    salida.write(bloque)
+                    yield bloque
+            os.replace(temporal, ruta)
+            _escribir_meta(ruta_meta, meta)
+            completo = True
+        finally:
+            if not completo:
+                try:
+                    os.unlink(temporal)
+                except OSError:
+                    pass
+        desalojar()
+
+    response.streaming_content = copiar()
+    response['ETag'] = f'"{clave}"'
+    response['Last-Modified'] = http_date(int(meta['creado']))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _leer_meta(clave):
+    ruta, ruta_meta = _rutas(clave)
+    if not (os.path.exists(ruta) and os.path.exists(ruta_meta)):
+        return None
+    try:
+        with open(ruta_meta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def desalojar(tamano_maximo=None):
+    """Elimina los archivos usados hace más tiempo hasta quedar bajo el límite (LRU por mtime)"""
+    tamano_maximo = tamano_maximo or getattr(settings, 'EXPORT_CACHE_MAX_BYTES', TAMANO_MAXIMO_POR_DEFECTO)
+    archivos = []
+    total = 0
+    for raiz, _, nombres in os.walk(_directorio()):
+        for nombre in nombres:
+            if nombre.endswith('.json'):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, ruta))
+            total += estado.st_size
+
+    if total <= tamano_maximo:
+        return 0
+
+    eliminados = 0
+    for _, tamano, ruta in sorted(archivos):
+        if total <= tamano_maximo * 0.9:
+            break
+        for archivo in (ruta, f'{ruta}.json'):
+            try:
+                os.unlink(archivo)
+            except OSError:
+                pass
+        total -= tamano
+        eliminados += 1
+    return eliminados
+
+
+def _respuesta_desde_cache(request, clave, meta):
+    ruta, _ = _rutas(clave)
+    etag = f'"{clave}"'
+    ultima_modificacion = int(meta['creado'])
+
+    # Marca de uso para el desalojo LRU
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+
+    respuesta_condicional = get_conditional_response(
+        request, etag=etag, last_modified=ultima_modificacion
+    )
+    if respuesta_condicional is not None:
+        return respuesta_condicional
+
+    response = FileResponse(open(ruta, 'rb'), content_type=meta['content_type'])
+    if meta['content_disposition']:
+        response['Content-Disposition'] = meta['content_disposition']
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacion)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def respuesta_cacheada(request, clave, generar):
+    """
+    Sirve el archivo de `clave` desde disco; si no existe llama a generar()
+    (callable que retorna la respuesta) y guarda el resultado.
+    """
+    meta = _leer_meta(clave)
+
+    if meta is None:
+        response = generar()
+        if response.status_code != 200:
+            return response
+        if response.streaming:
+            return _respuesta_con_copia(clave, response)
+        meta = _guardar(clave, response)
+        response = _respuesta_desde_cache(request, clave, meta)
+        # El archivo recién servido ya está abierto: desalojar no lo afecta
+        desalojar()
+        return response
+
+    return _respuesta_desde_cache(request, clave, meta)
+
+
+def cachear_exportacion(nombre):
+    """
+    Decorador para vistas de exportación (GET). Genera el archivo una sola vez
+    por combinación de filtros y versión de datos; las repeticiones se sirven
+    desde disco.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method != 'GET':
+                return vista(request, *args, **kwargs)
+
+            return respuesta_cacheada(
+                request,
+                clave_exportacion(nombre, request),
+                lambda: vista(request, *args, **kwargs)
+            )
+        return envoltura
+    return decorador
@@ -0,0 +1,145 @@
+"""
+Exportación columnar (Parquet / Arrow IPC) del libro de movimientos.
+
+Una fila por detalle de movimiento (almacén y cliente) con los campos de la
+cabecera desnormalizados. Se escribe por grupos de filas leídos con cursor del
+lado del servidor, así la memoria depende del tamaño del grupo y no del total.
+
+Requiere pyarrow (dependencia opcional: pip install pyarrow).
+"""
+from almacenes.models import DetalleMovimientoAlmacen
+from beneficiarios.models import DetalleMovimientoCliente
+
+FILAS_POR_GRUPO = 50000
+CHUNK_CURSOR = 5000
+
+FORMATOS = ('parquet', 'arrow')
+
+# (columna, lookup en el detalle); None = columna que no aplica a ese origen
+CAMPOS_ALMACEN = (
+    ('detalle_id', 'id'),
+    ('movimiento_id', 'movimiento_id'),
+    ('numero_movimiento', 'movimiento__numero_movimiento'),
+    ('tipo', 'movimiento__tipo'),
+    ('fecha', 'movimiento__fecha'),
+    ('almacen_origen_id', 'movimiento__almacen_origen_id'),
+    ('almacen_origen', 'movimiento__almacen_origen__nombre'),
+    ('almacen_destino_id', 'movimiento__almacen_destino_id'),
+    ('almacen_destino', 'movimiento__almacen_destino__nombre'),
+    ('cliente_id', None),
+    ('cliente', None),
+    ('proveedor_id', 'movimiento__proveedor_id'),
+    ('proveedor', 'movimiento__proveedor__nombre'),
+    ('recepcionista_id', 'movimiento__recepcionista_id'),
+    ('recepcionista', 'movimiento__recepcionista__nombre'),
+    ('producto_id', 'producto_id'),
+    ('producto_codigo', 'producto__codigo'),
+    ('producto_nombre', 'producto__nombre'),
+    ('unidad', 'producto__unidad_medida__abreviatura'),
+    ('cantidad', 'cantidad'),
+    ('cantidad_danada', 'cantidad_danada'),
+)
+
+CAMPOS_CLIENTE = tuple(
+    (columna, {'cliente_id': 'movimiento__cliente_id', 'cliente': 'movimiento__cliente__nombre'}.get(columna, lookup))
+    for columna, lookup in CAMPOS_ALMACEN
+)
+
+ORIGENES = (
+    ('ALMACEN', DetalleMovimientoAlmacen, CAMPOS_ALMACEN),
+    ('CLIENTE', DetalleMovimientoCliente, CAMPOS_CLIENTE),
+)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            'La exportación columnar requiere pyarrow. Instálelo con: pip install pyarrow'
+        )
+    return pyarrow
+
+
+def esquema_libro():
+    pa = _pyarrow()
+    texto, entero = pa.string(), pa.int64()
+    cantidad = pa.decimal128(10, 2)
+    tipos = {
+        'fecha': pa.date32(),
+        'cantidad': cantidad,
+        'cantidad_danada': cantidad,
+    }
+    columnas = [pa.field('source', texto, nullable=False)]
+    for columna, _ in CAMPOS_ALMACEN:
+        tipo = tipos.get(columna, entero if columna.endswith('_id') else texto)
+        columnas.append(pa.field(columna, tipo))
+    return pa.schema(columnas)
+
+
+def escribir_libro_movimientos(destino, formato='parquet', marcas=None, filas_por_grupo=FILAS_POR_GRUPO):
+    """
+    Escribe el libro de movimientos en `destino` (ruta o archivo binario).
+
+    marcas: {'ALMACEN': ultimo_id, 'CLIENTE': ultimo_id} para exportar solo los
+    detalles posteriores (modo incremental); None exporta todo.
+    Retorna (total_filas, nuevas_marcas).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}')
+
+    pa = _pyarrow()
+    esquema = esquema_libro()
+    marcas = marcas or {}
+    nuevas_marcas = dict(marcas)
+    total = 0
+
+    if formato == 'parquet':
+        escritor = pa.parquet.ParquetWriter(destino, esquema, compression='zstd')
+        escribir = escritor.write_table
+    else:
+        escritor = pa.ipc.new_file(destino, esquema)
+        escribir = escritor.write_table
+
+    try:
+        for source, modelo, campos in ORIGENES:
+            lookups = [lookup for _, lookup in campos if lookup]
+            posiciones = {lookup: i for i, lookup in enumerate(lookups)}
+
+            detalles = modelo.objects.order_by('id')
+            if marcas.get(source):
+                detalles = detalles.filter(id__gt=marcas[source])
+
+            grupo = []
+
+            def volcar():
+                columnas = [[source] * len(grupo)]
+                for _, lookup in campos:
+                    if lookup is None:
+                        columnas.append([None] * len(grupo))
+                    else:
+                        i = posiciones[lookup]
+                        columnas.append([fila[i] for fila in grupo])
+                escribir(pa.Table.from_arrays(
+                    [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                    schema=esquema
+                ))
+
+            for fila in detalles.values_list(*lookups).iterator(chunk_size=CHUNK_CURSOR):
+                grupo.append(fila)
+                if len(grupo) >= filas_por_grupo:
+                    volcar()
+                    total += len(grupo)
+                    nuevas_marcas[source] = grupo[-1][0]
+                    grupo = []
+
+            if grupo:
+                volcar()
+                total += len(grupo)
+                nuevas_marcas[source] = grupo[-1][0]
+    finally:
+        escritor.close()
+
+    return total, nuevas_marcas
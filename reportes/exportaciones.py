@@ -0,0 +1,187 @@
+"""
+Ejecución de exportaciones en segundo plano.
+
+Cada tipo de TrabajoExportacion se resuelve a la misma vista que atiende la
+descarga directa; el worker la invoca con los parámetros guardados y vuelca
+la respuesta a un archivo en MEDIA_ROOT/exportaciones/.
+
+Mientras un trabajo está PROCESANDO no se conoce el total de filas (las vistas
+escriben por streaming), así que no se reporta un porcentaje: la página de
+progreso muestra una barra indeterminada hasta que termina.
+
+Si un worker muere a mitad de un trabajo, este queda PROCESANDO; pasado
+EXPORTACIONES_TIEMPO_MAXIMO (segundos, por defecto TIEMPO_MAXIMO_POR_DEFECTO)
+tomar_siguiente() lo devuelve a la cola, hasta MAX_INTENTOS veces.
+
+Los trabajos terminados (COMPLETADO o ERROR) y sus archivos se eliminan pasados
+EXPORTACIONES_DIAS_RETENCION días (por defecto DIAS_RETENCION_POR_DEFECTO);
+el comando procesar_exportaciones llama a purgar_terminados() periódicamente.
+"""
+import logging
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from .models import TrabajoExportacion
+
+logger = logging.getLogger(__name__)
+
+TIEMPO_MAXIMO_POR_DEFECTO = 2 * 60 * 60
+MAX_INTENTOS = 3
+DIAS_RETENCION_POR_DEFECTO = 7
+
+
+def _exportador(tipo):
+    """Retorna la vista (callable que recibe un request) para un tipo de trabajo"""
+    from . import views
+
+    if tipo == 'movimientos_excel':
+        return views.exportar_movimientos_excel
+    if tipo == 'movimientos_csv':
+        return views.exportar_movimientos_csv
+    if tipo == 'stock_real_excel':
+        return views.exportar_stock_real_excel
+    if tipo == 'entregas_excel':
+        return views.exportar_entregas_excel
+    if tipo == 'libro_parquet':
+        return views.exportar_libro_movimientos_parquet
+    if tipo in ('pdf_lote_almacen', 'pdf_lote_cliente'):
+        fuente = tipo.rsplit('_', 1)[1]
+        return lambda request: views.exportar_movimientos_lote(request, fuente)
+    if tipo == 'productos_excel':
+        from productos.views import exportar_productos
+        return exportar_productos
+    raise ValueError(f"Tipo de exportación desconocido: {tipo}")
+
+
+def _construir_request(trabajo):
+    """Request GET equivalente al que originó el trabajo"""
+    request = HttpRequest()
+    request.method = 'GET'
+    request.user = trabajo.usuario
+    request.GET = QueryDict(mutable=True)
+    for clave, valor in trabajo.parametros.items():
+        request.GET.setlist(clave, valor if isinstance(valor, list) else [valor])
+    return request
+
+
+def _nombre_archivo(response, trabajo):
+    disposicion = response.get('Content-Disposition', '')
+    encontrado = re.search(r'filename="?([^";]+)"?', disposicion)
+    if encontrado:
+        return encontrado.group(1)
+    return f'exportacion_{trabajo.pk}'
+
+
+def ejecutar_trabajo(trabajo):
+    """
+    Genera el archivo de un trabajo ya marcado como PROCESANDO.
+    Actualiza archivo y estado; los errores quedan registrados en el trabajo.
+    """
+    def actualizar(**campos):
+        for campo, valor in campos.items():
+            setattr(trabajo, campo, valor)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(**campos)
+
+    # El usuario se guarda con SET_NULL: sin él no hay permisos con qué ejecutar la vista
+    usuario = trabajo.usuario
+    if usuario is None or not (usuario.is_active and usuario.is_staff):
+        actualizar(
+            estado='ERROR',
+            error="El usuario que solicitó la exportación ya no existe o no tiene acceso al admin",
+            fecha_fin=timezone.now(),
+        )
+        return trabajo
+
+    try:
+        response = _exportador(trabajo.tipo)(_construir_request(trabajo))
+
+        if response.status_code != 200:
+            raise RuntimeError(f"La exportación respondió con estado {response.status_code}")
+
+        with tempfile.TemporaryFile() as salida:
+            if response.streaming:
+                for bloque in response.streaming_content:
+                    salida.write(bloque)
+            else:
+                salida.write(response.content)
+            response.close()
+
+            tamano = salida.tell()
+            salida.seek(0)
+            trabajo.archivo.save(_nombre_archivo(response, trabajo), File(salida), save=False)
+
+        actualizar(
+            archivo=trabajo.archivo.name,
+            tamano=tamano,
+            estado='COMPLETADO',
+            progreso=100,
+            fecha_fin=timezone.now(),
+        )
+    except Exception as e:
+        logger.exception('Falló la exportación #%s (%s)', trabajo.pk, trabajo.tipo)
+        actualizar(estado='ERROR', error=str(e), fecha_fin=timezone.now())
+
+    return trabajo
+
+
+def reencolar_abandonados():
+    """
+    Devuelve a PENDIENTE los trabajos PROCESANDO desde hace más del tiempo máximo
+    (su worker murió o se reinició); los que ya agotaron MAX_INTENTOS pasan a ERROR
+    para que un trabajo que tumba al worker no se reintente sin fin.
+    """
+    segundos = getattr(settings, 'EXPORTACIONES_TIEMPO_MAXIMO', TIEMPO_MAXIMO_POR_DEFECTO)
+    ahora = timezone.now()
+    abandonados = TrabajoExportacion.objects.filter(
+        estado='PROCESANDO', fecha_inicio__lt=ahora - timedelta(seconds=segundos)
+    )
+    abandonados.filter(intentos__gte=MAX_INTENTOS).update(
+        estado='ERROR',
+        error=f"La exportación no terminó tras {MAX_INTENTOS} intentos",
+        fecha_fin=ahora,
+    )
+    abandonados.filter(intentos__lt=MAX_INTENTOS).update(estado='PENDIENTE', fecha_inicio=None)
+
+
+def tomar_siguiente():
+    """
+    Reserva el trabajo pendiente más antiguo. La reserva es un UPDATE condicional,
+    así varios workers pueden sondear la misma tabla sin tomar dos veces un trabajo.
+    """
+    reencolar_abandonados()
+    pendientes = TrabajoExportacion.objects.filter(estado='PENDIENTE').order_by('fecha_creacion')
+    for pk in pendientes.values_list('pk', flat=True)[:10]:
+        reservado = TrabajoExportacion.objects.filter(pk=pk, estado='PENDIENTE').update(
+            estado='PROCESANDO', fecha_inicio=timezone.now(), intentos=F('intentos') + 1
+        )
+        if reservado:
+            return TrabajoExportacion.objects.select_related('usuario').get(pk=pk)
+    return None
+
+
+def purgar_terminados(dias=None):
+    """Elimina los trabajos terminados hace más de `dias` días y sus archivos; retorna cuántos"""
+    if dias is None:
+        dias = getattr(settings, 'EXPORTACIONES_DIAS_RETENCION', DIAS_RETENCION_POR_DEFECTO)
+    antiguos = TrabajoExportacion.objects.filter(
+        estado__in=('COMPLETADO', 'ERROR'),
+        fecha_fin__lt=timezone.now() - timedelta(days=dias),
+    )
+    eliminados = 0
+    for trabajo in antiguos.only('pk', 'archivo').iterator():
+        if trabajo.archivo:
+            try:
+                trabajo.archivo.delete(save=False)
+            except OSError:
+                logger.exception('No se pudo eliminar el archivo de la exportación #%s', trabajo.pk)
+                continue
+        trabajo.delete()
+        eliminados += 1
+    return eliminados
@@ -0,0 +1,58 @@
+from django import forms
+from django.utils import timezone
+
+from .importacion_movimientos import TIPOS
+
+
+class ImportacionMovimientosForm(forms.Form):
+    """Archivo Excel + cabecera común de los movimientos a importar"""
+
+    archivo = forms.FileField(label='* Archivo Excel (.xlsx)')
+    tipo = forms.ChoiceField(label='* Tipo de Movimiento')
+    fecha = forms.DateField(
+        label='* Fecha',
+        initial=timezone.localdate,
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    almacen_origen = forms.ModelChoiceField(queryset=None, required=False, label='Almacén Origen')
+    almacen_destino = forms.ModelChoiceField(queryset=None, required=False, label='Almacén Destino')
+    proveedor = forms.ModelChoiceField(queryset=None, required=False, label='Proveedor/Transp.')
+    recepcionista = forms.ModelChoiceField(queryset=None, required=False, label='Recepcionista')
+    observaciones_movimiento = forms.CharField(
+        label='Observaciones del Movimiento',
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 3})
+    )
+
+    def __init__(self, fuente, *args, **kwargs):
+        from almacenes.models import Almacen
+        from proveedores.models import Proveedor
+        from recepcionistas.models import Recepcionista
+
+        super().__init__(*args, **kwargs)
+        self.fuente = fuente
+        self.fields['tipo'].choices = [(tipo, tipo.capitalize()) for tipo in TIPOS[fuente]]
+        almacenes = Almacen.objects.filter(activo=True).order_by('nombre')
+        self.fields['almacen_origen'].queryset = almacenes
+        self.fields['almacen_destino'].queryset = almacenes
+        self.fields['proveedor'].queryset = Proveedor.objects.order_by('nombre')
+        self.fields['recepcionista'].queryset = Recepcionista.objects.order_by('nombre')
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith('.xlsx'):
+            raise forms.ValidationError('El archivo debe ser formato Excel (.xlsx)')
+        return archivo
+
+    def cabecera(self):
+        """Campos de cabecera para importar_movimientos()"""
+        datos = self.cleaned_data
+        return {
+            'tipo': datos['tipo'],
+            'fecha': datos['fecha'],
+            'almacen_origen_id': datos['almacen_origen'].pk if datos['almacen_origen'] else None,
+            'almacen_destino_id': datos['almacen_destino'].pk if datos['almacen_destino'] else None,
+            'proveedor_id': datos['proveedor'].pk if datos['proveedor'] else None,
+            'recepcionista_id': datos['recepcionista'].pk if datos['recepcionista'] else None,
+            'observaciones_movimiento': datos['observaciones_movimiento'] or None,
+        }
@@ -0,0 +1,277 @@
+"""
+Importación masiva de movimientos (cabecera + detalles) desde Excel: listas de
+entrega de proveedores y listas de distribución a clientes.
+
+Formato de la hoja (la fila 1 son títulos y se ignora):
+    almacen: Código producto | Cantidad buena | Cantidad dañada | Observaciones
+    cliente: Código cliente | Código producto | Cantidad buena | Cantidad dañada | Observaciones
+
+La cabecera (tipo, fecha, almacenes, proveedor, recepcionista) es común a todo
+el archivo: una importación de almacén crea un movimiento y una de cliente crea
+un movimiento por cliente. Si alguna fila tiene errores no se importa nada.
+
+La hoja se lee en modo streaming, los códigos se resuelven con diccionarios en
+memoria, los números de movimiento se reservan en bloque y cabeceras y detalles
+se insertan con bulk_create. El stock (StockCache) lo actualiza el trigger por
+sentencia con un delta agregado por (almacén, producto); los rollups se
+recalculan una vez por producto al confirmar la transacción.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max
+
+FUENTES = ('almacen', 'cliente')
+TIPOS = {
+    'almacen': ('ENTRADA', 'SALIDA', 'TRASLADO'),
+    # Los traslados entre clientes no se importan: requieren origen y destino por fila
+    'cliente': ('ENTRADA', 'SALIDA'),
+}
+PREFIJOS = {'ENTRADA': 'ENT', 'SALIDA': 'SAL', 'TRASLADO': 'TRA'}
+
+TAMANO_LOTE = 500
+CANTIDAD_MAXIMA = Decimal('99999999.99')  # DecimalField(max_digits=10, decimal_places=2)
+
+
+def _fuente(fuente):
+    """(modelo, modelo de detalle, source de rollup) de una fuente"""
+    if fuente == 'almacen':
+        from almacenes.models import MovimientoAlmacen, DetalleMovimientoAlmacen
+        return MovimientoAlmacen, DetalleMovimientoAlmacen, 'ALMACEN'
+    if fuente == 'cliente':
+        from beneficiarios.models import MovimientoCliente, DetalleMovimientoCliente
+        return MovimientoCliente, DetalleMovimientoCliente, 'CLIENTE'
+    raise ValueError(f'Fuente desconocida: {fuente}')
+
+
+def _texto(valor):
+    return str(valor).strip() if valor is not None else ''
+
+
+def _cantidad(valor):
+    """Decimal con 2 decimales; acepta coma decimal. Lanza ValueError si no es válida"""
+    if valor is None or valor == '':
+        return Decimal('0')
+    try:
+        cantidad = Decimal(str(valor).strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Cantidad inválida: {valor}")
+    if cantidad < 0:
+        raise ValueError("La cantidad no puede ser negativa")
+    if cantidad > CANTIDAD_MAXIMA:
+        raise ValueError(f"La cantidad supera el máximo permitido ({CANTIDAD_MAXIMA})")
+    return cantidad
+
+
+def _siguiente_numero(numero_movimiento):
+    """Número correlativo siguiente a 'XXX/ENT-0012' (misma regla que save())"""
+    if not numero_movimiento:
+        return 1
+    try:
+        return int(numero_movimiento.replace('/', '-').split('-')[-1]) + 1
+    except (ValueError, IndexError):
+        return 1
+
+
+def leer_filas(archivo, fuente):
+    """
+    Generador de (fila, codigo_cliente, codigo_producto, cantidad, cantidad_danada, observaciones)
+    leyendo el Excel en modo read_only. Las celdas se devuelven sin validar.
+    """
+    import openpyxl
+
+    columnas = 5 if fuente == 'cliente' else 4
+    wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        for idx, row in enumerate(wb.active.iter_rows(min_row=2, values_only=True), start=2):
+            if not any(row):  # Fila completamente vacía
+                continue
+            row = tuple(row[:columnas]) + (None,) * (columnas - len(row))
+            if fuente == 'almacen':
+                row = (None,) + row
+            yield (idx,) + row
+    finally:
+        wb.close()
+
+
+def _validar_cabecera(modelo, fuente, cabecera):
+    """
+    Valida la cabecera común una sola vez (reglas de clean() y claves foráneas).
+    Retorna la instancia validada (con los valores ya convertidos, ej. la fecha).
+    """
+    if cabecera.get('tipo') not in TIPOS[fuente]:
+        raise ValueError(f"Tipo de movimiento no permitido para importar: {cabecera.get('tipo')}")
+
+    plantilla = modelo(numero_movimiento='-', **cabecera)
+    excluir = ['numero_movimiento']
+    if fuente == 'cliente':
+        # El cliente sale de cada fila y ya se resolvió contra la base de datos
+        excluir.append('cliente')
+    try:
+        plantilla.full_clean(exclude=excluir)
+    except ValidationError as e:
+        mensajes = [m for lista in e.message_dict.values() for m in lista]
+        raise ValueError('; '.join(mensajes))
+    return plantilla
+
+
+def _leer_lineas(filas, fuente, resultado):
+    """
+    Resuelve códigos y valida cantidades de todas las filas.
+    🚀 OPTIMIZACIÓN: productos y clientes se cargan una vez en diccionarios.
+    Retorna {clave_movimiento: [línea, ...]} (clave = cliente_id o None).
+    """
+    from productos.models import Producto
+
+    productos = {
+        codigo.upper(): pid for codigo, pid in Producto.objects.values_list('codigo', 'id')
+    }
+    clientes = {}
+    if fuente == 'cliente':
+        from beneficiarios.models import Cliente
+        clientes = {
+            codigo.upper(): cid for codigo, cid in Cliente.objects.values_list('codigo', 'id')
+        }
+
+    lineas = {}
+    vistos = {}
+    for fila, codigo_cliente, codigo_producto, cantidad, cantidad_danada, observaciones in filas:
+        def error(mensaje):
+            resultado['errores'].append({'fila': fila, 'error': mensaje})
+
+        clave = None
+        if fuente == 'cliente':
+            codigo_cliente = _texto(codigo_cliente)
+            clave = clientes.get(codigo_cliente.upper())
+            if clave is None:
+                error(f"Cliente no encontrado: '{codigo_cliente}'" if codigo_cliente else "Falta el código de cliente")
+                continue
+
+        codigo_producto = _texto(codigo_producto)
+        producto_id = productos.get(codigo_producto.upper())
+        if producto_id is None:
+            error(f"Producto no encontrado: '{codigo_producto}'" if codigo_producto else "Falta el código de producto")
+            continue
+
+        try:
+            cantidad = _cantidad(cantidad)
+            cantidad_danada = _cantidad(cantidad_danada)
+        except ValueError as e:
+            error(str(e))
+            continue
+        if cantidad == 0 and cantidad_danada == 0:
+            error("Debe ingresar al menos una cantidad (buena o dañada)")
+            continue
+
+        # Un producto solo puede aparecer una vez por movimiento (unique_together)
+        repetida = vistos.setdefault((clave, producto_id), fila)
+        if repetida != fila:
+            error(f"Producto '{codigo_producto}' repetido (ya está en la fila {repetida})")
+            continue
+
+        lineas.setdefault(clave, []).append({
+            'producto_id': producto_id,
+            'cantidad': cantidad,
+            'cantidad_danada': cantidad_danada,
+            'observaciones_producto': _texto(observaciones) or None,
+        })
+    return lineas
+
+
+def _reservar_numeros(modelo, fuente, cabecera, claves):
+    """
+    Números de movimiento para cada clave, reservados en bloque.
+    🚀 OPTIMIZACIÓN: el último número de todos los clientes en dos consultas.
+    """
+    tipo = cabecera['tipo']
+    prefijo = PREFIJOS.get(tipo, 'MOV')
+
+    if fuente == 'almacen':
+        from almacenes.models import Almacen
+
+        campo = 'almacen_destino_id' if tipo == 'ENTRADA' else 'almacen_origen_id'
+        almacen = Almacen.objects.get(pk=cabecera[campo])
+        ultimo = modelo.objects.filter(tipo=tipo, **{campo: almacen.pk}).order_by('-id').values_list(
+            'numero_movimiento', flat=True
+        ).first()
+        codigo_almacen = almacen.codigo or almacen.nombre[:3].upper()
+        return {None: f"{codigo_almacen}/{prefijo}-{_siguiente_numero(ultimo):04d}"}
+
+    from beneficiarios.models import Cliente
+
+    ultimos_ids = modelo.objects.filter(cliente_id__in=claves, tipo=tipo).values(
+        'cliente_id'
+    ).annotate(ultimo=Max('id')).values_list('ultimo', flat=True)
+    ultimos = dict(
+        modelo.objects.filter(id__in=list(ultimos_ids)).values_list('cliente_id', 'numero_movimiento')
+    )
+    codigos = dict(Cliente.objects.filter(id__in=claves).values_list('id', 'codigo'))
+    return {
+        cliente_id: f"{codigos[cliente_id]}/{prefijo}-{_siguiente_numero(ultimos.get(cliente_id)):04d}"
+        for cliente_id in claves
+    }
+
+
+def importar_movimientos(fuente, archivo, cabecera):
+    """
+    Importa el Excel `archivo` como movimientos de `fuente` con la `cabecera` común
+    (dict de campos del modelo: tipo, fecha, almacen_origen_id, almacen_destino_id,
+    proveedor_id, recepcionista_id, observaciones_movimiento...).
+    Retorna {'movimientos': [números], 'detalles': n, 'errores': [{'fila', 'error'}]}.
+    Lanza ValueError si la cabecera no es válida.
+    """
+    from .models import VersionDatos, recalcular_rollups_productos
+
+    modelo, modelo_detalle, source = _fuente(fuente)
+    resultado = {'movimientos': [], 'detalles': 0, 'errores': []}
+
+    plantilla = _validar_cabecera(modelo, fuente, cabecera)
+    lineas = _leer_lineas(leer_filas(archivo, fuente), fuente, resultado)
+
+    if resultado['errores']:
+        return resultado
+    if not lineas:
+        resultado['errores'].append({'fila': '-', 'error': 'El archivo no tiene líneas para importar'})
+        return resultado
+
+    claves = list(lineas)
+    with transaction.atomic():
+        numeros = _reservar_numeros(modelo, fuente, cabecera, claves)
+        movimientos = modelo.objects.bulk_create([
+            modelo(
+                numero_movimiento=numeros[clave],
+                **({'cliente_id': clave} if fuente == 'cliente' else {}),
+                **{**cabecera, 'fecha': plantilla.fecha},
+                # Totales guardados en la cabecera, ya conocidos en memoria
+                total_productos=len(lineas[clave]),
+                total_cantidad_buena=sum(linea['cantidad'] for linea in lineas[clave]),
+                total_cantidad_danada=sum(linea['cantidad_danada'] for linea in lineas[clave]),
+            )
+            for clave in claves
+        ], batch_size=TAMANO_LOTE)
+
+        detalles = (
+            modelo_detalle(movimiento_id=movimiento.pk, **linea)
+            for movimiento, clave in zip(movimientos, claves)
+            for linea in lineas[clave]
+        )
+        lote = []
+        for detalle in detalles:
+            lote.append(detalle)
+            if len(lote) >= TAMANO_LOTE:
+                modelo_detalle.objects.bulk_create(lote)
+                resultado['detalles'] += len(lote)
+                lote = []
+        if lote:
+            modelo_detalle.objects.bulk_create(lote)
+            resultado['detalles'] += len(lote)
+
+        # bulk_create no emite señales: lo que hacen reportes/signals.py, una sola vez
+        productos = {linea['producto_id'] for grupo in lineas.values() for linea in grupo}
+        fecha = plantilla.fecha
+        transaction.on_commit(lambda: recalcular_rollups_productos(source, fecha, productos))
+        transaction.on_commit(lambda: VersionDatos.incrementar(VersionDatos.MOVIMIENTOS))
+
+    resultado['movimientos'] = [numeros[clave] for clave in claves]
+    return resultado
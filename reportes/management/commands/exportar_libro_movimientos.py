@@ -0,0 +1,62 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from reportes.columnar import escribir_libro_movimientos, FORMATOS, FILAS_POR_GRUPO
+
+
+class Command(BaseCommand):
+    help = 'Exporta el libro de movimientos (detalles de almacén y cliente) a Parquet o Arrow IPC'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Ruta del archivo a generar')
+        parser.add_argument(
+            '--formato',
+            choices=FORMATOS,
+            default='parquet',
+            help='Formato de salida (por defecto parquet)',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Exporta solo los detalles posteriores a la última marca guardada',
+        )
+        parser.add_argument(
+            '--marca',
+            help='Archivo JSON con la marca de agua (por defecto <salida>.marca.json)',
+        )
+        parser.add_argument(
+            '--filas-por-grupo',
+            type=int,
+            default=FILAS_POR_GRUPO,
+            help=f'Filas por grupo de escritura (por defecto {FILAS_POR_GRUPO})',
+        )
+
+    def handle(self, *args, **options):
+        salida = options['salida']
+        ruta_marca = options['marca'] or f'{salida}.marca.json'
+
+        marcas = None
+        if options['incremental'] and os.path.exists(ruta_marca):
+            with open(ruta_marca) as f:
+                marcas = json.load(f)
+            self.stdout.write(f'Exportando desde la marca {marcas}...')
+        else:
+            self.stdout.write('Exportando el libro completo...')
+
+        try:
+            total, nuevas_marcas = escribir_libro_movimientos(
+                salida,
+                formato=options['formato'],
+                marcas=marcas,
+                filas_por_grupo=options['filas_por_grupo']
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        with open(ruta_marca, 'w') as f:
+            json.dump(nuevas_marcas, f)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Libro exportado en {salida}. Total filas: {total}. Marca: {nuevas_marcas}')
+        )
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from reportes.importacion_movimientos import importar_movimientos, FUENTES
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Fecha inválida (use AAAA-MM-DD): {valor}')
+
+
+class Command(BaseCommand):
+    help = 'Importa movimientos con sus detalles desde un Excel (lista de entrega o de distribución)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del Excel (.xlsx)')
+        parser.add_argument('--fuente', choices=FUENTES, default='almacen',
+                            help='Movimientos de almacén o de cliente (por defecto almacen)')
+        parser.add_argument('--tipo', choices=('ENTRADA', 'SALIDA', 'TRASLADO'), required=True,
+                            help='Tipo de movimiento')
+        parser.add_argument('--fecha', type=_fecha, help='Fecha AAAA-MM-DD (por defecto hoy)')
+        parser.add_argument('--almacen-origen', type=int, help='ID del almacén origen')
+        parser.add_argument('--almacen-destino', type=int, help='ID del almacén destino')
+        parser.add_argument('--proveedor', type=int, help='ID del proveedor')
+        parser.add_argument('--recepcionista', type=int, help='ID del recepcionista')
+        parser.add_argument('--observaciones', help='Observaciones del movimiento')
+
+    def handle(self, *args, **options):
+        from django.utils import timezone
+
+        cabecera = {
+            'tipo': options['tipo'],
+            'fecha': options['fecha'] or timezone.localdate(),
+            'almacen_origen_id': options['almacen_origen'],
+            'almacen_destino_id': options['almacen_destino'],
+            'proveedor_id': options['proveedor'],
+            'recepcionista_id': options['recepcionista'],
+            'observaciones_movimiento': options['observaciones'],
+        }
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_movimientos(options['fuente'], archivo, cabecera)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if resultado['errores']:
+            for error in resultado['errores']:
+                self.stderr.write(f"Fila {error['fila']}: {error['error']}")
+            raise CommandError(f"{len(resultado['errores'])} fila(s) con errores; no se importó nada")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(resultado['movimientos'])} movimiento(s) creados con {resultado['detalles']} línea(s): "
+            f"{', '.join(resultado['movimientos'])}"
+        ))
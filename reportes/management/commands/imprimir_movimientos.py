@@ -0,0 +1,58 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from reportes.pdf_lote import (
+    movimientos_lote, renderizar_lote, generar_zip, combinar_pdf, FUENTES, FORMATOS
+)
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Fecha inválida (use AAAA-MM-DD): {valor}')
+
+
+class Command(BaseCommand):
+    help = 'Genera los PDFs de un lote de movimientos (ZIP o un único PDF combinado) en paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Ruta del archivo a generar')
+        parser.add_argument('--fuente', choices=FUENTES, default='almacen',
+                            help='Movimientos de almacén o de cliente (por defecto almacen)')
+        parser.add_argument('--formato', choices=FORMATOS, default='zip',
+                            help='ZIP con un PDF por movimiento o PDF combinado (requiere pypdf)')
+        parser.add_argument('--desde', type=_fecha, help='Fecha inicial AAAA-MM-DD')
+        parser.add_argument('--hasta', type=_fecha, help='Fecha final AAAA-MM-DD')
+        parser.add_argument('--almacen', type=int, help='ID de almacén (origen o destino)')
+        parser.add_argument('--cliente', type=int, help='ID de cliente (solo fuente cliente)')
+        parser.add_argument('--tipo', choices=('ENTRADA', 'SALIDA', 'TRASLADO'), help='Tipo de movimiento')
+        parser.add_argument('--procesos', type=int, help='Procesos del pool (por defecto uno por CPU)')
+
+    def handle(self, *args, **options):
+        try:
+            movimientos = movimientos_lote(
+                options['fuente'],
+                fecha_inicio=options['desde'],
+                fecha_fin=options['hasta'],
+                almacen_id=options['almacen'],
+                cliente_id=options['cliente'],
+                tipo=options['tipo'],
+            )
+            total = movimientos.count()
+            self.stdout.write(f'Generando {total} PDFs...')
+
+            # Fuera del servidor web: sin el tope de REPORTES_MAX_PROCESOS
+            procesos = options['procesos'] or os.cpu_count() or 1
+            pdfs = renderizar_lote(options['fuente'], movimientos, max_procesos=procesos)
+            if options['formato'] == 'pdf':
+                combinar_pdf(pdfs, options['salida'])
+            else:
+                with open(options['salida'], 'wb') as salida:
+                    for bloque in generar_zip(pdfs):
+                        salida.write(bloque)
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'PDFs generados en {options["salida"]}. Total movimientos: {total}'))
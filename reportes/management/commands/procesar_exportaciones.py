@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from reportes.exportaciones import tomar_siguiente, ejecutar_trabajo, purgar_terminados
+
+# Segundos entre purgas de exportaciones antiguas
+INTERVALO_PURGA = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Worker de exportaciones: procesa los trabajos pendientes de TrabajoExportacion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5,
+            help='Segundos de espera entre sondeos cuando no hay trabajos (por defecto 5)',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa los trabajos pendientes y termina',
+        )
+        parser.add_argument(
+            '--dias-retencion',
+            type=int,
+            help='Días que se conservan las exportaciones terminadas (por defecto EXPORTACIONES_DIAS_RETENCION o 7)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Esperando exportaciones pendientes...')
+        ultima_purga = None
+
+        while True:
+            close_old_connections()
+
+            if ultima_purga is None or time.monotonic() - ultima_purga >= INTERVALO_PURGA:
+                eliminados = purgar_terminados(options['dias_retencion'])
+                if eliminados:
+                    self.stdout.write(f'Exportaciones antiguas eliminadas: {eliminados}')
+                ultima_purga = time.monotonic()
+
+            trabajo = tomar_siguiente()
+
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Procesando {trabajo}...')
+            ejecutar_trabajo(trabajo)
+
+            if trabajo.estado == 'COMPLETADO':
+                self.stdout.write(
+                    self.style.SUCCESS(f'Exportación #{trabajo.pk} lista: {trabajo.archivo.name}')
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f'Exportación #{trabajo.pk} falló: {trabajo.error}')
+                )
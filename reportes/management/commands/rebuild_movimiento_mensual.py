@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from reportes.models import MovimientoMensual, MovimientoDiario
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los rollups de movimientos (MovimientoMensual y MovimientoDiario) desde los detalles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            choices=['ALMACEN', 'CLIENTE'],
+            help='Reconstruye solo los movimientos de almacén o de cliente',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Filas por lote de inserción (por defecto 2000)',
+        )
+        parser.add_argument(
+            '--solo-si-vacio',
+            action='store_true',
+            help='Reconstruye solo los rollups vacíos (para el paso release de cada despliegue)',
+        )
+
+    def handle(self, *args, **options):
+        source = options.get('source')
+
+        for modelo in (MovimientoMensual, MovimientoDiario):
+            if options['solo_si_vacio'] and modelo.objects.exists():
+                self.stdout.write(f'{modelo.__name__} ya tiene datos; se omite.')
+                continue
+
+            self.stdout.write(
+                f'Reconstruyendo {modelo._meta.verbose_name} ({source or "todos los orígenes"})...'
+            )
+
+            total_registros = modelo.reconstruir(
+                source=source,
+                batch_size=options['batch_size']
+            )
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{modelo.__name__} reconstruido exitosamente. Total registros: {total_registros}'
+                )
+            )
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('almacenes', '0008_add_performance_indexes'),
+        ('productos', '0009_add_performance_indexes'),
+        ('proveedores', '0004_proveedor_proveedores_nombre_22fb8e_idx_and_more'),
+        ('recepcionistas', '0004_recepcionista_recepcionis_nombre_51d7d5_idx_and_more'),
+        ('reportes', '0006_movimientomensual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('ALMACEN', 'Movimiento de Almacén'), ('CLIENTE', 'Movimiento de Cliente')], max_length=10, verbose_name='Origen')),
+                ('tipo', models.CharField(max_length=10, verbose_name='Tipo')),
+                ('cantidad_buena', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Cantidad Buena')),
+                ('cantidad_danada', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Cantidad Dañada')),
+                ('total_movimientos', models.PositiveIntegerField(default=0, verbose_name='Total Movimientos')),
+                ('dia', models.DateField(verbose_name='Día')),
+                ('almacen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='almacenes.almacen', verbose_name='Almacén')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='productos.producto', verbose_name='Producto')),
+                ('proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='proveedores.proveedor', verbose_name='Proveedor')),
+                ('recepcionista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='recepcionistas.recepcionista', verbose_name='Recepcionista')),
+            ],
+            options={
+                'verbose_name': 'Movimiento Diario',
+                'verbose_name_plural': 'Movimientos Diarios',
+                'indexes': [models.Index(fields=['source', 'dia'], name='mov_dia_src_dia_idx'), models.Index(fields=['source', 'dia', 'producto'], name='mov_dia_src_dia_prod_idx'), models.Index(fields=['producto', 'dia'], name='mov_dia_prod_dia_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0007_movimientodiario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('movimientos_excel', 'Movimientos (Excel)'), ('movimientos_csv', 'Movimientos (CSV)'), ('stock_real_excel', 'Stock Real (Excel)'), ('entregas_excel', 'Entregas a Clientes (Excel)'), ('productos_excel', 'Productos (Excel)')], max_length=30, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10, verbose_name='Estado')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('archivo', models.FileField(blank=True, upload_to='exportaciones/', verbose_name='Archivo')),
+                ('tamano', models.PositiveBigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Exportación en Segundo Plano',
+                'verbose_name_plural': '6.5. Exportaciones en Segundo Plano',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='trab_exp_estado_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0008_trabajoexportacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajoexportacion',
+            name='tipo',
+            field=models.CharField(choices=[('movimientos_excel', 'Movimientos (Excel)'), ('movimientos_csv', 'Movimientos (CSV)'), ('stock_real_excel', 'Stock Real (Excel)'), ('entregas_excel', 'Entregas a Clientes (Excel)'), ('productos_excel', 'Productos (Excel)'), ('libro_parquet', 'Libro de Movimientos (Parquet)')], max_length=30, verbose_name='Tipo'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Sin operaciones: el llenado inicial de los rollups mensual y diario no se
+    hace en una migración (necesitaría los modelos reales y reconstruiría todo
+    el historial dentro de la transacción de migrate). Lo hace el paso release
+    del Procfile con `rebuild_movimiento_mensual --solo-si-vacio`.
+    Se conserva para no romper la cadena de dependencias.
+    """
+
+    dependencies = [
+        ('almacenes', '0012_movimientoalmacen_totales'),
+        ('beneficiarios', '0011_movimientocliente_totales'),
+        ('reportes', '0010_versiondatos'),
+    ]
+
+    operations = []
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes', '0011_reconstruir_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intentos'),
+        ),
+    ]
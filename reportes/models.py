@@ -1,6 +1,9 @@
 from django.db import models
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Sum, Count, Q, F
+from django.db.models import Sum, Count, Q, F, Case, When, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from datetime import timedelta
 from decimal import Decimal
 
 
@@ -88,121 +91,86 @@ class ReporteMovimiento(models.Model):
     def estadisticas_generales(fecha_inicio=None, fecha_fin=None):
         """
         Retorna estadísticas generales de movimientos
+        🚀 OPTIMIZACIÓN: Cantidades desde los rollups mensual/diario; los conteos
+        de movimientos salen de las cabeceras (índice por fecha), sin recorrer detalles
         """
-        from almacenes.models import DetalleMovimientoAlmacen
-        from beneficiarios.models import DetalleMovimientoCliente
-        
-        # Filtros de fecha
-        filtros_almacen = Q()
-        filtros_cliente = Q()
-        
-        if fecha_inicio:
-            filtros_almacen &= Q(movimiento__fecha__gte=fecha_inicio)
-            filtros_cliente &= Q(movimiento__fecha__gte=fecha_inicio)
-        if fecha_fin:
-            filtros_almacen &= Q(movimiento__fecha__lte=fecha_fin)
-            filtros_cliente &= Q(movimiento__fecha__lte=fecha_fin)
-        
-        # Estadísticas de almacén
-        stats_almacen = DetalleMovimientoAlmacen.objects.filter(filtros_almacen).aggregate(
-            total_movimientos=Count('movimiento', distinct=True),
-            total_productos_buena=Sum('cantidad'),
-            total_productos_danada=Sum('cantidad_danada'),
-            entradas=Count('movimiento', filter=Q(movimiento__tipo='ENTRADA'), distinct=True),
-            salidas=Count('movimiento', filter=Q(movimiento__tipo='SALIDA'), distinct=True),
-            traslados=Count('movimiento', filter=Q(movimiento__tipo='TRASLADO'), distinct=True)
-        )
-        
-        # Estadísticas de cliente
-        stats_cliente = DetalleMovimientoCliente.objects.filter(filtros_cliente).aggregate(
-            total_movimientos=Count('movimiento', distinct=True),
-            total_productos_buena=Sum('cantidad'),
-            total_productos_danada=Sum('cantidad_danada'),
-            entradas=Count('movimiento', filter=Q(movimiento__tipo='ENTRADA'), distinct=True),
-            salidas=Count('movimiento', filter=Q(movimiento__tipo='SALIDA'), distinct=True),
-            traslados=Count('movimiento', filter=Q(movimiento__tipo='TRASLADO'), distinct=True)
-        )
-        
+        from django.db.models import Exists, OuterRef
+        from almacenes.models import MovimientoAlmacen, DetalleMovimientoAlmacen
+        from beneficiarios.models import MovimientoCliente, DetalleMovimientoCliente
+
+        # 1. Cantidades por origen (rollups)
+        cantidades = MovimientoMensual.resumir(('source',), fecha_inicio, fecha_fin)
+
+        # 2. Movimientos con al menos un detalle, por tipo
+        def conteo_por_tipo(modelo_mov, modelo_det):
+            qs = modelo_mov.objects.filter(
+                Exists(modelo_det.objects.filter(movimiento=OuterRef('pk')))
+            )
+            if fecha_inicio:
+                qs = qs.filter(fecha__gte=fecha_inicio)
+            if fecha_fin:
+                qs = qs.filter(fecha__lte=fecha_fin)
+            return dict(qs.values_list('tipo').annotate(total=Count('id')).order_by())
+
+        def armar(source, conteos):
+            cant = cantidades.get((source,), {})
+            return {
+                'total_movimientos': sum(conteos.values()),
+                'total_productos_buena': cant.get('cantidad_buena'),
+                'total_productos_danada': cant.get('cantidad_danada'),
+                'entradas': conteos.get('ENTRADA', 0),
+                'salidas': conteos.get('SALIDA', 0),
+                'traslados': conteos.get('TRASLADO', 0),
+            }
+
+        stats_almacen = armar('ALMACEN', conteo_por_tipo(MovimientoAlmacen, DetalleMovimientoAlmacen))
+        stats_cliente = armar('CLIENTE', conteo_por_tipo(MovimientoCliente, DetalleMovimientoCliente))
+
         return {
             'almacen': stats_almacen,
             'cliente': stats_cliente,
             'total_movimientos': (stats_almacen['total_movimientos'] or 0) + (stats_cliente['total_movimientos'] or 0),
             'total_productos': (stats_almacen['total_productos_buena'] or 0) + (stats_cliente['total_productos_buena'] or 0)
         }
-    
+
     @staticmethod
     def productos_mas_movidos(fecha_inicio=None, fecha_fin=None, limite=10):
         """
         Retorna los productos con más movimientos
+        🚀 OPTIMIZACIÓN: Suma por producto desde los rollups y selecciona el top-K
+        con un heap acotado; solo se consultan los datos de los K productos elegidos
         """
-        from almacenes.models import DetalleMovimientoAlmacen
-        from beneficiarios.models import DetalleMovimientoCliente
-    
-        filtros = Q()
-        if fecha_inicio:
-            filtros &= Q(movimiento__fecha__gte=fecha_inicio)
-        if fecha_fin:
-            filtros &= Q(movimiento__fecha__lte=fecha_fin)
-    
-    # ✅ Combinar datos de almacén - CORREGIDO
-        productos_almacen = DetalleMovimientoAlmacen.objects.filter(filtros).values(
-            'producto__id',
-            'producto__codigo',
-            'producto__nombre',
-            'producto__unidad_medida__abreviatura'
-        ).annotate(
-            cantidad_buena=Sum('cantidad'),
-            cantidad_danada=Sum('cantidad_danada'),
-            total_movimientos=Count('movimiento', distinct=True)
-        )
-    
-    # ✅ Combinar datos de cliente - CORREGIDO
-        productos_cliente = DetalleMovimientoCliente.objects.filter(filtros).values(
-            'producto__id',
-            'producto__codigo',
-            'producto__nombre',
-            'producto__unidad_medida__abreviatura'
-        ).annotate(
-            cantidad_buena=Sum('cantidad'),
-            cantidad_danada=Sum('cantidad_danada'),
-            total_movimientos=Count('movimiento', distinct=True)
+        import heapq
+        from productos.models import Producto
+
+        resumen = MovimientoMensual.resumir(('producto',), fecha_inicio, fecha_fin)
+
+        top = heapq.nlargest(
+            limite,
+            resumen.items(),
+            key=lambda item: item[1]['cantidad_buena'] + item[1]['cantidad_danada']
         )
-    
-    # ✅ Combinar resultados y calcular total_cantidad en Python
-        productos_dict = {}
-    
-        for item in productos_almacen:
-            pid = item['producto__id']
-            total_cantidad = (item['cantidad_buena'] or 0) + (item['cantidad_danada'] or 0)
-            productos_dict[pid] = {
+
+        info = {
+            p['id']: p for p in Producto.objects.filter(
+                id__in=[pid for (pid,), _cant in top]
+            ).values('id', 'codigo', 'nombre', 'unidad_medida__abreviatura')
+        }
+
+        resultado = []
+        for (pid,), cant in top:
+            p = info.get(pid)
+            if p is None:
+                continue
+            resultado.append({
                 'id': pid,
-                'codigo': item['producto__codigo'],
-                'nombre': item['producto__nombre'],
-                'unidad': item['producto__unidad_medida__abreviatura'],
-                'total_cantidad': total_cantidad,
-                'total_movimientos': item['total_movimientos'] or 0
-            }
-    
-        for item in productos_cliente:
-            pid = item['producto__id']
-            total_cantidad = (item['cantidad_buena'] or 0) + (item['cantidad_danada'] or 0)
-        
-            if pid in productos_dict:
-                productos_dict[pid]['total_cantidad'] += total_cantidad
-                productos_dict[pid]['total_movimientos'] += item['total_movimientos'] or 0
-            else:
-                productos_dict[pid] = {
-                    'id': pid,
-                    'codigo': item['producto__codigo'],
-                    'nombre': item['producto__nombre'],
-                    'unidad': item['producto__unidad_medida__abreviatura'],
-                    'total_cantidad': total_cantidad,
-                    'total_movimientos': item['total_movimientos'] or 0
-                }
-    
-        # Ordenar por cantidad total y limitar
-        resultado = sorted(productos_dict.values(), key=lambda x: x['total_cantidad'], reverse=True)
-        return resultado[:limite]
+                'codigo': p['codigo'],
+                'nombre': p['nombre'],
+                'unidad': p['unidad_medida__abreviatura'],
+                'total_cantidad': cant['cantidad_buena'] + cant['cantidad_danada'],
+                'total_movimientos': cant['total_movimientos']
+            })
+        return resultado
 
 
 # ==============================================================================
@@ -308,6 +276,300 @@ class ReporteEntregas(models.Model):
             'resumen_productos_top': top_productos_list,
         }
 
+    # ==========================================================================
+    # 🚀 OPTIMIZACIÓN: Agregación en SQL compartida por el listado y las exportaciones
+    # ==========================================================================
+    # Cada detalle aporta a uno o dos "tramos": el cliente del movimiento
+    # (ENTRADA/SALIDA) o, en traslados completos, el cliente origen (resta) y el
+    # cliente destino (suma). Cada tramo es una consulta agrupada por
+    # (cliente, producto); en Python solo se combinan las filas ya agregadas.
+
+    @staticmethod
+    def agregar_entregas(fecha_inicio=None, fecha_fin=None, cliente_id=None,
+                         categoria_id=None, producto_id=None):
+        """
+        Retorna {
+            'pares': {(cliente_id, producto_id): {total_entregas, cantidad_entrada, cantidad_salida,
+                      cantidad_traslado_origen, cantidad_traslado_destino, cantidad_buena,
+                      cantidad_danada, stock_bueno, stock_danado}},
+            'movimientos_cliente': {cliente_id: movimientos distintos},
+            'movimientos_producto': {producto_id: movimientos distintos},
+        }
+        """
+        from beneficiarios.models import DetalleMovimientoCliente
+
+        detalles = DetalleMovimientoCliente.objects.all()
+        if fecha_inicio:
+            detalles = detalles.filter(movimiento__fecha__gte=fecha_inicio)
+        if fecha_fin:
+            detalles = detalles.filter(movimiento__fecha__lte=fecha_fin)
+        if cliente_id:
+            detalles = detalles.filter(
+                Q(movimiento__cliente_id=cliente_id) |
+                Q(movimiento__cliente_origen_id=cliente_id) |
+                Q(movimiento__cliente_destino_id=cliente_id)
+            )
+        if categoria_id:
+            detalles = detalles.filter(producto__categoria_id=categoria_id)
+        if producto_id:
+            detalles = detalles.filter(producto_id=producto_id)
+
+        traslado_completo = Q(
+            movimiento__tipo='TRASLADO',
+            movimiento__cliente_origen__isnull=False,
+            movimiento__cliente_destino__isnull=False,
+        )
+        tramos = (
+            # (campo cliente, queryset, signo del stock; None = según tipo ENTRADA/SALIDA)
+            ('movimiento__cliente_id',
+             detalles.exclude(traslado_completo).filter(movimiento__cliente__isnull=False), None),
+            ('movimiento__cliente_origen_id', detalles.filter(traslado_completo), -1),
+            ('movimiento__cliente_destino_id', detalles.filter(traslado_completo), 1),
+        )
+
+        cero = Decimal('0')
+        pares = {}
+        movimientos_cliente = {}
+        movimientos_producto = {}
+
+        def par(clave):
+            if clave not in pares:
+                pares[clave] = {
+                    'total_entregas': 0,
+                    'cantidad_entrada': cero,
+                    'cantidad_salida': cero,
+                    'cantidad_traslado_origen': cero,
+                    'cantidad_traslado_destino': cero,
+                    'cantidad_buena': cero,
+                    'cantidad_danada': cero,
+                    'stock_bueno': cero,
+                    'stock_danado': cero,
+                }
+            return pares[clave]
+
+        for campo_cliente, queryset, signo in tramos:
+            anotaciones = {
+                'entregas': Count('movimiento', distinct=True),
+                'buena': Coalesce(Sum('cantidad'), Value(cero)),
+                'danada': Coalesce(Sum('cantidad_danada'), Value(cero)),
+            }
+            if signo is None:
+                for tipo, prefijo in (('ENTRADA', 'ent'), ('SALIDA', 'sal')):
+                    anotaciones[f'{prefijo}_b'] = Coalesce(
+                        Sum('cantidad', filter=Q(movimiento__tipo=tipo)), Value(cero))
+                    anotaciones[f'{prefijo}_d'] = Coalesce(
+                        Sum('cantidad_danada', filter=Q(movimiento__tipo=tipo)), Value(cero))
+
+            for fila in queryset.values(campo_cliente, 'producto_id').annotate(**anotaciones).order_by():
+                item = par((fila[campo_cliente], fila['producto_id']))
+                item['total_entregas'] += fila['entregas']
+                item['cantidad_buena'] += fila['buena']
+                item['cantidad_danada'] += fila['danada']
+
+                if signo is None:
+                    item['cantidad_entrada'] += fila['ent_b'] + fila['ent_d']
+                    item['cantidad_salida'] += fila['sal_b'] + fila['sal_d']
+                    item['stock_bueno'] += fila['ent_b'] - fila['sal_b']
+                    item['stock_danado'] += fila['ent_d'] - fila['sal_d']
+                elif signo < 0:
+                    item['cantidad_traslado_origen'] += fila['buena'] + fila['danada']
+                    item['stock_bueno'] -= fila['buena']
+                    item['stock_danado'] -= fila['danada']
+                else:
+                    item['cantidad_traslado_destino'] += fila['buena'] + fila['danada']
+                    item['stock_bueno'] += fila['buena']
+                    item['stock_danado'] += fila['danada']
+
+                # Un traslado cuenta una sola vez por producto (tramo origen)
+                if signo is None or signo < 0:
+                    movimientos_producto[fila['producto_id']] = (
+                        movimientos_producto.get(fila['producto_id'], 0) + fila['entregas']
+                    )
+
+            # Los tramos son disjuntos por movimiento: los conteos distintos se pueden sumar
+            for fila in queryset.values(campo_cliente).annotate(
+                movimientos=Count('movimiento', distinct=True)
+            ).order_by():
+                movimientos_cliente[fila[campo_cliente]] = (
+                    movimientos_cliente.get(fila[campo_cliente], 0) + fila['movimientos']
+                )
+
+        return {
+            'pares': pares,
+            'movimientos_cliente': movimientos_cliente,
+            'movimientos_producto': movimientos_producto,
+        }
+
+    @staticmethod
+    def _info_clientes(ids):
+        from beneficiarios.models import Cliente
+
+        return {
+            c['id']: c for c in Cliente.objects.filter(id__in=ids).values(
+                'id', 'codigo', 'nombre', 'direccion', 'telefono'
+            )
+        }
+
+    @staticmethod
+    def _info_productos(ids=None, queryset=None):
+        from productos.models import Producto
+
+        if queryset is None:
+            queryset = Producto.objects.filter(id__in=ids)
+        return {
+            p['id']: p for p in queryset.values(
+                'id', 'codigo', 'nombre', 'categoria__nombre', 'unidad_medida__abreviatura'
+            )
+        }
+
+    @staticmethod
+    def entregas_detallado(agregado, cliente_id=None, mostrar_todos=False,
+                           categoria_id=None, producto_id=None):
+        """
+        Filas de la vista detallada (cliente × producto), ordenadas por código de
+        cliente y de producto. Con mostrar_todos se incluyen en cero los pares de
+        clientes y productos activos sin movimientos.
+        """
+        from beneficiarios.models import Cliente
+        from productos.models import Producto
+
+        pares = agregado['pares']
+        if cliente_id:
+            pares = {k: v for k, v in pares.items() if str(k[0]) == str(cliente_id)}
+
+        clientes = ReporteEntregas._info_clientes({c for c, _ in pares})
+        productos = ReporteEntregas._info_productos({p for _, p in pares})
+
+        ids_grilla = set()
+        if mostrar_todos:
+            clientes_activos = Cliente.objects.filter(activo=True)
+            if cliente_id:
+                clientes_activos = clientes_activos.filter(id=cliente_id)
+            productos_activos = Producto.objects.filter(activo=True)
+            if categoria_id:
+                productos_activos = productos_activos.filter(categoria_id=categoria_id)
+            if producto_id:
+                productos_activos = productos_activos.filter(id=producto_id)
+
+            clientes.update(ReporteEntregas._info_clientes(clientes_activos.values('id')))
+            productos_grilla = ReporteEntregas._info_productos(queryset=productos_activos)
+            productos.update(productos_grilla)
+            ids_grilla = set(productos_grilla)
+
+        productos_por_cliente = {}
+        for cli, pid in pares:
+            productos_por_cliente.setdefault(cli, set()).add(pid)
+
+        vacio = {
+            'total_entregas': 0,
+            'cantidad_entrada': Decimal('0'),
+            'cantidad_salida': Decimal('0'),
+            'cantidad_traslado_origen': Decimal('0'),
+            'cantidad_traslado_destino': Decimal('0'),
+            'cantidad_buena': Decimal('0'),
+            'cantidad_danada': Decimal('0'),
+            'stock_bueno': Decimal('0'),
+            'stock_danado': Decimal('0'),
+        }
+
+        for cli in sorted(clientes, key=lambda c: clientes[c]['codigo']):
+            ids_productos = sorted(
+                ids_grilla | productos_por_cliente.get(cli, set()),
+                key=lambda pid: productos[pid]['codigo']
+            )
+            cliente = clientes[cli]
+            for pid in ids_productos:
+                producto = productos[pid]
+                valores = pares.get((cli, pid), vacio)
+                yield {
+                    'cliente_id': cli,
+                    'cliente_nombre': cliente['nombre'],
+                    'cliente_codigo': cliente['codigo'],
+                    'cliente_direccion': cliente['direccion'] or '-',
+                    'producto_id': pid,
+                    'producto_codigo': producto['codigo'],
+                    'producto_nombre': producto['nombre'],
+                    'producto_categoria': producto['categoria__nombre'] or '-',
+                    'producto_unidad': producto['unidad_medida__abreviatura'] or 'UND',
+                    **valores,
+                    'stock_total': valores['stock_bueno'] + valores['stock_danado'],
+                }
+
+    @staticmethod
+    def entregas_por_cliente(agregado, cliente_id=None):
+        """Filas de la vista por cliente, ordenadas por código de cliente"""
+        resumen = {}
+        for (cli, pid), valores in agregado['pares'].items():
+            if cliente_id and str(cli) != str(cliente_id):
+                continue
+            item = resumen.setdefault(cli, {
+                'productos': 0, 'cantidad_buena': Decimal('0'), 'cantidad_danada': Decimal('0'),
+            })
+            item['productos'] += 1
+            item['cantidad_buena'] += valores['stock_bueno']
+            item['cantidad_danada'] += valores['stock_danado']
+
+        clientes = ReporteEntregas._info_clientes(resumen)
+        filas = []
+        for cli, item in resumen.items():
+            cliente = clientes[cli]
+            filas.append({
+                'cliente_id': cli,
+                'cliente_nombre': cliente['nombre'],
+                'cliente_codigo': cliente['codigo'],
+                'cliente_direccion': cliente['direccion'] or '-',
+                'cliente_telefono': cliente['telefono'] or '-',
+                'cantidad_buena': item['cantidad_buena'],
+                'cantidad_danada': item['cantidad_danada'],
+                'total_entregas': agregado['movimientos_cliente'].get(cli, 0),
+                'total_productos': item['productos'],
+                'cantidad_total': item['cantidad_buena'] + item['cantidad_danada'],
+            })
+        filas.sort(key=lambda x: x['cliente_codigo'])
+        return filas
+
+    @staticmethod
+    def entregas_por_producto(agregado):
+        """Filas de la vista por producto (traslados con saldo neutro), ordenadas por código"""
+        resumen = {}
+        for (cli, pid), valores in agregado['pares'].items():
+            item = resumen.setdefault(pid, {
+                'clientes': 0, 'cantidad_buena': Decimal('0'), 'cantidad_danada': Decimal('0'),
+            })
+            item['clientes'] += 1
+            item['cantidad_buena'] += valores['stock_bueno']
+            item['cantidad_danada'] += valores['stock_danado']
+
+        productos = ReporteEntregas._info_productos(resumen)
+        filas = []
+        for pid, item in resumen.items():
+            producto = productos[pid]
+            filas.append({
+                'producto_id': pid,
+                'producto_codigo': producto['codigo'],
+                'producto_nombre': producto['nombre'],
+                'producto_categoria': producto['categoria__nombre'] or '-',
+                'producto_unidad': producto['unidad_medida__abreviatura'] or 'UND',
+                'cantidad_buena': item['cantidad_buena'],
+                'cantidad_danada': item['cantidad_danada'],
+                'total_clientes': item['clientes'],
+                'total_entregas': agregado['movimientos_producto'].get(pid, 0),
+                'cantidad_total': item['cantidad_buena'] + item['cantidad_danada'],
+            })
+        filas.sort(key=lambda x: x['producto_codigo'])
+        return filas
+
+    @staticmethod
+    def filas_vista(vista, agregado, cliente_id, categoria_id, producto_id, mostrar_todos):
+        """Filas de la vista solicitada (detallado, por_cliente, por_producto) a partir de agregar_entregas()"""
+        if vista == 'detallado':
+            return ReporteEntregas.entregas_detallado(
+                agregado, cliente_id, mostrar_todos, categoria_id, producto_id
+            )
+        if vista == 'por_cliente':
+            return ReporteEntregas.entregas_por_cliente(agregado, cliente_id)
+        return ReporteEntregas.entregas_por_producto(agregado)
+
 # ==============================================================================
 # REPORTE DE STOCK (Implementación completa) ⭐
 # ==============================================================================
@@ -553,4 +815,526 @@ class ReporteStockReal(models.Model):
             'stock_bueno': float(stock_bueno),
             'stock_danado': float(stock_danado),
             'stock_total': float(stock_bueno + stock_danado)
-        }
\ No newline at end of file
+        }
+
+# ==============================================================================
+# ROLLUPS DE MOVIMIENTOS (tablas pre-agregadas para gráficos, tendencias y estadísticas)
+# ==============================================================================
+
+def _mes_siguiente(mes):
+    """Primer día del mes siguiente a la fecha dada"""
+    return (mes.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def recalcular_rollups(source, fecha, producto_id):
+    """Recalcula los buckets mensual y diario afectados por un cambio"""
+    MovimientoMensual.recalcular(source, fecha, producto_id)
+    MovimientoDiario.recalcular(source, fecha, producto_id)
+
+
+def recalcular_rollups_productos(source, fecha, producto_ids):
+    """Como recalcular_rollups para varios productos de una misma fecha (importaciones masivas)"""
+    MovimientoMensual.recalcular_productos(source, fecha, producto_ids)
+    MovimientoDiario.recalcular_productos(source, fecha, producto_ids)
+
+
+class RollupMovimiento(models.Model):
+    """
+    Base de las tablas pre-agregadas de movimientos.
+    Cada fila acumula las cantidades de un (periodo, origen, almacén, producto,
+    tipo, proveedor, recepcionista). Se mantienen de forma incremental mediante
+    señales (ver reportes/signals.py) y se reconstruyen con
+    `rebuild_movimiento_mensual`.
+
+    El almacén de referencia es el almacén físico afectado por el movimiento:
+    - ALMACEN: destino en ENTRADA, origen en SALIDA y TRASLADO (enviado).
+    - CLIENTE: origen en ENTRADA (sale hacia el cliente), destino en SALIDA
+      (regresa al almacén) y vacío en TRASLADO entre clientes.
+    """
+
+    SOURCE_CHOICES = [
+        ('ALMACEN', _('Movimiento de Almacén')),
+        ('CLIENTE', _('Movimiento de Cliente')),
+    ]
+
+    # Nombre del campo de periodo en la subclase ('mes' o 'dia')
+    PERIODO = None
+
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, verbose_name=_("Origen"))
+    almacen = models.ForeignKey(
+        'almacenes.Almacen',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name=_("Almacén")
+    )
+    producto = models.ForeignKey(
+        'productos.Producto',
+        on_delete=models.CASCADE,
+        verbose_name=_("Producto")
+    )
+    tipo = models.CharField(max_length=10, verbose_name=_("Tipo"))
+    proveedor = models.ForeignKey(
+        'proveedores.Proveedor',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name=_("Proveedor")
+    )
+    recepcionista = models.ForeignKey(
+        'recepcionistas.Recepcionista',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name=_("Recepcionista")
+    )
+    cantidad_buena = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("Cantidad Buena")
+    )
+    cantidad_danada = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("Cantidad Dañada")
+    )
+    # Líneas de detalle del grupo (= movimientos distintos, porque el producto es parte de la clave)
+    total_movimientos = models.PositiveIntegerField(default=0, verbose_name=_("Total Movimientos"))
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def clave(cls):
+        """Campos que forman la clave del rollup"""
+        return (cls.PERIODO, 'source', 'almacen', 'producto', 'tipo', 'proveedor', 'recepcionista')
+
+    @classmethod
+    def _expresion_periodo(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def _limites_bucket(cls, fecha):
+        """(inicio, fin_exclusivo) del periodo que contiene `fecha`"""
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------
+    # Agregación desde las tablas de detalle
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _modelo_detalle(source):
+        if source == 'CLIENTE':
+            from beneficiarios.models import DetalleMovimientoCliente
+            return DetalleMovimientoCliente
+        from almacenes.models import DetalleMovimientoAlmacen
+        return DetalleMovimientoAlmacen
+
+    @classmethod
+    def _expresiones_clave(cls, source):
+        """Expresiones (sobre la tabla de detalle) equivalentes a cada campo de la clave"""
+        if source == 'CLIENTE':
+            almacen = Case(
+                When(movimiento__tipo='ENTRADA', then=F('movimiento__almacen_origen')),
+                When(movimiento__tipo='SALIDA', then=F('movimiento__almacen_destino')),
+                default=Value(None),
+                output_field=models.IntegerField()
+            )
+        else:
+            almacen = Case(
+                When(movimiento__tipo='ENTRADA', then=F('movimiento__almacen_destino')),
+                default=F('movimiento__almacen_origen'),
+                output_field=models.IntegerField()
+            )
+        return {
+            cls.PERIODO: cls._expresion_periodo(),
+            'source': Value(source, output_field=models.CharField()),
+            'almacen': almacen,
+            'producto': F('producto'),
+            'tipo': F('movimiento__tipo'),
+            'proveedor': F('movimiento__proveedor'),
+            'recepcionista': F('movimiento__recepcionista'),
+        }
+
+    @classmethod
+    def agregar_detalles(cls, source, filtros=None, agrupar=None, **filtros_clave):
+        """
+        Agrega en vivo la tabla de detalle de `source` agrupando por los campos
+        de clave indicados. Devuelve dicts con las mismas claves que el rollup.
+        `filtros` es un Q sobre la tabla de detalle; `filtros_clave` filtra por
+        campos de la clave (ej. almacen=3, tipo='ENTRADA').
+        """
+        agrupar = tuple(agrupar or cls.clave())
+        expresiones = cls._expresiones_clave(source)
+        # Alias con prefijo para no chocar con los campos de la tabla de detalle
+        anotaciones = {f'r_{campo}': expr for campo, expr in expresiones.items()}
+
+        qs = cls._modelo_detalle(source).objects.all()
+        if filtros is not None:
+            qs = qs.filter(filtros)
+        qs = qs.annotate(**anotaciones)
+        if filtros_clave:
+            qs = qs.filter(**{f'r_{campo}': valor for campo, valor in filtros_clave.items()})
+
+        qs = qs.values(*[f'r_{campo}' for campo in agrupar]).annotate(
+            suma_buena=Coalesce(Sum('cantidad'), Value(Decimal('0')), output_field=models.DecimalField()),
+            suma_danada=Coalesce(Sum('cantidad_danada'), Value(Decimal('0')), output_field=models.DecimalField()),
+            lineas=Count('id')
+        ).order_by()
+
+        for row in qs:
+            item = {campo: row[f'r_{campo}'] for campo in agrupar}
+            item['cantidad_buena'] = row['suma_buena']
+            item['cantidad_danada'] = row['suma_danada']
+            item['total_movimientos'] = row['lineas']
+            yield item
+
+    @classmethod
+    def _instancias(cls, filas):
+        return [
+            cls(
+                source=f['source'],
+                almacen_id=f['almacen'],
+                producto_id=f['producto'],
+                tipo=f['tipo'],
+                proveedor_id=f['proveedor'],
+                recepcionista_id=f['recepcionista'],
+                cantidad_buena=f['cantidad_buena'],
+                cantidad_danada=f['cantidad_danada'],
+                total_movimientos=f['total_movimientos'],
+                **{cls.PERIODO: f[cls.PERIODO]}
+            )
+            for f in filas
+        ]
+
+    @classmethod
+    def recalcular(cls, source, fecha, producto_id):
+        """
+        Recalcula de forma exacta el bucket (source, periodo de `fecha`, producto).
+        Es idempotente: sirve igual para altas, cambios y bajas de detalles.
+        """
+        from django.db import transaction
+
+        inicio, fin = cls._limites_bucket(fecha)
+        filtros = Q(
+            producto_id=producto_id,
+            movimiento__fecha__gte=inicio,
+            movimiento__fecha__lt=fin
+        )
+        nuevas = cls._instancias(cls.agregar_detalles(source, filtros))
+
+        with transaction.atomic():
+            cls.objects.filter(source=source, producto_id=producto_id, **{cls.PERIODO: inicio}).delete()
+            cls.objects.bulk_create(nuevas)
+
+    @classmethod
+    def recalcular_productos(cls, source, fecha, producto_ids):
+        """
+        Recalcula los buckets de varios productos en el periodo de `fecha`.
+        🚀 OPTIMIZACIÓN: una consulta agregada para todos, en lugar de una por producto.
+        """
+        from django.db import transaction
+
+        producto_ids = list(producto_ids)
+        if not producto_ids:
+            return
+        inicio, fin = cls._limites_bucket(fecha)
+        filtros = Q(
+            producto_id__in=producto_ids,
+            movimiento__fecha__gte=inicio,
+            movimiento__fecha__lt=fin
+        )
+        nuevas = cls._instancias(cls.agregar_detalles(source, filtros))
+
+        with transaction.atomic():
+            cls.objects.filter(
+                source=source, producto_id__in=producto_ids, **{cls.PERIODO: inicio}
+            ).delete()
+            cls.objects.bulk_create(nuevas, batch_size=2000)
+
+    @classmethod
+    def reconstruir(cls, source=None, batch_size=2000):
+        """Reconstruye completamente el rollup (una consulta agregada por origen)"""
+        from django.db import transaction
+
+        sources = [source] if source else [s for s, _label in cls.SOURCE_CHOICES]
+        total = 0
+        with transaction.atomic():
+            for src in sources:
+                cls.objects.filter(source=src).delete()
+                lote = []
+                for fila in cls.agregar_detalles(src):
+                    lote.append(fila)
+                    if len(lote) >= batch_size:
+                        cls.objects.bulk_create(cls._instancias(lote))
+                        total += len(lote)
+                        lote = []
+                if lote:
+                    cls.objects.bulk_create(cls._instancias(lote))
+                    total += len(lote)
+        return total
+
+
+class MovimientoMensual(RollupMovimiento):
+    """
+    Rollup mensual de movimientos. Fuente principal de gráficos, tendencias
+    y estadísticas para rangos largos.
+    """
+
+    PERIODO = 'mes'
+
+    mes = models.DateField(verbose_name=_("Mes"))
+
+    class Meta:
+        verbose_name = _("Movimiento Mensual")
+        verbose_name_plural = _("Movimientos Mensuales")
+        # 🚀 OPTIMIZACIÓN: Índices para series temporales por dimensión
+        indexes = [
+            models.Index(fields=['source', 'mes'], name='mov_mens_src_mes_idx'),
+            models.Index(fields=['source', 'mes', 'producto'], name='mov_mens_src_mes_prod_idx'),
+            models.Index(fields=['producto', 'mes'], name='mov_mens_prod_mes_idx'),
+            models.Index(fields=['almacen', 'mes'], name='mov_mens_alm_mes_idx'),
+            models.Index(fields=['proveedor', 'mes'], name='mov_mens_prov_mes_idx'),
+            models.Index(fields=['recepcionista', 'mes'], name='mov_mens_rec_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m} {self.source} {self.tipo} - {self.producto_id}: {self.cantidad_buena + self.cantidad_danada}"
+
+    @classmethod
+    def _expresion_periodo(cls):
+        return TruncMonth('movimiento__fecha')
+
+    @classmethod
+    def _limites_bucket(cls, fecha):
+        mes = fecha.replace(day=1)
+        return mes, _mes_siguiente(mes)
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    @staticmethod
+    def dividir_rango(fecha_inicio=None, fecha_fin=None):
+        """
+        Divide [fecha_inicio, fecha_fin] en meses completos y tramos parciales.
+        Retorna (mes_desde, mes_hasta_exclusivo, parciales) donde los meses
+        completos se leen del rollup mensual y los parciales del diario.
+        """
+        if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+            return None, None, []
+
+        desde = hasta = None
+        parciales = []
+
+        if fecha_inicio:
+            desde = fecha_inicio.replace(day=1)
+            if fecha_inicio.day != 1:
+                fin_mes = _mes_siguiente(desde) - timedelta(days=1)
+                parciales.append((fecha_inicio, min(fin_mes, fecha_fin) if fecha_fin else fin_mes))
+                desde = _mes_siguiente(desde)
+
+        if fecha_fin:
+            inicio_mes = fecha_fin.replace(day=1)
+            hasta = _mes_siguiente(inicio_mes)
+            if fecha_fin != hasta - timedelta(days=1):
+                # Evitar duplicar el tramo si inicio y fin caen en el mismo mes
+                if desde is None or inicio_mes >= desde:
+                    parciales.append((max(inicio_mes, fecha_inicio) if fecha_inicio else inicio_mes, fecha_fin))
+                hasta = inicio_mes
+
+        return desde, hasta, parciales
+
+    @classmethod
+    def resumir(cls, agrupar, fecha_inicio=None, fecha_fin=None, source=None, **filtros_clave):
+        """
+        Suma cantidades agrupando por `agrupar` (subconjunto de la clave) en el rango dado.
+        Los meses completos salen del rollup mensual y los bordes parciales del
+        rollup diario, así que el resultado es exacto para cualquier rango y
+        nunca suma más que unos cientos de filas pre-agregadas por grupo.
+
+        Retorna {tupla_de_grupo: {'cantidad_buena', 'cantidad_danada', 'total_movimientos'}}
+        """
+        agrupar = tuple(agrupar)
+        filtros_clave = {k: v for k, v in filtros_clave.items() if v not in (None, '')}
+        sources = [source] if source else [s for s, _label in cls.SOURCE_CHOICES]
+        resultado = {}
+
+        if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+            return resultado
+
+        desde, hasta, parciales = cls.dividir_rango(fecha_inicio, fecha_fin)
+
+        def acumular(qs):
+            for fila in qs.values(*agrupar).annotate(
+                suma_buena=Sum('cantidad_buena'),
+                suma_danada=Sum('cantidad_danada'),
+                lineas=Sum('total_movimientos')
+            ).order_by():
+                clave = tuple(fila[c] for c in agrupar)
+                acc = resultado.setdefault(clave, {
+                    'cantidad_buena': Decimal('0'),
+                    'cantidad_danada': Decimal('0'),
+                    'total_movimientos': 0,
+                })
+                acc['cantidad_buena'] += fila['suma_buena'] or 0
+                acc['cantidad_danada'] += fila['suma_danada'] or 0
+                acc['total_movimientos'] += fila['lineas'] or 0
+
+        # 1. Meses completos desde el rollup mensual
+        if not (desde and hasta and desde >= hasta):
+            qs = cls.objects.filter(source__in=sources, **filtros_clave)
+            if desde:
+                qs = qs.filter(mes__gte=desde)
+            if hasta:
+                qs = qs.filter(mes__lt=hasta)
+            acumular(qs)
+
+        # 2. Tramos parciales (como máximo dos, acotados a un mes) desde el rollup diario
+        for inicio, fin in parciales:
+            qs = MovimientoDiario.objects.filter(
+                source__in=sources, dia__gte=inicio, dia__lte=fin, **filtros_clave
+            )
+            if 'mes' in agrupar:
+                qs = qs.annotate(mes=TruncMonth('dia'))
+            acumular(qs)
+
+        return resultado
+
+
+class MovimientoDiario(RollupMovimiento):
+    """
+    Rollup diario de movimientos. Resuelve con exactitud los meses
+    parciales en los bordes de un rango de fechas.
+    """
+
+    PERIODO = 'dia'
+
+    dia = models.DateField(verbose_name=_("Día"))
+
+    class Meta:
+        verbose_name = _("Movimiento Diario")
+        verbose_name_plural = _("Movimientos Diarios")
+        # 🚀 OPTIMIZACIÓN: Índices para tramos de días en los bordes de un rango
+        indexes = [
+            models.Index(fields=['source', 'dia'], name='mov_dia_src_dia_idx'),
+            models.Index(fields=['source', 'dia', 'producto'], name='mov_dia_src_dia_prod_idx'),
+            models.Index(fields=['producto', 'dia'], name='mov_dia_prod_dia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia:%Y-%m-%d} {self.source} {self.tipo} - {self.producto_id}: {self.cantidad_buena + self.cantidad_danada}"
+
+    @classmethod
+    def _expresion_periodo(cls):
+        return F('movimiento__fecha')
+
+    @classmethod
+    def _limites_bucket(cls, fecha):
+        return fecha, fecha + timedelta(days=1)
+
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación pesada encolada para ejecutarse fuera del request.
+    El comando procesar_exportaciones toma los trabajos pendientes, genera el
+    archivo con la misma vista de exportación y lo deja listo para descargar.
+    """
+
+    TIPOS = (
+        ('movimientos_excel', _('Movimientos (Excel)')),
+        ('movimientos_csv', _('Movimientos (CSV)')),
+        ('stock_real_excel', _('Stock Real (Excel)')),
+        ('entregas_excel', _('Entregas a Clientes (Excel)')),
+        ('productos_excel', _('Productos (Excel)')),
+        ('libro_parquet', _('Libro de Movimientos (Parquet)')),
+        ('pdf_lote_almacen', _('PDFs de Movimientos de Almacén')),
+        ('pdf_lote_cliente', _('PDFs de Movimientos de Cliente')),
+    )
+
+    ESTADOS = (
+        ('PENDIENTE', _('Pendiente')),
+        ('PROCESANDO', _('Procesando')),
+        ('COMPLETADO', _('Completado')),
+        ('ERROR', _('Error')),
+    )
+
+    tipo = models.CharField(max_length=30, choices=TIPOS, verbose_name=_("Tipo"))
+    parametros = models.JSONField(default=dict, blank=True, verbose_name=_("Parámetros"))
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE', verbose_name=_("Estado"))
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name=_("Progreso (%)"))
+    archivo = models.FileField(upload_to='exportaciones/', blank=True, verbose_name=_("Archivo"))
+    tamano = models.PositiveBigIntegerField(default=0, verbose_name=_("Tamaño (bytes)"))
+    error = models.TextField(blank=True, verbose_name=_("Error"))
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name=_("Usuario")
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de Creación"))
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name=_("Inicio"))
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name=_("Fin"))
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name=_("Intentos"))
+
+    class Meta:
+        verbose_name = _("Exportación en Segundo Plano")
+        verbose_name_plural = _("6.5. Exportaciones en Segundo Plano")
+        ordering = ['-fecha_creacion']
+        # 🚀 OPTIMIZACIÓN: El worker busca siempre el pendiente más antiguo
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion'], name='trab_exp_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_tipo_display()} - {self.get_estado_display()}"
+
+    @property
+    def terminado(self):
+        return self.estado in ('COMPLETADO', 'ERROR')
+
+
+class VersionDatos(models.Model):
+    """
+    Contador de versión de un conjunto de datos. Se incrementa al confirmar cada
+    cambio (ver reportes/signals.py) y forma parte de la clave de la cache de
+    exportaciones: un cambio en los datos invalida los archivos generados.
+    PRODUCTOS invalida además los índices en memoria del catálogo
+    (productos/indices.py); CATALOGOS cubre almacenes, clientes, proveedores,
+    recepcionistas y categorías, cuyos nombres aparecen en las exportaciones.
+    """
+
+    MOVIMIENTOS = 'movimientos'
+    PRODUCTOS = 'productos'
+    CATALOGOS = 'catalogos'
+
+    nombre = models.CharField(max_length=50, unique=True, verbose_name=_("Nombre"))
+    version = models.PositiveBigIntegerField(default=0, verbose_name=_("Versión"))
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name=_("Fecha de Actualización"))
+
+    class Meta:
+        verbose_name = _("Versión de Datos")
+        verbose_name_plural = _("Versiones de Datos")
+
+    def __str__(self):
+        return f"{self.nombre} v{self.version}"
+
+    @classmethod
+    def incrementar(cls, nombre):
+        from django.utils import timezone
+
+        actualizados = cls.objects.filter(nombre=nombre).update(
+            version=F('version') + 1, fecha_actualizacion=timezone.now()
+        )
+        if not actualizados:
+            cls.objects.get_or_create(nombre=nombre, defaults={'version': 1})
+        if nombre == cls.PRODUCTOS:
+            # Este worker ve el cambio al instante, sin esperar INTERVALO_VERSION
+            from productos.indices import invalidar
+            invalidar()
+
+    @classmethod
+    def obtener(cls, nombre):
+        return cls.objects.filter(nombre=nombre).values_list('version', flat=True).first() or 0
+
@@ -0,0 +1,142 @@
+"""
+Paquete ZIP con un archivo de stock por almacén (cierre mensual).
+
+El stock y los componentes (entradas, salidas, traslados) de todos los
+almacenes se calculan una sola vez; cada archivo se genera en un proceso del
+pool (acotado por procesos_pool(), igual que los lotes de PDFs) a partir de
+filas ya calculadas y el ZIP se envía a medida que los
+archivos terminan.
+"""
+import csv
+import io
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+from .utils import procesos_pool
+
+ENCABEZADOS_STOCK = ["Almacén", "Código", "Producto", "Categoría", "Unidad", "Entradas", "Salidas",
+                     "Traslados Rec", "Traslados Env", "Stock Bueno", "Stock Dañado", "Stock Total"]
+
+FORMATOS = ('xlsx', 'csv')
+
+
+def calcular_filas_por_almacen(almacenes, productos, solo_con_stock=False, stock_minimo=False):
+    """
+    Filas del reporte detallado agrupadas por almacén: {almacen_id: [fila, ...]}.
+    🚀 OPTIMIZACIÓN: StockCache y componentes de todos los almacenes en dos
+    consultas agrupadas, en lugar de un cálculo completo por archivo. Los
+    componentes salen de views._componentes_stock, igual que en el reporte de stock.
+    """
+    from stock_cache.models import StockCache
+    from .views import _componentes_stock
+
+    almacen_ids = [a.id for a in almacenes]
+    productos_map = {
+        fila[0]: fila for fila in productos.values_list(
+            'id', 'codigo', 'nombre', 'categoria__nombre', 'unidad_medida__abreviatura', 'stock_minimo'
+        )
+    }
+    cero = Decimal('0')
+    # Mismos componentes que el reporte de stock (get_stock_bulk)
+    componentes = _componentes_stock(almacen_ids)
+
+    stocks = StockCache.objects.filter(
+        almacen_id__in=almacen_ids, producto_id__in=list(productos_map)
+    ).values_list('almacen_id', 'producto_id', 'stock_bueno', 'stock_danado', 'stock_total')
+
+    nombres = {a.id: a.nombre for a in almacenes}
+    resultado = {a.id: [] for a in almacenes}
+
+    for almacen_id, pid, stock_bueno, stock_danado, stock_total in stocks.order_by('almacen_id', 'producto_id'):
+        if solo_con_stock and stock_total == 0:
+            continue
+        _, codigo, nombre, categoria, unidad, minimo = productos_map[pid]
+        if stock_minimo and minimo and stock_bueno > minimo:
+            continue
+
+        comp = componentes.get((almacen_id, pid), {})
+        resultado[almacen_id].append([
+            nombres[almacen_id], codigo, nombre, categoria or '-', unidad or 'UND',
+            comp.get('ent_b', cero) + comp.get('ent_d', cero),
+            comp.get('sal_b', cero) + comp.get('sal_d', cero),
+            comp.get('tras_rec_b', cero) + comp.get('tras_rec_d', cero),
+            comp.get('tras_env_b', cero) + comp.get('tras_env_d', cero),
+            stock_bueno, stock_danado, stock_total
+        ])
+
+    return resultado
+
+
+def generar_archivo(almacen_id, nombre_almacen, filas, formato):
+    """
+    Genera el archivo de un almacén. Se ejecuta en un proceso del pool: solo recibe
+    y devuelve datos simples, sin acceso a la base de datos.
+    """
+    base = f"{almacen_id}_" + re.sub(r'[^\w\-]+', '_', nombre_almacen).strip('_')
+
+    if formato == 'csv':
+        salida = io.StringIO()
+        writer = csv.writer(salida, delimiter=';')
+        writer.writerow(ENCABEZADOS_STOCK)
+        writer.writerows(filas)
+        return f'stock_{base}.csv', ('\ufeff' + salida.getvalue()).encode('utf-8')
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Reporte Stock")
+    ws.append(ENCABEZADOS_STOCK)
+    for fila in filas:
+        ws.append(fila)
+    salida = io.BytesIO()
+    wb.save(salida)
+    return f'stock_{base}.xlsx', salida.getvalue()
+
+
+class _SalidaZip(io.RawIOBase):
+    """Destino no posicionable para ZipFile: acumula bytes hasta que se leen"""
+
+    def __init__(self):
+        self._bloques = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._bloques.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._bloques)
+        self._bloques = []
+        return datos
+
+
+def generar_zip(archivos_por_almacen, formato, max_procesos=None):
+    """
+    Generador de bytes del ZIP. archivos_por_almacen: [(almacen_id, nombre_almacen, filas)].
+    Cada archivo se agrega en cuanto su proceso termina.
+    """
+    salida = _SalidaZip()
+    max_procesos = max_procesos or procesos_pool(len(archivos_por_almacen))
+
+    with zipfile.ZipFile(salida, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        if max_procesos == 1:
+            resultados = (generar_archivo(*archivo, formato) for archivo in archivos_por_almacen)
+            for nombre_archivo, contenido in resultados:
+                zf.writestr(nombre_archivo, contenido)
+                yield salida.vaciar()
+        else:
+            with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+                futuros = [
+                    pool.submit(generar_archivo, *archivo, formato)
+                    for archivo in archivos_por_almacen
+                ]
+                for futuro in as_completed(futuros):
+                    nombre_archivo, contenido = futuro.result()
+                    zf.writestr(nombre_archivo, contenido)
+                    yield salida.vaciar()
+
+    yield salida.vaciar()
@@ -0,0 +1,205 @@
+"""
+PDFs de movimientos por lote (todas las salidas de un día, los recibos de
+entrega de una campaña...).
+
+Los movimientos se leen por bloques con la cabecera (select_related) y los
+detalles (Prefetch) ya cargados; cada PDF se genera en un proceso del pool sin
+consultas a la base de datos. El resultado es un ZIP que se envía a medida que
+los PDFs terminan o un único PDF combinado (pypdf).
+
+El pool tiene como máximo procesos_pool() procesos (REPORTES_MAX_PROCESOS). Los
+lotes de más de MAX_MOVIMIENTOS_EN_LINEA movimientos no se generan en el request:
+se encolan como TrabajoExportacion (tipos pdf_lote_almacen / pdf_lote_cliente).
+"""
+import io
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.db.models import Q, Prefetch
+
+from .paquetes import _SalidaZip
+from .utils import procesos_pool
+
+FUENTES = ('almacen', 'cliente')
+FORMATOS = ('zip', 'pdf')
+
+BLOQUE_MOVIMIENTOS = 100
+MAX_MOVIMIENTOS = 3000
+# Por encima de este total el lote va a la cola de exportaciones
+MAX_MOVIMIENTOS_EN_LINEA = 200
+
+
+def _fuente(fuente):
+    """(modelo, modelo de detalle, generador de PDF, relaciones de cabecera) de una fuente"""
+    if fuente == 'almacen':
+        from almacenes.models import MovimientoAlmacen, DetalleMovimientoAlmacen
+        from almacenes.utils import generar_reporte_movimiento_pdf
+        return (
+            MovimientoAlmacen, DetalleMovimientoAlmacen, generar_reporte_movimiento_pdf,
+            ('almacen_origen', 'almacen_destino', 'proveedor', 'recepcionista'),
+        )
+    if fuente == 'cliente':
+        from beneficiarios.models import MovimientoCliente, DetalleMovimientoCliente
+        from beneficiarios.utils_cliente import generar_reporte_cliente_pdf
+        return (
+            MovimientoCliente, DetalleMovimientoCliente, generar_reporte_cliente_pdf,
+            ('cliente', 'cliente_origen', 'cliente_destino', 'almacen_origen',
+             'almacen_destino', 'proveedor', 'recepcionista'),
+        )
+    raise ValueError(f'Fuente desconocida: {fuente}')
+
+
+def _pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        raise RuntimeError(
+            'Combinar los PDFs en un solo archivo requiere pypdf. Instálelo con: pip install pypdf'
+        )
+    return pypdf
+
+
+def movimientos_lote(fuente, fecha_inicio=None, fecha_fin=None, almacen_id=None,
+                     cliente_id=None, tipo=None, ids=None):
+    """Movimientos del lote con todo lo que usa el PDF precargado, en orden de fecha y número"""
+    modelo, modelo_detalle, _, relaciones = _fuente(fuente)
+
+    movimientos = modelo.objects.select_related(*relaciones).prefetch_related(
+        Prefetch('detalles', queryset=modelo_detalle.objects.select_related('producto__unidad_medida'))
+    ).order_by('fecha', 'numero_movimiento')
+
+    if ids is not None:
+        movimientos = movimientos.filter(pk__in=ids)
+    if fecha_inicio:
+        movimientos = movimientos.filter(fecha__gte=fecha_inicio)
+    if fecha_fin:
+        movimientos = movimientos.filter(fecha__lte=fecha_fin)
+    if tipo:
+        movimientos = movimientos.filter(tipo=tipo)
+    if almacen_id:
+        movimientos = movimientos.filter(Q(almacen_origen_id=almacen_id) | Q(almacen_destino_id=almacen_id))
+    if cliente_id:
+        if fuente != 'cliente':
+            raise ValueError('El filtro por cliente solo aplica a movimientos de cliente')
+        movimientos = movimientos.filter(
+            Q(cliente_id=cliente_id) | Q(cliente_origen_id=cliente_id) | Q(cliente_destino_id=cliente_id)
+        )
+    return movimientos
+
+
+def _inicializar_proceso():
+    # Con 'fork' Django ya está cargado; con 'spawn'/'forkserver' hay que cargarlo
+    import django
+    django.setup()
+
+
+def _renderizar(fuente, movimiento):
+    """Se ejecuta en un proceso del pool: el movimiento llega con sus relaciones precargadas"""
+    _, _, generar, _ = _fuente(fuente)
+    nombre = re.sub(r'[^\w\-]+', '_', movimiento.numero_movimiento).strip('_')
+    return f'movimiento_{nombre}.pdf', generar(movimiento).getvalue()
+
+
+def _bloques(movimientos):
+    bloque = []
+    for movimiento in movimientos.iterator(chunk_size=BLOQUE_MOVIMIENTOS):
+        bloque.append(movimiento)
+        if len(bloque) >= BLOQUE_MOVIMIENTOS:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def renderizar_lote(fuente, movimientos, max_procesos=None):
+    """Generador de (nombre_archivo, bytes) en el orden de `movimientos`"""
+    max_procesos = max_procesos or procesos_pool()
+
+    if max_procesos == 1:
+        for bloque in _bloques(movimientos):
+            for movimiento in bloque:
+                yield _renderizar(fuente, movimiento)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_procesos, initializer=_inicializar_proceso) as pool:
+        for bloque in _bloques(movimientos):
+            yield from pool.map(_renderizar, [fuente] * len(bloque), bloque)
+
+
+def generar_zip(pdfs):
+    """Generador de bytes del ZIP; cada PDF se agrega apenas está listo"""
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre_archivo, contenido in pdfs:
+            zf.writestr(nombre_archivo, contenido)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def combinar_pdf(pdfs, destino):
+    """Escribe en `destino` (ruta o archivo binario) un único PDF con todas las páginas"""
+    pypdf = _pypdf()
+    escritor = pypdf.PdfWriter()
+    for _, contenido in pdfs:
+        escritor.append(io.BytesIO(contenido))
+    escritor.write(destino)
+
+
+def validar_total(total):
+    """Lanza ValueError si el lote está vacío o supera MAX_MOVIMIENTOS"""
+    if total == 0:
+        raise ValueError('No hay movimientos con los filtros indicados')
+    if total > MAX_MOVIMIENTOS:
+        raise ValueError(
+            f'El lote tiene {total} movimientos; el máximo es {MAX_MOVIMIENTOS}. Acote los filtros.'
+        )
+
+
+def respuesta_lote(fuente, movimientos, formato='zip', total=None):
+    """
+    Respuesta HTTP del lote: ZIP por streaming o PDF combinado (archivo temporal).
+    Lanza ValueError si el lote está vacío o supera MAX_MOVIMIENTOS y
+    RuntimeError si se pide PDF combinado sin pypdf.
+    """
+    from django.http import StreamingHttpResponse, FileResponse
+
+    validar_total(movimientos.count() if total is None else total)
+
+    base = f'movimientos_{fuente}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+
+    if formato == 'pdf':
+        _pypdf()
+        archivo = tempfile.TemporaryFile(suffix='.pdf')
+        combinar_pdf(renderizar_lote(fuente, movimientos), archivo)
+        archivo.seek(0)
+        return FileResponse(archivo, as_attachment=True, filename=f'{base}.pdf', content_type='application/pdf')
+
+    response = StreamingHttpResponse(
+        generar_zip(renderizar_lote(fuente, movimientos)), content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename={base}.zip'
+    return response
+
+
+def respuesta_accion(request, fuente, queryset):
+    """
+    Respuesta de la acción "Imprimir PDFs seleccionados": el ZIP en el request o,
+    por encima de MAX_MOVIMIENTOS_EN_LINEA, un trabajo encolado y su página de progreso.
+    """
+    from django.shortcuts import redirect
+    from .models import TrabajoExportacion
+
+    movimientos = movimientos_lote(fuente, ids=queryset.values('pk'))
+    total = movimientos.count()
+    validar_total(total)
+    if total > MAX_MOVIMIENTOS_EN_LINEA:
+        trabajo = TrabajoExportacion.objects.create(
+            tipo=f'pdf_lote_{fuente}',
+            parametros={'ids': [str(pk) for pk in queryset.values_list('pk', flat=True)]},
+            usuario=request.user,
+        )
+        return redirect('admin:reportes_trabajoexportacion_estado', pk=trabajo.pk)
+    return respuesta_lote(fuente, movimientos, total=total)
@@ -0,0 +1,293 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from almacenes.models import Almacen, MovimientoAlmacen, DetalleMovimientoAlmacen
+from beneficiarios.models import Cliente, MovimientoCliente, DetalleMovimientoCliente
+from productos.models import Categoria, Producto, UnidadMedida
+from proveedores.models import Proveedor
+from recepcionistas.models import Recepcionista
+from .models import recalcular_rollups_productos, VersionDatos
+
+
+# ==============================================================================
+# MANTENIMIENTO INCREMENTAL DE LOS ROLLUPS MENSUAL Y DIARIO
+# ==============================================================================
+# Cada cambio marca los buckets (source, fecha, producto) afectados y los recalcula
+# al confirmar la transacción. El recálculo es exacto e idempotente, así que no
+# hace falta llevar deltas de los valores anteriores.
+
+
+class _CambiosPendientes:
+    """
+    Buckets de rollup, cabeceras con detalles modificados y versiones de datos
+    de la transacción en curso.
+    🚀 OPTIMIZACIÓN: un solo on_commit por transacción; guardar un movimiento de
+    N líneas recalcula cada (source, fecha) con una consulta para todos sus
+    productos, los totales de cada cabecera una vez e incrementa cada versión
+    una vez, en lugar de N callbacks y N agregados.
+    """
+
+    def __init__(self):
+        self.rollups = {}
+        # {modelo de detalle: {movimiento_id: cabecera en memoria o None}}
+        self.cabeceras = {}
+        self.versiones = set()
+
+    def aplicar(self):
+        for modelo_detalle, cabeceras in self.cabeceras.items():
+            _actualizar_cabeceras(modelo_detalle, cabeceras)
+        for (source, fecha), productos in self.rollups.items():
+            recalcular_rollups_productos(source, fecha, productos)
+        for nombre in self.versiones:
+            VersionDatos.incrementar(nombre)
+
+
+def _registrar_cambio(version=None, rollup=None, cabecera=None):
+    """
+    Agrega el cambio a los pendientes de la transacción; `rollup` es
+    (source, fecha, producto_id) y `cabecera` (modelo de detalle, movimiento_id, movimiento o None).
+    Los pendientes siguen vigentes mientras su callback esté en la cola on_commit
+    de la conexión: tras un rollback (o fuera de una transacción, donde on_commit
+    se ejecuta en el acto) se empieza un conjunto nuevo.
+    """
+    conexion = transaction.get_connection()
+    pendientes = getattr(conexion, '_reportes_cambios_pendientes', None)
+    nuevo = pendientes is None or not any(
+        callback[1] == pendientes.aplicar for callback in conexion.run_on_commit
+    )
+    if nuevo:
+        pendientes = _CambiosPendientes()
+        conexion._reportes_cambios_pendientes = pendientes
+
+    if version:
+        pendientes.versiones.add(version)
+    if rollup:
+        source, fecha, producto_id = rollup
+        pendientes.rollups.setdefault((source, fecha), set()).add(producto_id)
+    if cabecera:
+        modelo_detalle, movimiento_id, movimiento = cabecera
+        cabeceras = pendientes.cabeceras.setdefault(modelo_detalle, {})
+        if movimiento is not None or movimiento_id not in cabeceras:
+            cabeceras[movimiento_id] = movimiento
+
+    if nuevo:
+        transaction.on_commit(pendientes.aplicar)
+
+
+def _marcar_datos_modificados():
+    """Invalida la cache de exportaciones (la versión forma parte de su clave)"""
+    _registrar_cambio(version=VersionDatos.MOVIMIENTOS)
+
+
+def _tocar_cabecera(sender, movimiento_id, movimiento=None):
+    """
+    Un cambio de detalle marca la cabecera para recalcular, al confirmar, los
+    totales guardados (total_productos, total_cantidad_buena,
+    total_cantidad_danada) y su fecha_actualizacion, que forma parte de la
+    clave de los PDFs cacheados.
+    """
+    _registrar_cambio(cabecera=(sender, movimiento_id, movimiento))
+
+
+def _actualizar_cabeceras(sender, cabeceras):
+    """
+    Totales de todas las cabeceras marcadas con una consulta agrupada y un UPDATE
+    por cabecera. Si la cabecera está en memoria (formset del admin) se actualiza
+    también, para que un save() posterior no escriba totales viejos.
+    """
+    filas = sender.objects.filter(movimiento_id__in=list(cabeceras)).values('movimiento_id').annotate(
+        total_productos=Count('id'),
+        total_cantidad_buena=Sum('cantidad'),
+        total_cantidad_danada=Sum('cantidad_danada'),
+    ).order_by()
+    por_movimiento = {fila.pop('movimiento_id'): fila for fila in filas}
+    modelo_cabecera = sender._meta.get_field('movimiento').related_model
+    ahora = timezone.now()
+
+    for movimiento_id, movimiento in cabeceras.items():
+        # Sin detalles (todos eliminados) los totales vuelven a cero
+        totales = {
+            campo: valor or 0
+            for campo, valor in por_movimiento.get(movimiento_id, {
+                'total_productos': 0, 'total_cantidad_buena': 0, 'total_cantidad_danada': 0,
+            }).items()
+        }
+        modelo_cabecera.objects.filter(pk=movimiento_id).update(fecha_actualizacion=ahora, **totales)
+        if movimiento is not None:
+            for campo, valor in totales.items():
+                setattr(movimiento, campo, valor)
+            movimiento.fecha_actualizacion = ahora
+
+
+def _programar_recalculo(source, fecha, producto_id):
+    if fecha is None or producto_id is None:
+        return
+    _registrar_cambio(rollup=(source, fecha, producto_id))
+
+
+def _detalle_previo(sender, instance, **kwargs):
+    """Guarda (fecha, producto) anteriores para recalcular también el bucket viejo"""
+    instance._rollup_previo = None
+    if instance.pk:
+        instance._rollup_previo = sender.objects.filter(pk=instance.pk).values_list(
+            'movimiento__fecha', 'producto_id'
+        ).first()
+
+
+def _detalle_guardado(source, instance):
+    _marcar_datos_modificados()
+    _tocar_cabecera(type(instance), instance.movimiento_id, instance.movimiento)
+    previo = getattr(instance, '_rollup_previo', None)
+    fecha_actual = instance.movimiento.fecha
+    if previo and previo != (fecha_actual, instance.producto_id):
+        _programar_recalculo(source, previo[0], previo[1])
+    _programar_recalculo(source, fecha_actual, instance.producto_id)
+
+
+def _detalle_eliminado(sender, source, instance):
+    _marcar_datos_modificados()
+    campo = sender._meta.get_field('movimiento')
+    _tocar_cabecera(
+        sender, instance.movimiento_id, instance.movimiento if campo.is_cached(instance) else None
+    )
+    if campo.is_cached(instance):
+        fecha = instance.movimiento.fecha
+    else:
+        # En borrados en cascada la cabecera aún existe: se borran antes los detalles
+        fecha = campo.related_model.objects.filter(
+            pk=instance.movimiento_id
+        ).values_list('fecha', flat=True).first()
+    _programar_recalculo(source, fecha, instance.producto_id)
+
+
+def _cabecera_previa(sender, instance, **kwargs):
+    instance._rollup_fecha_previa = None
+    if instance.pk:
+        instance._rollup_fecha_previa = sender.objects.filter(pk=instance.pk).values_list(
+            'fecha', flat=True
+        ).first()
+
+
+def _cabecera_guardada(source, instance, created):
+    """
+    Un cambio de cabecera (fecha, tipo, almacenes, proveedor, recepcionista)
+    mueve todas sus líneas de bucket: se recalculan la fecha vieja y la nueva.
+    """
+    _marcar_datos_modificados()
+    if created:
+        return
+    productos = list(instance.detalles.values_list('producto_id', flat=True))
+    fechas = {instance.fecha}
+    if getattr(instance, '_rollup_fecha_previa', None):
+        fechas.add(instance._rollup_fecha_previa)
+    for fecha in fechas:
+        for producto_id in productos:
+            _programar_recalculo(source, fecha, producto_id)
+
+
+# --- Movimientos de almacén ---
+
+@receiver(pre_save, sender=DetalleMovimientoAlmacen)
+def rollup_detalle_almacen_previo(sender, instance, **kwargs):
+    _detalle_previo(sender, instance)
+
+
+@receiver(post_save, sender=DetalleMovimientoAlmacen)
+def rollup_detalle_almacen_guardado(sender, instance, **kwargs):
+    _detalle_guardado('ALMACEN', instance)
+
+
+@receiver(post_delete, sender=DetalleMovimientoAlmacen)
+def rollup_detalle_almacen_eliminado(sender, instance, **kwargs):
+    _detalle_eliminado(sender, 'ALMACEN', instance)
+
+
+@receiver(pre_save, sender=MovimientoAlmacen)
+def rollup_movimiento_almacen_previo(sender, instance, **kwargs):
+    _cabecera_previa(sender, instance)
+
+
+@receiver(post_save, sender=MovimientoAlmacen)
+def rollup_movimiento_almacen_guardado(sender, instance, created, **kwargs):
+    _cabecera_guardada('ALMACEN', instance, created)
+
+
+@receiver(post_delete, sender=MovimientoAlmacen)
+def version_movimiento_almacen_eliminado(sender, instance, **kwargs):
+    _marcar_datos_modificados()
+
+
+# --- Movimientos de cliente ---
+
+@receiver(pre_save, sender=DetalleMovimientoCliente)
+def rollup_detalle_cliente_previo(sender, instance, **kwargs):
+    _detalle_previo(sender, instance)
+
+
+@receiver(post_save, sender=DetalleMovimientoCliente)
+def rollup_detalle_cliente_guardado(sender, instance, **kwargs):
+    _detalle_guardado('CLIENTE', instance)
+
+
+@receiver(post_delete, sender=DetalleMovimientoCliente)
+def rollup_detalle_cliente_eliminado(sender, instance, **kwargs):
+    _detalle_eliminado(sender, 'CLIENTE', instance)
+
+
+@receiver(pre_save, sender=MovimientoCliente)
+def rollup_movimiento_cliente_previo(sender, instance, **kwargs):
+    _cabecera_previa(sender, instance)
+
+
+@receiver(post_save, sender=MovimientoCliente)
+def rollup_movimiento_cliente_guardado(sender, instance, created, **kwargs):
+    _cabecera_guardada('CLIENTE', instance, created)
+
+
+@receiver(post_delete, sender=MovimientoCliente)
+def version_movimiento_cliente_eliminado(sender, instance, **kwargs):
+    _marcar_datos_modificados()
+
+
+# ==============================================================================
+# VERSIÓN DEL CATÁLOGO DE PRODUCTOS
+# ==============================================================================
+# Invalida los índices en memoria de productos de cada worker (productos/indices.py).
+# La unidad forma parte de la etiqueta del producto ("código - nombre - unidad").
+
+def _marcar_productos_modificados():
+    _registrar_cambio(version=VersionDatos.PRODUCTOS)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=UnidadMedida)
+@receiver(post_delete, sender=UnidadMedida)
+def version_productos_modificados(sender, **kwargs):
+    _marcar_productos_modificados()
+
+
+# ==============================================================================
+# VERSIÓN DE LOS DEMÁS CATÁLOGOS
+# ==============================================================================
+# Sus nombres aparecen en las exportaciones cacheadas (reportes/cache_exportaciones.py).
+
+def _marcar_catalogos_modificados():
+    _registrar_cambio(version=VersionDatos.CATALOGOS)
+
+
+@receiver(post_save, sender=Almacen)
+@receiver(post_delete, sender=Almacen)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_save, sender=Recepcionista)
+@receiver(post_delete, sender=Recepcionista)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def version_catalogos_modificados(sender, **kwargs):
+    _marcar_catalogos_modificados()
@@ -1,3 +1,244 @@
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.db import IntegrityError
 from django.test import TestCase
+from openpyxl import Workbook
+
+from almacenes.models import Almacen, MovimientoAlmacen
+from beneficiarios.models import Cliente, MovimientoCliente, DetalleMovimientoCliente
+from productos.models import Categoria, UnidadMedida, Producto
+from proveedores.models import Proveedor
+from recepcionistas.models import Recepcionista
+from reportes.importacion_movimientos import importar_movimientos
+from reportes.models import ReporteEntregas
+
+
+def crear_catalogo():
+    """Almacén, dos clientes y tres productos (el tercero sin movimientos)"""
+    categoria = Categoria.objects.create(nombre='Semillas')
+    unidad = UnidadMedida.objects.create(nombre='Kilogramo', abreviatura='KG')
+    productos = [
+        Producto.objects.create(tipo='INSUMOS', nombre=nombre, categoria=categoria, unidad_medida=unidad)
+        for nombre in ('Maíz', 'Frijol', 'Arroz')
+    ]
+    clientes = [
+        Cliente.objects.create(codigo=codigo, nombre=f'Cliente {codigo}', direccion='Comunidad')
+        for codigo in ('C1', 'C2')
+    ]
+    almacen = Almacen.objects.create(nombre='Central', codigo='ALM')
+    return almacen, clientes, productos
+
+
+def crear_movimiento(tipo, cliente, detalles, **campos):
+    movimiento = MovimientoCliente.objects.create(
+        tipo=tipo, cliente=cliente, fecha=date(2024, 1, 15), **campos
+    )
+    for producto, cantidad, cantidad_danada in detalles:
+        DetalleMovimientoCliente.objects.create(
+            movimiento=movimiento, producto=producto,
+            cantidad=Decimal(cantidad), cantidad_danada=Decimal(cantidad_danada),
+        )
+    return movimiento
+
+
+class AgregarEntregasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.almacen, (cls.c1, cls.c2), (cls.p1, cls.p2, cls.p3) = crear_catalogo()
+
+        crear_movimiento('ENTRADA', cls.c1, [(cls.p1, '10', '2'), (cls.p2, '5', '0')],
+                         almacen_origen=cls.almacen)
+        crear_movimiento('SALIDA', cls.c1, [(cls.p1, '3', '0')], almacen_destino=cls.almacen)
+        crear_movimiento('TRASLADO', cls.c1, [(cls.p1, '4', '1')],
+                         cliente_origen=cls.c1, cliente_destino=cls.c2)
+
+        # Traslado incompleto (dato heredado sin cliente destino): save() no lo permite
+        incompleto = crear_movimiento('TRASLADO', cls.c2, [(cls.p2, '1', '0')],
+                                      cliente_origen=cls.c2, cliente_destino=cls.c1)
+        MovimientoCliente.objects.filter(pk=incompleto.pk).update(cliente_destino=None)
+
+    def test_entrada_y_salida(self):
+        pares = ReporteEntregas.agregar_entregas()['pares']
+
+        item = pares[(self.c1.id, self.p2.id)]
+        self.assertEqual(item['total_entregas'], 1)
+        self.assertEqual(item['cantidad_entrada'], Decimal('5'))
+        self.assertEqual(item['cantidad_salida'], Decimal('0'))
+        self.assertEqual(item['stock_bueno'], Decimal('5'))
+
+        # ENTRADA 10+2, SALIDA 3 y traslado de 4+1 al cliente C2
+        item = pares[(self.c1.id, self.p1.id)]
+        self.assertEqual(item['total_entregas'], 3)
+        self.assertEqual(item['cantidad_entrada'], Decimal('12'))
+        self.assertEqual(item['cantidad_salida'], Decimal('3'))
+        self.assertEqual(item['cantidad_buena'], Decimal('17'))
+        self.assertEqual(item['cantidad_danada'], Decimal('3'))
+
+    def test_traslado_completo(self):
+        agregado = ReporteEntregas.agregar_entregas()
+        pares = agregado['pares']
+
+        origen = pares[(self.c1.id, self.p1.id)]
+        self.assertEqual(origen['cantidad_traslado_origen'], Decimal('5'))
+        self.assertEqual(origen['cantidad_traslado_destino'], Decimal('0'))
+        self.assertEqual(origen['stock_bueno'], Decimal('3'))  # 10 - 3 - 4
+        self.assertEqual(origen['stock_danado'], Decimal('1'))  # 2 - 1
+
+        destino = pares[(self.c2.id, self.p1.id)]
+        self.assertEqual(destino['total_entregas'], 1)
+        self.assertEqual(destino['cantidad_traslado_destino'], Decimal('5'))
+        self.assertEqual(destino['cantidad_entrada'], Decimal('0'))
+        self.assertEqual(destino['stock_bueno'], Decimal('4'))
+        self.assertEqual(destino['stock_danado'], Decimal('1'))
+
+        # El traslado cuenta una sola vez para el producto, pero en ambos clientes
+        self.assertEqual(agregado['movimientos_producto'][self.p1.id], 3)
+        self.assertEqual(agregado['movimientos_cliente'][self.c1.id], 3)
+        self.assertEqual(agregado['movimientos_cliente'][self.c2.id], 2)
+
+    def test_traslado_incompleto(self):
+        agregado = ReporteEntregas.agregar_entregas()
+
+        # Va por el cliente del movimiento y no suma como entrada, salida ni traslado
+        item = agregado['pares'][(self.c2.id, self.p2.id)]
+        self.assertEqual(item['total_entregas'], 1)
+        self.assertEqual(item['cantidad_buena'], Decimal('1'))
+        self.assertEqual(item['cantidad_entrada'], Decimal('0'))
+        self.assertEqual(item['cantidad_salida'], Decimal('0'))
+        self.assertEqual(item['cantidad_traslado_origen'], Decimal('0'))
+        self.assertEqual(item['stock_bueno'], Decimal('0'))
+        self.assertEqual(agregado['pares'][(self.c1.id, self.p2.id)]['total_entregas'], 1)
+        self.assertEqual(agregado['movimientos_producto'][self.p2.id], 2)
+
+    def test_filtro_cliente(self):
+        agregado = ReporteEntregas.agregar_entregas(cliente_id=self.c1.id)
+
+        # El traslado incompleto de C2 queda fuera; el completo trae el tramo destino
+        self.assertEqual(set(agregado['pares']), {
+            (self.c1.id, self.p1.id), (self.c1.id, self.p2.id), (self.c2.id, self.p1.id),
+        })
+        self.assertEqual(agregado['movimientos_cliente'][self.c2.id], 1)
+
+        filas = list(ReporteEntregas.entregas_detallado(agregado, cliente_id=self.c1.id))
+        self.assertEqual(
+            [(f['cliente_id'], f['producto_id']) for f in filas],
+            [(self.c1.id, self.p1.id), (self.c1.id, self.p2.id)],
+        )
+        self.assertEqual(filas[0]['stock_total'], Decimal('4'))
+
+    def test_detallado_mostrar_todos(self):
+        agregado = ReporteEntregas.agregar_entregas(cliente_id=self.c1.id)
+        filas = list(ReporteEntregas.entregas_detallado(
+            agregado, cliente_id=self.c1.id, mostrar_todos=True
+        ))
+
+        self.assertEqual([f['producto_id'] for f in filas], [self.p1.id, self.p2.id, self.p3.id])
+        self.assertEqual(filas[2]['total_entregas'], 0)
+        self.assertEqual(filas[2]['stock_total'], Decimal('0'))
+
+
+def excel(*filas):
+    """Archivo Excel en memoria con una fila de títulos y `filas`"""
+    wb = Workbook()
+    wb.active.append(['Títulos'])
+    for fila in filas:
+        wb.active.append(list(fila))
+    archivo = BytesIO()
+    wb.save(archivo)
+    archivo.seek(0)
+    return archivo
+
+
+class ImportarMovimientosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.almacen, (cls.c1, cls.c2), (cls.p1, cls.p2, cls.p3) = crear_catalogo()
+        cls.cabecera_cliente = {
+            'tipo': 'ENTRADA', 'fecha': date(2024, 2, 1), 'almacen_origen_id': cls.almacen.id,
+        }
+        cls.cabecera_almacen = {
+            'tipo': 'ENTRADA', 'fecha': date(2024, 2, 1), 'almacen_destino_id': cls.almacen.id,
+            'proveedor_id': Proveedor.objects.create(nombre='Transportes Andinos').id,
+            'recepcionista_id': Recepcionista.objects.create(nombre='Ana Quispe').id,
+        }
+
+    def test_numeracion_por_cliente(self):
+        crear_movimiento('ENTRADA', self.c1, [(self.p1, '1', '0')], almacen_origen=self.almacen)
+
+        resultado = importar_movimientos('cliente', excel(
+            ('c1', self.p1.codigo, 2, 0),
+            ('C2', self.p1.codigo, '1,5', 1),
+            ('C1', self.p2.codigo, 3, None, 'Lote 7'),
+        ), self.cabecera_cliente)
+
+        self.assertEqual(resultado['errores'], [])
+        self.assertEqual(resultado['movimientos'], ['C1/ENT-0002', 'C2/ENT-0001'])
+        self.assertEqual(resultado['detalles'], 3)
+
+        movimiento = MovimientoCliente.objects.get(numero_movimiento='C1/ENT-0002')
+        self.assertEqual(movimiento.total_productos, 2)
+        self.assertEqual(movimiento.total_cantidad_buena, Decimal('5'))
+        detalle = movimiento.detalles.get(producto=self.p2)
+        self.assertEqual(detalle.observaciones_producto, 'Lote 7')
+
+        detalle = DetalleMovimientoCliente.objects.get(movimiento__cliente=self.c2)
+        self.assertEqual(detalle.cantidad, Decimal('1.50'))
+        self.assertEqual(detalle.cantidad_danada, Decimal('1'))
+
+    def test_numeracion_por_almacen(self):
+        for esperado in ('ALM/ENT-0001', 'ALM/ENT-0002'):
+            resultado = importar_movimientos(
+                'almacen', excel((self.p1.codigo, 4, 0)), self.cabecera_almacen
+            )
+            self.assertEqual(resultado['movimientos'], [esperado])
+
+        self.assertEqual(MovimientoAlmacen.objects.count(), 2)
+
+    def test_producto_repetido(self):
+        resultado = importar_movimientos('cliente', excel(
+            ('C1', self.p1.codigo, 1, 0),
+            ('C2', self.p1.codigo, 1, 0),
+            ('C1', self.p1.codigo.lower(), 2, 0),
+        ), self.cabecera_cliente)
+
+        # El mismo producto en otro cliente es válido; en el mismo, no
+        self.assertEqual(resultado['errores'], [{
+            'fila': 4, 'error': f"Producto '{self.p1.codigo.lower()}' repetido (ya está en la fila 2)",
+        }])
+        self.assertEqual(resultado['movimientos'], [])
+        self.assertFalse(MovimientoCliente.objects.exists())
+
+    def test_filas_con_errores_no_importan_nada(self):
+        resultado = importar_movimientos('cliente', excel(
+            ('C1', self.p1.codigo, 1, 0),
+            ('C9', self.p1.codigo, 1, 0),
+            ('C2', 'X9999', 1, 0),
+            ('C2', self.p2.codigo, -1, 0),
+            ('C2', self.p3.codigo, 0, 0),
+        ), self.cabecera_cliente)
+
+        self.assertEqual([error['fila'] for error in resultado['errores']], [3, 4, 5, 6])
+        self.assertFalse(MovimientoCliente.objects.exists())
+        self.assertFalse(DetalleMovimientoCliente.objects.exists())
+
+    def test_error_al_guardar_revierte_cabeceras(self):
+        archivo = excel(('C1', self.p1.codigo, 1, 0), ('C2', self.p2.codigo, 1, 0))
+        with mock.patch.object(DetalleMovimientoCliente.objects, 'bulk_create',
+                               side_effect=IntegrityError('fallo')):
+            with self.assertRaises(IntegrityError):
+                importar_movimientos('cliente', archivo, self.cabecera_cliente)
+
+        self.assertFalse(MovimientoCliente.objects.exists())
 
-# Create your tests here.
+    def test_cabecera_invalida(self):
+        with self.assertRaises(ValueError):
+            importar_movimientos('cliente', excel(('C1', self.p1.codigo, 1, 0)), {
+                'tipo': 'TRASLADO', 'fecha': date(2024, 2, 1),
+            })
+        with self.assertRaises(ValueError):
+            importar_movimientos('cliente', excel(('C1', self.p1.codigo, 1, 0)), {
+                'tipo': 'ENTRADA', 'fecha': date(2024, 2, 1),
+            })
@@ -11,4 +11,9 @@ urlpatterns = [
     path('obtener-detalle-producto-almacenes/', views.obtener_detalle_producto_almacenes, name='obtener_detalle_producto_almacenes'),
     path('api/numeros-movimiento/', views.obtener_numeros_movimiento_json, name='obtener_numeros_movimiento_json'),
     path('obtener-detalle-estadistica/', views.obtener_detalle_estadistica, name='obtener_detalle_estadistica'),
+    # Opciones de filtros (typeahead)
+    path('api/buscar-productos/', views.buscar_productos, name='buscar_productos'),
+    path('api/buscar-clientes/', views.buscar_clientes, name='buscar_clientes'),
+    path('api/buscar-proveedores/', views.buscar_proveedores, name='buscar_proveedores'),
+    path('api/buscar-recepcionistas/', views.buscar_recepcionistas, name='buscar_recepcionistas'),
 ]
\ No newline at end of file
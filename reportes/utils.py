@@ -0,0 +1,119 @@
+"""
+Utilidades compartidas por los reportes
+"""
+import json
+import os
+from datetime import date
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+
+# ==============================================================================
+# PAGINACIÓN POR CURSOR (KEYSET) SOBRE (fecha, id)
+# ==============================================================================
+# A diferencia de OFFSET, el costo de cada página es constante: la consulta
+# arranca en el índice (fecha, id) justo después de la última fila vista.
+
+def codificar_cursor(fecha, pk):
+    return f"{fecha.isoformat()}_{pk}"
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido"""
+    try:
+        fecha_str, pk = cursor.split('_', 1)
+        return date.fromisoformat(fecha_str), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def paginar_keyset(queryset, cursor=None, direccion='next', por_pagina=100):
+    """
+    Pagina un queryset de movimientos ordenado por (-fecha, -id).
+
+    - direccion='next': filas posteriores (más antiguas) al cursor.
+    - direccion='prev': filas anteriores (más recientes) al cursor.
+    - direccion='ultima': las filas más antiguas (no necesita cursor).
+
+    Retorna un dict con 'items' (lista) y los cursores para navegar.
+    """
+    posicion = decodificar_cursor(cursor) if cursor else None
+    queryset = queryset.order_by()
+
+    if direccion == 'ultima':
+        filas = list(queryset.order_by('fecha', 'id')[:por_pagina + 1])
+        items = list(reversed(filas[:por_pagina]))
+        has_previous, has_next = len(filas) > por_pagina, False
+    elif posicion and direccion == 'prev':
+        fecha, pk = posicion
+        qs = queryset.filter(Q(fecha__gt=fecha) | Q(fecha=fecha, id__gt=pk)).order_by('fecha', 'id')
+        filas = list(qs[:por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        items = list(reversed(filas[:por_pagina]))
+        has_previous, has_next = hay_mas, True
+    else:
+        qs = queryset
+        if posicion:
+            fecha, pk = posicion
+            qs = qs.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=pk))
+        filas = list(qs.order_by('-fecha', '-id')[:por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        items = filas[:por_pagina]
+        has_previous, has_next = bool(posicion), hay_mas
+
+    return {
+        'items': items,
+        'has_next': has_next and bool(items),
+        'has_previous': has_previous and bool(items),
+        'cursor_siguiente': codificar_cursor(items[-1].fecha, items[-1].pk) if items else '',
+        'cursor_anterior': codificar_cursor(items[0].fecha, items[0].pk) if items else '',
+    }
+
+
+# ==============================================================================
+# CONTEO APROXIMADO
+# ==============================================================================
+
+def contar_aproximado(queryset, umbral_exacto=10000):
+    """
+    Devuelve (total, es_aproximado).
+    En PostgreSQL usa la estimación del planificador (EXPLAIN) y solo hace
+    COUNT(*) real cuando la estimación es pequeña; en otros motores cuenta.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimado = int(plan[0]['Plan']['Plan Rows'])
+    except Exception:
+        return queryset.count(), False
+
+    if estimado < umbral_exacto:
+        return queryset.count(), False
+    return estimado, True
+
+
+# ==============================================================================
+# POOL DE PROCESOS DE LAS EXPORTACIONES
+# ==============================================================================
+# Los lotes de PDFs y los paquetes ZIP generan en un ProcessPoolExecutor dentro
+# del worker de gunicorn: el tope (REPORTES_MAX_PROCESOS, por defecto
+# PROCESOS_POR_DEFECTO) evita que cada request lance un proceso por CPU.
+
+PROCESOS_POR_DEFECTO = 2
+
+
+def procesos_pool(tareas=None):
+    """Procesos del pool: el tope configurado, sin pasar de las CPUs ni de `tareas`"""
+    procesos = min(getattr(settings, 'REPORTES_MAX_PROCESOS', PROCESOS_POR_DEFECTO), os.cpu_count() or 1)
+    if tareas is not None:
+        procesos = min(procesos, tareas)
+    return max(procesos, 1)
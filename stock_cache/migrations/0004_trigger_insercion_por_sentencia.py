@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_cache', '0003_create_triggers'),
+    ]
+
+    operations = [
+        # 🚀 OPTIMIZACIÓN: las inserciones de detalles actualizan el stock una vez
+        # por sentencia, con un delta agregado por (producto, almacén). Un
+        # bulk_create de cientos de líneas hace un solo UPSERT por par en lugar
+        # de uno por fila. UPDATE y DELETE siguen con el trigger por fila.
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION update_stock_cache_insercion()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                INSERT INTO stock_cache_stockcache (producto_id, almacen_id, stock_bueno, stock_danado, stock_total, ultima_actualizacion)
+                SELECT producto_id, almacen_id, SUM(bueno), SUM(danado), SUM(bueno + danado), NOW()
+                FROM (
+                    -- ENTRADA y TRASLADO suman en el destino
+                    SELECT n.producto_id, m.almacen_destino_id AS almacen_id,
+                           n.cantidad AS bueno, n.cantidad_danada AS danado
+                    FROM nuevos n
+                    JOIN almacenes_movimientoalmacen m ON m.id = n.movimiento_id
+                    WHERE m.tipo IN ('ENTRADA', 'TRASLADO')
+                    UNION ALL
+                    -- SALIDA y TRASLADO restan en el origen
+                    SELECT n.producto_id, m.almacen_origen_id,
+                           -n.cantidad, -n.cantidad_danada
+                    FROM nuevos n
+                    JOIN almacenes_movimientoalmacen m ON m.id = n.movimiento_id
+                    WHERE m.tipo IN ('SALIDA', 'TRASLADO')
+                ) deltas
+                WHERE almacen_id IS NOT NULL
+                GROUP BY producto_id, almacen_id
+                ON CONFLICT (producto_id, almacen_id)
+                DO UPDATE SET
+                    stock_bueno = stock_cache_stockcache.stock_bueno + EXCLUDED.stock_bueno,
+                    stock_danado = stock_cache_stockcache.stock_danado + EXCLUDED.stock_danado,
+                    stock_total = stock_cache_stockcache.stock_total + EXCLUDED.stock_total,
+                    ultima_actualizacion = NOW();
+
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            reverse_sql="DROP FUNCTION IF EXISTS update_stock_cache_insercion();"
+        ),
+
+        migrations.RunSQL(
+            """
+            DROP TRIGGER IF EXISTS stock_cache_insert_trigger ON almacenes_detallemovimientoalmacen;
+            CREATE TRIGGER stock_cache_insert_trigger
+                AFTER INSERT ON almacenes_detallemovimientoalmacen
+                REFERENCING NEW TABLE AS nuevos
+                FOR EACH STATEMENT EXECUTE FUNCTION update_stock_cache_insercion();
+            """,
+            reverse_sql="""
+            DROP TRIGGER IF EXISTS stock_cache_insert_trigger ON almacenes_detallemovimientoalmacen;
+            CREATE TRIGGER stock_cache_insert_trigger
+                AFTER INSERT ON almacenes_detallemovimientoalmacen
+                FOR EACH ROW EXECUTE FUNCTION update_stock_cache();
+            """
+        ),
+    ]